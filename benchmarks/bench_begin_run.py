@@ -0,0 +1,133 @@
+"""Benchmark the database work stream_chat does before its first SSE event.
+
+"before" replays the original sequence: load the session with all messages
+and metrics, scan for a user message, then update title, add the message,
+set RUNNING and compute max(run_number) + 1, each in its own transaction.
+"after" is the single SessionDatabase.begin_run call.
+
+Usage:
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_begin_run --messages 500
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import selectinload
+
+from src.session.database import SessionDatabase, dispose_engines, make_session_title
+from src.session.models import (
+    AgentRunMetrics,
+    Message,
+    MessageRole,
+    Session,
+    SessionStatus,
+)
+
+
+async def _seed(db: SessionDatabase, messages: int, runs: int) -> str:
+    session = await db.create_session("bench")
+    now = datetime.now()
+    async with db.async_session() as s:
+        await s.execute(
+            insert(Message),
+            [
+                {
+                    "session_id": session.id,
+                    "role": MessageRole.USER if i % 2 == 0 else MessageRole.AGENT,
+                    "content": "x" * 400,
+                    "timestamp": now,
+                }
+                for i in range(messages)
+            ],
+        )
+        await s.execute(
+            insert(AgentRunMetrics),
+            [
+                {
+                    "session_id": session.id,
+                    "run_number": run,
+                    "step_number": step,
+                    "step_type": "ActionStep",
+                    "input_tokens": 100,
+                    "output_tokens": 50,
+                    "total_tokens": 150,
+                    "created_at": now,
+                }
+                for run in range(1, runs + 1)
+                for step in range(1, 9)
+            ],
+        )
+        await s.commit()
+    return session.id
+
+
+async def _before(db: SessionDatabase, session_id: str, query: str) -> int:
+    async with db.async_session() as s:
+        result = await s.execute(
+            select(Session)
+            .where(Session.id == session_id)
+            .options(selectinload(Session.messages), selectinload(Session.metrics))
+        )
+        session = result.scalar_one()
+        has_user_message = any(m.role == MessageRole.USER for m in session.messages)
+    if not has_user_message:
+        await db.update_session_title(session_id, make_session_title(query))
+    await db.add_message(session_id, MessageRole.USER, query)
+    await db.update_session_status(session_id, SessionStatus.RUNNING)
+    async with db.async_session() as s:
+        result = await s.execute(
+            select(func.max(AgentRunMetrics.run_number)).where(
+                AgentRunMetrics.session_id == session_id
+            )
+        )
+        return (result.scalar() or 0) + 1
+
+
+async def _after(db: SessionDatabase, session_id: str, query: str) -> int:
+    run = await db.begin_run(session_id, query)
+    return run.run_number
+
+
+async def _measure(fn, db, session_id, samples) -> list[float]:
+    latencies = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        await fn(db, session_id, "list my running ec2 instances")
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def _summary(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    return (
+        f"p50={statistics.median(ordered):.2f}ms "
+        f"p95={ordered[int(len(ordered) * 0.95) - 1]:.2f}ms"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--samples", type=int, default=100)
+    args = parser.parse_args()
+
+    db = SessionDatabase()
+    await db.init_db()
+    before_id = await _seed(db, args.messages, args.runs)
+    after_id = await _seed(db, args.messages, args.runs)
+
+    print(f"before: {_summary(await _measure(_before, db, before_id, args.samples))}")
+    print(f"after:  {_summary(await _measure(_after, db, after_id, args.samples))}")
+
+    await db.delete_session(before_id)
+    await db.delete_session(after_id)
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""Compare pickle against the memory codec on realistic CORA sessions.
+
+Builds synthetic sessions shaped like real ones (planning steps every few
+actions, boto3 describe-style JSON observations, growing prompt history) and
+reports stored size plus encode/decode time per session.
+
+Usage:
+    python -m benchmarks.bench_memory_codec --runs 10 --steps 8
+"""
+
+import argparse
+import json
+import pickle
+import random
+import time
+
+from smolagents.memory import ActionStep, PlanningStep, TaskStep, ToolCall
+from smolagents.models import ChatMessage, MessageRole
+from smolagents.monitoring import Timing, TokenUsage
+
+from src.session.memory_codec import decode_step, encode_step
+
+
+def _describe_instances(count: int) -> str:
+    return json.dumps(
+        {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {
+                            "InstanceId": f"i-{random.getrandbits(64):016x}",
+                            "InstanceType": random.choice(["t3.micro", "m5.large"]),
+                            "State": {"Code": 16, "Name": "running"},
+                            "PrivateIpAddress": f"10.0.{i % 255}.{i % 250}",
+                            "SecurityGroups": [
+                                {"GroupId": "sg-0123456789abcdef0", "GroupName": "default"}
+                            ],
+                            "Tags": [{"Key": "Name", "Value": f"worker-{i}"}],
+                        }
+                    ]
+                }
+                for i in range(count)
+            ]
+        },
+        indent=2,
+    )
+
+
+def build_session(runs: int, steps_per_run: int) -> list:
+    steps = []
+    history: list[ChatMessage] = []
+    for run in range(runs):
+        steps.append(TaskStep(task=f"Question {run}: which instances are running?"))
+        for step_number in range(1, steps_per_run + 1):
+            if step_number % 3 == 1:
+                steps.append(
+                    PlanningStep(
+                        model_input_messages=list(history),
+                        model_output_message=ChatMessage(
+                            role=MessageRole.ASSISTANT, content="1. describe\n2. summarize"
+                        ),
+                        plan="1. describe\n2. summarize",
+                        timing=Timing(start_time=0.0, end_time=1.0),
+                        token_usage=TokenUsage(input_tokens=2000, output_tokens=100),
+                    )
+                )
+            observations = _describe_instances(random.randint(20, 80))
+            output = ChatMessage(role=MessageRole.ASSISTANT, content="Thought: describe")
+            steps.append(
+                ActionStep(
+                    step_number=step_number,
+                    timing=Timing(start_time=0.0, end_time=2.0),
+                    model_input_messages=list(history),
+                    tool_calls=[ToolCall("python_interpreter", "ec2.describe_instances()", "c1")],
+                    model_output_message=output,
+                    model_output="Thought: describe",
+                    code_action="ec2.describe_instances()",
+                    observations=observations,
+                    token_usage=TokenUsage(input_tokens=3000, output_tokens=200),
+                )
+            )
+            history.append(output)
+            history.append(ChatMessage(role=MessageRole.TOOL_RESPONSE, content=observations))
+    return steps
+
+
+def _timed(fn) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--steps", type=int, default=8)
+    args = parser.parse_args()
+
+    random.seed(0)
+    steps = build_session(args.runs, args.steps)
+    print(f"Session with {len(steps)} memory steps")
+
+    pickle_encode_ms, pickled = _timed(lambda: [pickle.dumps(s) for s in steps])
+    pickle_decode_ms, _ = _timed(lambda: [pickle.loads(p) for p in pickled])
+    codec_encode_ms, encoded = _timed(lambda: [encode_step(s) for s in steps])
+    codec_decode_ms, _ = _timed(lambda: [decode_step(p) for p in encoded])
+
+    pickle_size = sum(len(p) for p in pickled)
+    codec_size = sum(len(p) for p in encoded)
+    print(f"{'format':<8}{'bytes':>14}{'encode ms':>12}{'decode ms':>12}")
+    print(f"{'pickle':<8}{pickle_size:>14,}{pickle_encode_ms:>12.1f}{pickle_decode_ms:>12.1f}")
+    print(f"{'codec':<8}{codec_size:>14,}{codec_encode_ms:>12.1f}{codec_decode_ms:>12.1f}")
+    print(f"size ratio: {codec_size / pickle_size:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Load test: many watchers following one run through the run event log.
+
+An agent thread publishes step events into a RunEventLog while N watchers
+follow it, as /sessions/{id}/events subscribers would. Reports fan-out
+latency (publish until the last watcher has the event), CPU time and
+allocated memory per watcher. ``--baseline`` runs the same load through
+one queue per watcher that encodes its own copy of every event, which is
+what fan-out costs without a shared log.
+
+Usage:
+    python -m benchmarks.bench_run_fanout --watchers 100 250 500 --events 200
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+
+from src.streaming import RunEventLog
+
+
+def _event(step_number: int, observation_bytes: int) -> dict:
+    return {
+        "type": "action",
+        "run_number": 1,
+        "step_number": step_number,
+        "model_output": "Thought: list the running instances",
+        "code_action": "ec2.describe_instances()",
+        "observations": "x" * observation_bytes,
+    }
+
+
+def _publish(publish, events: int, observation_bytes: int, interval: float, sent: dict):
+    for step_number in range(1, events + 1):
+        sent[step_number] = time.perf_counter()
+        publish(_event(step_number, observation_bytes))
+        if interval:
+            time.sleep(interval)
+
+
+async def _run_log(watchers: int, events: int, observation_bytes: int, interval: float):
+    loop = asyncio.get_running_loop()
+    log = RunEventLog("bench", 1, loop, capacity=events + 1)
+    sent: dict = {}
+    received: dict = {}
+
+    async def watch():
+        sink = 0
+        async for entry in log.follow():
+            sink += len(entry.frame)
+            received[entry.seq] = time.perf_counter()
+        return sink
+
+    tasks = [asyncio.create_task(watch()) for _ in range(watchers)]
+    await asyncio.sleep(0)
+    publisher = threading.Thread(
+        target=_publish, args=(log.append, events, observation_bytes, interval, sent)
+    )
+    publisher.start()
+    await asyncio.to_thread(publisher.join)
+    log.close()
+    await asyncio.gather(*tasks)
+    return [received[seq] - sent[seq] for seq in sent]
+
+
+async def _run_baseline(watchers: int, events: int, observation_bytes: int, interval: float):
+    loop = asyncio.get_running_loop()
+    queues = [asyncio.Queue() for _ in range(watchers)]
+    sent: dict = {}
+    received: dict = {}
+
+    def publish(event):
+        for queue in queues:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def watch(queue):
+        sink = 0
+        while True:
+            event = await queue.get()
+            if event is None:
+                return sink
+            sink += len(json.dumps(event).encode())
+            received[event["step_number"]] = time.perf_counter()
+
+    tasks = [asyncio.create_task(watch(queue)) for queue in queues]
+    await asyncio.sleep(0)
+    publisher = threading.Thread(
+        target=_publish, args=(publish, events, observation_bytes, interval, sent)
+    )
+    publisher.start()
+    await asyncio.to_thread(publisher.join)
+    for queue in queues:
+        queue.put_nowait(None)
+    await asyncio.gather(*tasks)
+    return [received[seq] - sent[seq] for seq in sent]
+
+
+def _measure(runner, watchers: int, args) -> dict:
+    tracemalloc.start()
+    cpu_start = time.process_time()
+    latencies = asyncio.run(
+        runner(watchers, args.events, args.observation_bytes, args.interval_ms / 1000)
+    )
+    cpu = time.process_time() - cpu_start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "cpu_us_per_watcher_event": cpu / (watchers * args.events) * 1e6,
+        "peak_kib_per_watcher": peak / watchers / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--watchers", type=int, nargs="+", default=[100, 250, 500])
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--observation-bytes", type=int, default=4096)
+    parser.add_argument("--interval-ms", type=float, default=1.0)
+    parser.add_argument("--baseline", action="store_true")
+    args = parser.parse_args()
+
+    runners = [("log", _run_log)]
+    if args.baseline:
+        runners.append(("per-watcher", _run_baseline))
+
+    print(
+        f"{'mode':<12} {'watchers':>8} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'cpu us/watcher/event':>21} {'peak KiB/watcher':>17}"
+    )
+    for watchers in args.watchers:
+        for name, runner in runners:
+            result = _measure(runner, watchers, args)
+            print(
+                f"{name:<12} {watchers:>8} {result['p50_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['cpu_us_per_watcher_event']:>21.2f} "
+                f"{result['peak_kib_per_watcher']:>17.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
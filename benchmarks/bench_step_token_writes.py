@@ -0,0 +1,124 @@
+"""Benchmark per-step token write latency against a populated database.
+
+Seeds ``--sessions`` sessions (each with ``--runs`` runs of ``--steps`` metric
+rows), then times ``SessionDatabase.save_step_token`` for fresh inserts and
+for upserts of existing steps.
+
+Usage:
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_step_token_writes --sessions 10000
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import delete, insert
+
+from src.session.database import SessionDatabase, dispose_engines
+from src.session.models import AgentRunMetrics, Session, SessionStatus
+
+
+def _percentiles(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    p50 = statistics.median(ordered)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    p99 = ordered[int(len(ordered) * 0.99) - 1]
+    return f"p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms"
+
+
+async def _seed(db: SessionDatabase, sessions: int, runs: int, steps: int) -> list[str]:
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    now = datetime.now()
+    async with db.async_session() as session:
+        for start in range(0, sessions, 1000):
+            chunk = session_ids[start : start + 1000]
+            await session.execute(
+                insert(Session),
+                [
+                    {
+                        "id": sid,
+                        "title": "bench",
+                        "status": SessionStatus.COMPLETED,
+                        "created_at": now,
+                        "updated_at": now,
+                        "is_active": False,
+                    }
+                    for sid in chunk
+                ],
+            )
+            await session.execute(
+                insert(AgentRunMetrics),
+                [
+                    {
+                        "session_id": sid,
+                        "run_number": run,
+                        "step_number": step,
+                        "step_type": "ActionStep",
+                        "input_tokens": 100,
+                        "output_tokens": 50,
+                        "total_tokens": 150,
+                        "created_at": now,
+                    }
+                    for sid in chunk
+                    for run in range(1, runs + 1)
+                    for step in range(1, steps + 1)
+                ],
+            )
+        await session.commit()
+    return session_ids
+
+
+async def _time_writes(
+    db: SessionDatabase,
+    session_ids: list[str],
+    run_number: int,
+    samples: int,
+    step_modulo: int | None = None,
+) -> list[float]:
+    latencies = []
+    for i in range(samples):
+        sid = random.choice(session_ids)
+        step_number = (i % step_modulo) + 1 if step_modulo else i + 1
+        started = time.perf_counter()
+        await db.save_step_token(sid, run_number, step_number, "ActionStep", 120, 60)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--samples", type=int, default=500)
+    args = parser.parse_args()
+
+    db = SessionDatabase()
+    await db.init_db()
+
+    started = time.perf_counter()
+    session_ids = await _seed(db, args.sessions, args.runs, args.steps)
+    print(
+        f"Seeded {args.sessions} sessions / "
+        f"{args.sessions * args.runs * args.steps} metric rows "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+    fresh_run = args.runs + 1
+    inserts = await _time_writes(db, session_ids, fresh_run, args.samples)
+    print(f"insert: {_percentiles(inserts)}")
+    upserts = await _time_writes(db, session_ids, 1, args.samples, args.steps)
+    print(f"upsert: {_percentiles(upserts)}")
+
+    async with db.async_session() as session:
+        await session.execute(delete(Session).where(Session.id.in_(session_ids)))
+        await session.commit()
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,7 @@
 import {
+  MessagesPage,
   Session,
+  SessionsPage,
   SessionWithMessages,
   CreateSessionResponse,
   DeleteSessionResponse,
@@ -27,10 +29,19 @@ async function fetchJSON<T>(url: string, options?: RequestInit): Promise<T> {
 }
 
 export async function getSessions(): Promise<Session[]> {
-  const result = await fetchJSON<{ sessions: Session[] }>(
-    `${API_BASE}/sessions`
-  );
-  return result.sessions;
+  // The list is paginated newest-first; follow next_cursor to the oldest
+  const sessions: Session[] = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({ limit: "200" });
+    if (cursor) params.set("cursor", cursor);
+    const page: SessionsPage = await fetchJSON<SessionsPage>(
+      `${API_BASE}/sessions?${params}`
+    );
+    sessions.push(...page.sessions);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return sessions;
 }
 
 export async function createSession(title?: string): Promise<CreateSessionResponse> {
@@ -44,7 +55,20 @@ export async function createSession(title?: string): Promise<CreateSessionRespon
 }
 
 export async function getSession(sessionId: string): Promise<SessionWithMessages> {
-  return fetchJSON<SessionWithMessages>(`${API_BASE}/sessions/${sessionId}`);
+  const result = await fetchJSON<SessionWithMessages>(
+    `${API_BASE}/sessions/${sessionId}`
+  );
+  // Only the latest messages are inlined; older pages come newest-first
+  let before = result.messages_cursor;
+  while (before != null) {
+    const params = new URLSearchParams({ limit: "200", before: String(before) });
+    const page: MessagesPage = await fetchJSON<MessagesPage>(
+      `${API_BASE}/sessions/${sessionId}/messages?${params}`
+    );
+    result.messages = [...page.messages.reverse(), ...result.messages];
+    before = page.next_before;
+  }
+  return result;
 }
 
 export async function updateSessionTitle(
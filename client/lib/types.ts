@@ -19,12 +19,23 @@ export interface TokenUsage {
   total_tokens: number;
 }
 
+export interface SessionsPage {
+  sessions: Session[];
+  next_cursor: string | null;
+}
+
 export interface SessionWithMessages {
   session: Session;
   messages: Message[];
+  messages_cursor: number | null;
   tokens: TokenUsage;
 }
 
+export interface MessagesPage {
+  messages: Message[];
+  next_before: number | null;
+}
+
 export interface SSEMessage {
   type: "message" | "planning" | "action" | "final" | "error" | "done" | "cancelled";
   role?: "user" | "agent";
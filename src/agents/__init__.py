@@ -1,4 +1,6 @@
+from .async_run import run_agent_async
 from .aws_agent import cora_agent
 from .factory import SessionAgentFactory
+from .pool import AgentPool
 
-__all__ = ["cora_agent", "SessionAgentFactory"]
+__all__ = ["cora_agent", "run_agent_async", "SessionAgentFactory", "AgentPool"]
@@ -0,0 +1,375 @@
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import anyio
+from smolagents import CodeAgent
+from smolagents.agent_types import handle_agent_output_types
+from smolagents.agents import ActionOutput, populate_template
+from smolagents.local_python_executor import fix_final_answer_code
+from smolagents.memory import (
+    ActionStep,
+    FinalAnswerStep,
+    PlanningStep,
+    SystemPromptStep,
+    TaskStep,
+    Timing,
+    ToolCall,
+)
+from smolagents.models import (
+    CODEAGENT_RESPONSE_FORMAT,
+    ChatMessage,
+    MessageRole,
+    agglomerate_stream_deltas,
+)
+from smolagents.monitoring import LogLevel, TokenUsage
+from smolagents.utils import (
+    AgentError,
+    AgentExecutionError,
+    AgentGenerationError,
+    AgentMaxStepsError,
+    AgentParsingError,
+    extract_code_from_text,
+    parse_code_blobs,
+    truncate_content,
+)
+
+# Runs blocking work off the event loop: run_sync(func, *args)
+RunSync = Callable[..., Awaitable[Any]]
+
+
+async def run_agent_async(
+    agent: CodeAgent,
+    task: str,
+    reset: bool = True,
+    max_steps: Optional[int] = None,
+    run_sync: Optional[RunSync] = None,
+) -> AsyncIterator[Any]:
+    """Run a ``CodeAgent`` on the event loop, like ``agent.run(task, stream=True)``.
+
+    Yields the same events as smolagents' stream: model output deltas,
+    planning and action steps, and a final ``FinalAnswerStep``. Model calls
+    go through the model's ``agenerate_stream`` (see ``AsyncOpenAIModel``),
+    so a run waiting on the LLM holds no thread. Only blocking work is
+    handed to ``run_sync``, one call at a time: each code cell, sending
+    state to the executor, and the step callbacks, which may upload large
+    step payloads. ``run_sync`` defaults to anyio's thread pool.
+    """
+    if run_sync is None:
+        run_sync = anyio.to_thread.run_sync
+    model = agent.model
+    if not hasattr(model, "agenerate_stream"):
+        raise TypeError(
+            f"{type(model).__name__} has no agenerate_stream; "
+            "async runs need an AsyncOpenAIModel"
+        )
+
+    max_steps = max_steps or agent.max_steps
+    agent.task = task
+    agent.interrupt_switch = False
+    agent.memory.system_prompt = SystemPromptStep(system_prompt=agent.system_prompt)
+    if reset:
+        agent.memory.reset()
+        agent.monitor.reset()
+    agent.logger.log_task(
+        content=task.strip(),
+        subtitle=f"{type(model).__name__} - {getattr(model, 'model_id', '')}",
+        level=LogLevel.INFO,
+        title=getattr(agent, "name", None),
+    )
+    agent.memory.steps.append(TaskStep(task=task))
+    if getattr(agent, "python_executor", None):
+        await run_sync(_send_state, agent)
+
+    # Mirrors MultiStepAgent._run_stream
+    agent.step_number = 1
+    returned_final_answer = False
+    final_answer = None
+    action_step = None
+    while not returned_final_answer and agent.step_number <= max_steps:
+        if agent.interrupt_switch:
+            raise AgentError("Agent interrupted.", agent.logger)
+
+        if agent.planning_interval is not None and (
+            agent.step_number == 1
+            or (agent.step_number - 1) % agent.planning_interval == 0
+        ):
+            planning_step = None
+            async for event in _planning_step(
+                agent,
+                task,
+                is_first_step=len(agent.memory.steps) == 1,
+                step=agent.step_number,
+            ):
+                yield event
+                planning_step = event
+            await run_sync(_finalize_step, agent, planning_step)
+            agent.memory.steps.append(planning_step)
+
+        action_step = ActionStep(
+            step_number=agent.step_number, timing=Timing(start_time=time.time())
+        )
+        agent.logger.log_rule(f"Step {agent.step_number}", level=LogLevel.INFO)
+        try:
+            async for event in _action_step(agent, action_step, run_sync):
+                yield event
+                if isinstance(event, ActionOutput) and event.is_final_answer:
+                    final_answer = event.output
+                    if agent.final_answer_checks:
+                        agent._validate_final_answer(final_answer)
+                    returned_final_answer = True
+                    action_step.is_final_answer = True
+        except AgentGenerationError:
+            raise
+        except AgentError as e:
+            # The model's mistake; it sees the error next step
+            action_step.error = e
+        finally:
+            await run_sync(_finalize_step, agent, action_step)
+            agent.memory.steps.append(action_step)
+        yield action_step
+        agent.step_number += 1
+
+    if not returned_final_answer and agent.step_number == max_steps + 1:
+        final_answer = await _max_steps_answer(agent, task, run_sync)
+        yield action_step
+    final_answer_step = FinalAnswerStep(handle_agent_output_types(final_answer))
+    await run_sync(_finalize_step, agent, final_answer_step)
+    yield final_answer_step
+
+
+def _send_state(agent: CodeAgent) -> None:
+    agent.python_executor.send_variables(variables=agent.state)
+    agent.python_executor.send_tools({**agent.tools, **agent.managed_agents})
+
+
+def _finalize_step(agent: CodeAgent, step: Any) -> None:
+    if not isinstance(step, FinalAnswerStep):
+        step.timing.end_time = time.time()
+    agent.step_callbacks.callback(step, agent=agent)
+
+
+async def _planning_step(
+    agent: CodeAgent, task: str, is_first_step: bool, step: int
+) -> AsyncIterator[Any]:
+    # Mirrors MultiStepAgent._generate_planning_step
+    start_time = time.time()
+    templates = agent.prompt_templates["planning"]
+    if is_first_step:
+        input_messages = [
+            ChatMessage(
+                role=MessageRole.USER,
+                content=[
+                    {
+                        "type": "text",
+                        "text": populate_template(
+                            templates["initial_plan"],
+                            variables={
+                                "task": task,
+                                "tools": agent.tools,
+                                "managed_agents": agent.managed_agents,
+                            },
+                        ),
+                    }
+                ],
+            )
+        ]
+    else:
+        # Summary mode drops the system prompt and earlier plans
+        memory_messages = agent.write_memory_to_messages(summary_mode=True)
+        pre = ChatMessage(
+            role=MessageRole.SYSTEM,
+            content=[
+                {
+                    "type": "text",
+                    "text": populate_template(
+                        templates["update_plan_pre_messages"], variables={"task": task}
+                    ),
+                }
+            ],
+        )
+        post = ChatMessage(
+            role=MessageRole.USER,
+            content=[
+                {
+                    "type": "text",
+                    "text": populate_template(
+                        templates["update_plan_post_messages"],
+                        variables={
+                            "task": task,
+                            "tools": agent.tools,
+                            "managed_agents": agent.managed_agents,
+                            "remaining_steps": agent.max_steps - step,
+                        },
+                    ),
+                }
+            ],
+        )
+        input_messages = [pre] + memory_messages + [post]
+
+    content = ""
+    input_tokens, output_tokens = 0, 0
+    async for event in agent.model.agenerate_stream(
+        input_messages, stop_sequences=["<end_plan>"]
+    ):
+        if event.content is not None:
+            content += event.content
+        if event.token_usage:
+            input_tokens = event.token_usage.input_tokens
+            output_tokens += event.token_usage.output_tokens
+        yield event
+
+    # Same wording as smolagents
+    if is_first_step:
+        plan = (
+            "Here are the facts I know and the plan of action that I will follow "
+            f"to solve the task:\n```\n{content}\n```"
+        )
+    else:
+        plan = (
+            f"I still need to solve the task I was given:\n```\n{agent.task}\n```\n\n"
+            "Here are the facts I know and my new/updated plan of action to solve "
+            f"the task:\n```\n{content}\n```"
+        )
+    yield PlanningStep(
+        model_input_messages=input_messages,
+        plan=plan,
+        model_output_message=ChatMessage(role=MessageRole.ASSISTANT, content=content),
+        token_usage=TokenUsage(input_tokens=input_tokens, output_tokens=output_tokens),
+        timing=Timing(start_time=start_time, end_time=time.time()),
+    )
+
+
+async def _action_step(
+    agent: CodeAgent, memory_step: ActionStep, run_sync: RunSync
+) -> AsyncIterator[Any]:
+    # Mirrors CodeAgent._step_stream
+    input_messages = agent.write_memory_to_messages()
+    memory_step.model_input_messages = input_messages
+    stop_sequences = ["Observation:", "Calling tools:"]
+    if agent.code_block_tags[1] not in agent.code_block_tags[0]:
+        stop_sequences.append(agent.code_block_tags[1])
+    structured = agent._use_structured_outputs_internally
+    try:
+        kwargs = {"response_format": CODEAGENT_RESPONSE_FORMAT} if structured else {}
+        deltas = []
+        async for event in agent.model.agenerate_stream(
+            input_messages, stop_sequences=stop_sequences, **kwargs
+        ):
+            deltas.append(event)
+            yield event
+        chat_message = agglomerate_stream_deltas(deltas)
+        memory_step.model_output_message = chat_message
+        output_text = chat_message.content
+        closing_tag = agent.code_block_tags[1]
+        if not structured:
+            # Nudges later calls to close the code block themselves
+            if output_text and not output_text.strip().endswith(closing_tag):
+                output_text += closing_tag
+                memory_step.model_output_message.content = output_text
+        memory_step.token_usage = chat_message.token_usage
+        memory_step.model_output = output_text
+    except Exception as e:
+        raise AgentGenerationError(
+            f"Error in generating model output:\n{e}", agent.logger
+        ) from e
+
+    try:
+        if structured:
+            code_action = json.loads(output_text)["code"]
+            code_action = (
+                extract_code_from_text(code_action, agent.code_block_tags)
+                or code_action
+            )
+        else:
+            code_action = parse_code_blobs(output_text, agent.code_block_tags)
+        code_action = fix_final_answer_code(code_action)
+        memory_step.code_action = code_action
+    except Exception as e:
+        raise AgentParsingError(
+            f"Error in code parsing:\n{e}\nMake sure to provide correct code blobs.",
+            agent.logger,
+        )
+
+    tool_call = ToolCall(
+        name="python_interpreter",
+        arguments=code_action,
+        id=f"call_{len(agent.memory.steps)}",
+    )
+    yield tool_call
+    memory_step.tool_calls = [tool_call]
+
+    agent.logger.log_code(
+        title="Executing parsed code:", content=code_action, level=LogLevel.INFO
+    )
+    try:
+        # The only time a run holds a thread
+        code_output = await run_sync(agent.python_executor, code_action)
+    except Exception as e:
+        state = getattr(agent.python_executor, "state", None)
+        if state and state.get("_print_outputs"):
+            logs = str(state["_print_outputs"])
+            memory_step.observations = "Execution logs:\n" + logs
+        raise AgentExecutionError(str(e), agent.logger)
+
+    truncated_output = truncate_content(str(code_output.output))
+    memory_step.observations = (
+        "Execution logs:\n"
+        + code_output.logs
+        + "Last output from code snippet:\n"
+        + truncated_output
+    )
+    memory_step.action_output = code_output.output
+    yield ActionOutput(
+        output=code_output.output, is_final_answer=code_output.is_final_answer
+    )
+
+
+async def _max_steps_answer(agent: CodeAgent, task: str, run_sync: RunSync) -> Any:
+    # Mirrors MultiStepAgent._handle_max_steps_reached and provide_final_answer
+    start_time = time.time()
+    messages = [
+        ChatMessage(
+            role=MessageRole.SYSTEM,
+            content=[
+                {
+                    "type": "text",
+                    "text": agent.prompt_templates["final_answer"]["pre_messages"],
+                }
+            ],
+        )
+    ]
+    messages += agent.write_memory_to_messages()[1:]
+    messages.append(
+        ChatMessage(
+            role=MessageRole.USER,
+            content=[
+                {
+                    "type": "text",
+                    "text": populate_template(
+                        agent.prompt_templates["final_answer"]["post_messages"],
+                        variables={"task": task},
+                    ),
+                }
+            ],
+        )
+    )
+    try:
+        answer = await agent.model.agenerate(messages)
+    except Exception as e:
+        answer = ChatMessage(
+            role=MessageRole.ASSISTANT,
+            content=[
+                {"type": "text", "text": f"Error in generating final LLM output: {e}"}
+            ],
+        )
+    step = ActionStep(
+        step_number=agent.step_number,
+        error=AgentMaxStepsError("Reached max steps.", agent.logger),
+        timing=Timing(start_time=start_time, end_time=time.time()),
+        token_usage=answer.token_usage,
+    )
+    step.action_output = answer.content
+    await run_sync(_finalize_step, agent, step)
+    agent.memory.steps.append(step)
+    return answer.content
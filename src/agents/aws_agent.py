@@ -1,6 +1,9 @@
 from pathlib import Path
 import os
+from typing import Optional
+
 from smolagents import CodeAgent
+from smolagents.remote_executors import RemotePythonExecutor
 from yaml import safe_load
 
 from src.config import get_config
@@ -25,7 +28,9 @@ with open(prompt_file_path) as f:
 
 
 def cora_agent(
-    use_sandbox_execution=True, aws_regions: list[str] = ["us-east-2"]
+    use_sandbox_execution=True,
+    aws_regions: list[str] = ["us-east-2"],
+    executor: Optional[RemotePythonExecutor] = None,
 ) -> CodeAgent:
     model = create_model()
 
@@ -33,7 +38,10 @@ def cora_agent(
     additional_authorized_imports = ["boto3", "botocore.exceptions"]
     instructions = f"""AWS Regions that are relevant: {", ".join(aws_regions)}."""
 
-    if config.aws_profile and not use_sandbox_execution:
+    # Sandboxes and pooled local kernels have boto3 loaded and credentials set
+    runs_in_kernel = use_sandbox_execution or executor is not None
+
+    if config.aws_profile and not runs_in_kernel:
         instructions += """Use the create_boto_client tool for creating a boto client, as boto3 library is not available to you."""
         tools.append(create_boto_client_tool())
         additional_authorized_imports.remove("boto3")
@@ -50,27 +58,20 @@ def cora_agent(
         "additional_authorized_imports": additional_authorized_imports,
     }
 
-    if use_sandbox_execution:
-        # Use a Modal executor with credentials from the environment config
-        from smolagents.remote_executors import ModalExecutor
-        from smolagents.monitoring import AgentLogger, LogLevel
-        import modal
-
-        logger = AgentLogger(level=LogLevel.INFO)
-        executor = ModalExecutor(
-            additional_imports=[],
-            logger=logger,
-            app_name="cora-smolagent-execution",
-            create_kwargs={
-                # The secret name is now strictly coming from MODAL_AWS_SECRET_NAME
-                "secrets": [modal.Secret.from_name(config.modal_aws_secret_name)],
-                "image": modal.Image.debian_slim().uv_pip_install(
-                    "boto3", "jupyter", "jupyter_kernel_gateway"
-                ),
-            },
-        )
+    if runs_in_kernel:
+        # Kernels normally come pre-started from the ExecutorPool
+        if executor is None:
+            from src.executors import create_sandbox_backend
+
+            executor = create_sandbox_backend().create()
         agent_kwargs["executor"] = executor
         agent_kwargs["tools"] = []
 
     agent = CodeAgent(**agent_kwargs)
+    if runs_in_kernel:
+        from src.executors import SubprocessExecutor
+
+        # Remote executors do not check imports; the local kernel can
+        if isinstance(executor, SubprocessExecutor):
+            executor.authorize_imports(agent.authorized_imports)
     return agent
@@ -1,42 +1,216 @@
+import asyncio
 import logging
-from typing import Callable, Optional
+import time
+import weakref
+from typing import Callable, Iterable, List, Optional
 
+import anyio
 from smolagents import CodeAgent
+from smolagents.memory import ActionStep, FinalAnswerStep, PlanningStep
 
 from src.agents.aws_agent import cora_agent
+from src.agents.pool import AgentPool
+from src.config import get_config
+from src.executors import ExecutorPool
 from src.session.manager import SessionManager
 
 logger = logging.getLogger(__name__)
 
 
+class _StepCallbackSlot:
+    """Registered on an agent once; forwards steps to the current run's callback."""
+
+    def __init__(self) -> None:
+        self.callback: Optional[Callable] = None
+
+    def __call__(self, memory_step) -> None:
+        if self.callback is not None:
+            self.callback(memory_step)
+
+
 class SessionAgentFactory:
-    """Factory for creating and managing CodeAgent instances per session."""
+    """Factory for creating and managing CodeAgent instances per session.
+
+    Agents of idle sessions stay in an ``AgentPool`` with their model client
+    and executor, so a session's next turn skips the rebuild and memory
+    restore. An agent is only rebuilt from the stored memory on a miss.
+    With an ``ExecutorPool``, a new agent leases a pre-started sandbox that
+    goes back to the pool when the agent is retired.
+    """
 
-    def __init__(self, session_manager: SessionManager) -> None:
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        pool: Optional[AgentPool] = None,
+        executor_pool: Optional[ExecutorPool] = None,
+    ) -> None:
         self._session_manager = session_manager
+        self._executor_pool = executor_pool
+        if pool is None:
+            config = get_config()
+            pool = AgentPool(
+                max_agents=config.agent_pool_max_agents,
+                idle_ttl=config.agent_pool_idle_ttl_seconds,
+                max_memory_bytes=config.agent_pool_max_memory_bytes,
+            )
+        self._pool = pool
+        self._callback_slots: "weakref.WeakKeyDictionary[CodeAgent, _StepCallbackSlot]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._cleanups: set[asyncio.Task] = set()
+        self._builds = 0
+        self._total_build_ms = 0.0
+        self._last_build_ms = 0.0
+        self._max_build_ms = 0.0
 
-    def create_fresh_agent(self, step_callback: Optional[Callable] = None) -> CodeAgent:
+    def create_fresh_agent(
+        self,
+        step_callback: Optional[Callable] = None,
+        aws_regions: Optional[List[str]] = None,
+    ) -> CodeAgent:
         """Create a new CodeAgent with empty memory and optional step callback."""
-        agent = cora_agent()
-        if step_callback:
-            from smolagents.memory import ActionStep, PlanningStep, FinalAnswerStep
-
-            agent.step_callbacks.register(PlanningStep, step_callback)
-            agent.step_callbacks.register(ActionStep, step_callback)
-            agent.step_callbacks.register(FinalAnswerStep, step_callback)
+        executor = None
+        if self._executor_pool is not None:
+            executor = self._executor_pool.lease()
+        try:
+            agent = cora_agent(
+                aws_regions=aws_regions or get_config().aws_regions, executor=executor
+            )
+        except BaseException:
+            if executor is not None:
+                self._executor_pool.release(executor)
+            raise
+        slot = _StepCallbackSlot()
+        slot.callback = step_callback
+        agent.step_callbacks.register(PlanningStep, slot)
+        agent.step_callbacks.register(ActionStep, slot)
+        agent.step_callbacks.register(FinalAnswerStep, slot)
+        self._callback_slots[agent] = slot
         return agent
 
     async def get_agent(
         self, session_id: str, step_callback: Optional[Callable] = None
     ) -> CodeAgent:
-        """Get an agent for a session, restoring its memory state if available."""
-        agent = self.create_fresh_agent(step_callback)
-        steps = await self._session_manager.load_agent_state(session_id)
+        """Get an agent for a session: its pooled agent, else one rebuilt from storage.
+
+        The agent is the caller's until it is handed back with ``save_agent``.
+        """
+        self._retire(self._pool.evict_expired())
+        pooled = self._pool.checkout(session_id)
+        if pooled is not None:
+            # Another process sharing the database may have run the session since
+            stored = await self._session_manager.get_agent_step_count(session_id)
+            if stored <= pooled.step_count:
+                self._callback_slots[pooled.agent].callback = step_callback
+                return pooled.agent
+            self._pool.mark_stale()
+            self._retire([pooled.agent])
+
+        start = time.perf_counter()
+        # Model client and executor setup block; keep them off the event loop.
+        # Stored memory is read and decoded meanwhile.
+        agent, steps = await asyncio.gather(
+            anyio.to_thread.run_sync(self.create_fresh_agent, step_callback),
+            self._session_manager.load_agent_state(session_id),
+        )
         if steps and hasattr(agent, "memory") and agent.memory:
             agent.memory.steps = steps
             logger.info(f"Restored {len(steps)} steps for session {session_id}")
+        self._record_build((time.perf_counter() - start) * 1000)
         return agent
 
+    async def create_sub_agent(
+        self, aws_regions: List[str], step_callback: Optional[Callable] = None
+    ) -> CodeAgent:
+        """Build a one-off agent for a sub-task; hand it back with ``release_agent``."""
+        return await anyio.to_thread.run_sync(
+            self.create_fresh_agent, step_callback, aws_regions
+        )
+
     def save_agent(self, agent: CodeAgent, session_id: str, run_number: int) -> None:
-        """Save an agent's memory state for a session (non-blocking)."""
+        """Save an agent's memory state for a session (non-blocking) and pool the agent."""
         self._session_manager.save_agent_state(agent, session_id, run_number)
+        slot = self._callback_slots.get(agent)
+        if slot is not None:
+            # The finished run's callback must not outlive it
+            slot.callback = None
+        self._retire(self._pool.checkin(session_id, agent))
+
+    def release_agent(self, agent: CodeAgent, recycle: bool = True) -> None:
+        """Drop an agent whose run failed; its memory no longer matches storage.
+
+        Pass ``recycle=False`` if the agent may still be executing code, so its
+        sandbox is stopped rather than reset and leased again.
+        """
+        self._retire([agent], recycle)
+
+    def interrupt_code(self, agent: CodeAgent) -> None:
+        """Interrupt the code cell the agent's sandbox is running, if any.
+
+        Call from the event loop; the interrupt is sent from a worker thread.
+        """
+        executor = getattr(agent, "python_executor", None)
+        if self._executor_pool is None or not self._executor_pool.owns(executor):
+            return
+        task = asyncio.create_task(
+            anyio.to_thread.run_sync(self._interrupt_executor, executor)
+        )
+        self._cleanups.add(task)
+        task.add_done_callback(self._cleanups.discard)
+
+    def _interrupt_executor(self, executor) -> None:
+        try:
+            self._executor_pool.interrupt(executor)
+        except Exception as e:
+            logger.warning(f"Failed to interrupt agent executor: {e}")
+
+    def discard_agent(self, session_id: str) -> None:
+        """Drop a session's pooled agent, e.g. when the session is deleted."""
+        agent = self._pool.discard(session_id)
+        if agent is not None:
+            self._retire([agent])
+
+    def _record_build(self, elapsed_ms: float) -> None:
+        self._builds += 1
+        self._total_build_ms += elapsed_ms
+        self._last_build_ms = elapsed_ms
+        self._max_build_ms = max(self._max_build_ms, elapsed_ms)
+
+    def _retire(self, agents: Iterable[CodeAgent], recycle: bool = True) -> None:
+        for agent in agents:
+            # Resetting or stopping a remote sandbox is a blocking network call
+            task = asyncio.create_task(
+                anyio.to_thread.run_sync(self._cleanup, agent, recycle)
+            )
+            self._cleanups.add(task)
+            task.add_done_callback(self._cleanups.discard)
+
+    def _cleanup(self, agent: CodeAgent, recycle: bool) -> None:
+        try:
+            executor = getattr(agent, "python_executor", None)
+            if self._executor_pool is not None and self._executor_pool.owns(executor):
+                if recycle:
+                    self._executor_pool.release(executor)
+                else:
+                    self._executor_pool.discard(executor)
+            else:
+                agent.cleanup()
+        except Exception as e:
+            logger.warning(f"Failed to clean up agent executor: {e}")
+
+    async def close(self) -> None:
+        """Release the executors of every pooled agent."""
+        self._retire(self._pool.drain())
+        if self._cleanups:
+            await asyncio.gather(*self._cleanups, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            **self._pool.stats(),
+            "builds": self._builds,
+            "last_build_ms": round(self._last_build_ms, 3),
+            "max_build_ms": round(self._max_build_ms, 3),
+            "avg_build_ms": round(self._total_build_ms / self._builds, 3)
+            if self._builds
+            else 0.0,
+        }
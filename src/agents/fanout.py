@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from smolagents import CodeAgent
+from smolagents.memory import ActionStep, PlanningStep, TaskStep
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SubAgentResult:
+    name: str
+    task: str
+    output: Any = None
+    error: Optional[str] = None
+    steps: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    duration_ms: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "agent": self.name,
+            "error": self.error,
+            "steps": self.steps,
+            "token_usage": {
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": self.input_tokens + self.output_tokens,
+            },
+            "duration_ms": round(self.duration_ms, 3),
+        }
+
+
+def region_subtasks(query: str, regions: List[str]) -> List[Tuple[str, str]]:
+    """Split a query into one (name, task) per region."""
+    return [
+        (
+            region,
+            f"{query}\n\nOnly investigate AWS region {region}. Other regions are "
+            "covered separately; report what you found in this region.",
+        )
+        for region in regions
+    ]
+
+
+def merge_task(query: str, results: List[SubAgentResult]) -> str:
+    """Task for the session's agent: answer the query from the sub-agents' findings."""
+    sections = []
+    for result in results:
+        if result.error is not None:
+            body = f"Failed: {result.error}"
+        else:
+            body = str(result.output)
+        sections.append(f"### {result.name}\n{body}")
+    findings = "\n\n".join(sections)
+    return (
+        f"{query}\n\n"
+        "Sub-agents investigated this in parallel, one per scope. Their findings:\n\n"
+        f"{findings}\n\n"
+        "Combine them into one answer to the question above. Only run code to "
+        "fill gaps or resolve contradictions between the findings."
+    )
+
+
+def restore_task(agent: CodeAgent, task: str, query: str) -> None:
+    """Store ``query`` as the task of the step that ran the merge ``task``.
+
+    The findings only inform this run; later turns replay the session's
+    memory, so they must see the user's question, not the merge prompt.
+    """
+    for step in reversed(agent.memory.steps):
+        if isinstance(step, TaskStep) and step.task == task:
+            step.task = query
+            return
+
+
+class SubAgentFanOut:
+    """Runs sub-agents on their own sub-tasks concurrently.
+
+    At most ``max_parallel`` sub-agents run at a time. ``build(name)``
+    creates a sub-agent, ``run(agent, task)`` runs it to its final answer
+    and ``release(agent, recycle)`` hands it back; ``recycle`` is False when
+    the sub-agent may still be executing code. A failed sub-agent is
+    reported in its result rather than failing the others. ``on_result``
+    is called as each sub-agent starts (without a result) and finishes.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[str], Awaitable[CodeAgent]],
+        run: Callable[[CodeAgent, str], Awaitable[Any]],
+        release: Callable[[CodeAgent, bool], None],
+        max_parallel: int = 3,
+        on_result: Optional[Callable[[str, Optional[SubAgentResult]], None]] = None,
+    ) -> None:
+        self._build = build
+        self._run = run
+        self._release = release
+        self._max_parallel = max_parallel
+        self._on_result = on_result
+
+    async def run(self, subtasks: List[Tuple[str, str]]) -> List[SubAgentResult]:
+        semaphore = asyncio.Semaphore(self._max_parallel)
+        return list(
+            await asyncio.gather(
+                *(self._run_one(semaphore, name, task) for name, task in subtasks)
+            )
+        )
+
+    async def _run_one(
+        self, semaphore: asyncio.Semaphore, name: str, task: str
+    ) -> SubAgentResult:
+        async with semaphore:
+            if self._on_result is not None:
+                self._on_result(name, None)
+            result = SubAgentResult(name=name, task=task)
+            start = time.perf_counter()
+            agent = None
+            try:
+                agent = await self._build(name)
+                result.output = await self._run(agent, task)
+            except asyncio.CancelledError:
+                if agent is not None:
+                    # Stops the sub-agent's thread at its next step
+                    agent.interrupt()
+                    self._release(agent, False)
+                raise
+            except Exception as e:
+                logger.warning(f"Sub-agent {name} failed: {e}")
+                result.error = str(e)
+            result.duration_ms = (time.perf_counter() - start) * 1000
+            if agent is not None:
+                _count_usage(agent, result)
+                self._release(agent, True)
+            if self._on_result is not None:
+                self._on_result(name, result)
+            return result
+
+
+def _count_usage(agent: CodeAgent, result: SubAgentResult) -> None:
+    for step in agent.memory.steps:
+        if not isinstance(step, (ActionStep, PlanningStep)):
+            continue
+        result.steps += 1
+        if step.token_usage is not None:
+            result.input_tokens += step.token_usage.input_tokens
+            result.output_tokens += step.token_usage.output_tokens
@@ -0,0 +1,163 @@
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+from smolagents import CodeAgent
+
+
+def estimate_step_bytes(value: Any, depth: int = 0) -> int:
+    """Rough in-memory size of a memory step: its text, bytes and images."""
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if depth >= 8:
+        return 0
+    if isinstance(value, dict):
+        return sum(estimate_step_bytes(v, depth + 1) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_step_bytes(v, depth + 1) for v in value)
+    if hasattr(value, "width") and hasattr(value, "height"):
+        # Decoded PIL image, RGBA
+        return value.width * value.height * 4
+    if hasattr(value, "__dict__"):
+        return sum(estimate_step_bytes(v, depth + 1) for v in vars(value).values())
+    return 0
+
+
+@dataclass
+class PooledAgent:
+    agent: CodeAgent
+    # Memory steps the agent held when checked in; stored steps must match
+    step_count: int
+    memory_bytes: int
+    last_used: float
+
+
+class AgentPool:
+    """Live agents of idle sessions, kept warm between turns.
+
+    An agent is checked out for the duration of a run, so two runs never
+    share one, and checked back in once its memory is saved. Entries are
+    evicted least recently used first when the pool holds more than
+    ``max_agents`` agents or more than ``max_memory_bytes`` of estimated
+    memory, and once idle for ``idle_ttl`` seconds (checked by
+    ``evict_expired``). Evicted agents are returned to the caller, which
+    must release their executors.
+    """
+
+    def __init__(
+        self,
+        max_agents: int = 32,
+        idle_ttl: float = 900.0,
+        max_memory_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        self._max_agents = max_agents
+        self._idle_ttl = idle_ttl
+        self._max_memory_bytes = max_memory_bytes
+        self._entries: OrderedDict[str, PooledAgent] = OrderedDict()
+        self._memory_bytes = 0
+        # Memory is append-only between turns; only new steps are measured
+        self._measured: "weakref.WeakKeyDictionary[CodeAgent, Tuple[int, int]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._evictions = {"lru": 0, "idle": 0, "memory": 0}
+
+    def checkout(self, session_id: str) -> Optional[PooledAgent]:
+        """Take a session's agent out of the pool, or None if it has none."""
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            self._misses += 1
+            return None
+        self._memory_bytes -= entry.memory_bytes
+        self._hits += 1
+        return entry
+
+    def checkin(self, session_id: str, agent: CodeAgent) -> List[CodeAgent]:
+        """Keep an agent for the session's next turn; returns evicted agents."""
+        evicted = []
+        if self._max_agents <= 0:
+            return [agent]
+        previous = self._entries.pop(session_id, None)
+        if previous is not None:
+            self._memory_bytes -= previous.memory_bytes
+            if previous.agent is not agent:
+                evicted.append(previous.agent)
+
+        entry = PooledAgent(
+            agent=agent,
+            step_count=len(agent.memory.steps),
+            memory_bytes=self._measure(agent),
+            last_used=time.monotonic(),
+        )
+        self._entries[session_id] = entry
+        self._memory_bytes += entry.memory_bytes
+
+        evicted.extend(self.evict_expired())
+        while len(self._entries) > self._max_agents:
+            evicted.append(self._evict_oldest("lru"))
+        while self._memory_bytes > self._max_memory_bytes and self._entries:
+            evicted.append(self._evict_oldest("memory"))
+        return evicted
+
+    def _measure(self, agent: CodeAgent) -> int:
+        steps = agent.memory.steps
+        count, size = self._measured.get(agent, (0, 0))
+        if count > len(steps):
+            count, size = 0, 0
+        size += sum(estimate_step_bytes(step) for step in steps[count:])
+        self._measured[agent] = (len(steps), size)
+        return size
+
+    def mark_stale(self) -> None:
+        """Count a checked-out agent the caller found out of date and dropped."""
+        self._hits -= 1
+        self._misses += 1
+        self._stale += 1
+
+    def _evict_oldest(self, reason: str) -> CodeAgent:
+        _, entry = self._entries.popitem(last=False)
+        self._memory_bytes -= entry.memory_bytes
+        self._evictions[reason] += 1
+        return entry.agent
+
+    def evict_expired(self) -> List[CodeAgent]:
+        evicted = []
+        now = time.monotonic()
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry.last_used < self._idle_ttl:
+                break
+            evicted.append(self._evict_oldest("idle"))
+        return evicted
+
+    def discard(self, session_id: str) -> Optional[CodeAgent]:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return None
+        self._memory_bytes -= entry.memory_bytes
+        return entry.agent
+
+    def drain(self) -> List[CodeAgent]:
+        agents = [entry.agent for entry in self._entries.values()]
+        self._entries.clear()
+        self._memory_bytes = 0
+        return agents
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._entries),
+            "max_agents": self._max_agents,
+            "memory_bytes": self._memory_bytes,
+            "max_memory_bytes": self._max_memory_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "stale": self._stale,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "evictions": dict(self._evictions),
+        }
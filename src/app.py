@@ -1,23 +1,63 @@
 import asyncio
+import functools
 import json
 import os
 from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Coroutine, Dict, Optional
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
 
 import anyio
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from sse_starlette.sse import EventSourceResponse
+from smolagents import CodeAgent
 from smolagents.memory import ActionStep, PlanningStep, FinalAnswerStep
 
+from src.artifacts import (
+    ArtifactNotFoundError,
+    ArtifactStore,
+    create_artifact_store,
+    etag_matches,
+    parse_byte_range,
+)
 from src.config import get_config
-from src.agents import SessionAgentFactory
-from src.session.database import SessionDatabase
+from src.agents import SessionAgentFactory, run_agent_async
+from src.agents.fanout import (
+    SubAgentFanOut,
+    SubAgentResult,
+    merge_task,
+    region_subtasks,
+    restore_task,
+)
+from src.executors import ExecutorPool, create_sandbox_backend
+from src.models import close_async_clients
+from src.session.database import SessionDatabase, dispose_engines
 from src.session.manager import SessionManager
+from src.runs import (
+    CancelReason,
+    RunRecord,
+    RunRegistry,
+    RunScheduler,
+    RunState,
+    RunSupervisor,
+    create_run_registry,
+    current_cancel_token,
+    set_cancel_token,
+)
 from src.session.models import MessageRole, SessionStatus
+from src.streaming import (
+    DeltaRelay,
+    EventBus,
+    OverflowPolicy,
+    RunEventRegistry,
+    StepEventChannel,
+    StepPayloadCapper,
+    StreamLatencyStats,
+    create_event_bus,
+    parse_event_id,
+)
 from src.utils.logging import setup_logging, get_logger
 from src.utils.serializers import serialize_agent_output
 
@@ -28,11 +68,23 @@ config = get_config()
 setup_logging()
 logger = get_logger(__name__)
 
+MAX_SESSIONS_PAGE_SIZE = 200
+DEFAULT_MESSAGES_PAGE_SIZE = 50
+MAX_MESSAGES_PAGE_SIZE = 200
+
 _db: Optional[SessionDatabase] = None
 _session_manager: Optional[SessionManager] = None
 _agent_factory: Optional[SessionAgentFactory] = None
-_step_queues: Dict[str, asyncio.Queue] = {}
-_active_runs: Dict[str, dict] = {}
+_executor_pool: Optional[ExecutorPool] = None
+_run_events: Optional[RunEventRegistry] = None
+_artifact_store: Optional[ArtifactStore] = None
+_payload_capper: Optional[StepPayloadCapper] = None
+_run_supervisor: Optional[RunSupervisor] = None
+_run_scheduler: Optional[RunScheduler] = None
+_run_registry: Optional[RunRegistry] = None
+_event_bus: Optional[EventBus] = None
+_step_channels: Dict[str, StepEventChannel] = {}
+_stream_latency = StreamLatencyStats()
 
 
 def get_db() -> SessionDatabase:
@@ -53,9 +105,47 @@ def get_agent_factory() -> SessionAgentFactory:
     return _agent_factory
 
 
+def get_run_events() -> RunEventRegistry:
+    if _run_events is None:
+        raise HTTPException(status_code=500, detail="Run event registry not initialized")
+    return _run_events
+
+
+def get_artifact_store() -> ArtifactStore:
+    if _artifact_store is None:
+        raise HTTPException(status_code=500, detail="Artifact store not initialized")
+    return _artifact_store
+
+
+def get_run_supervisor() -> RunSupervisor:
+    if _run_supervisor is None:
+        raise HTTPException(status_code=500, detail="Run supervisor not initialized")
+    return _run_supervisor
+
+
+def get_run_scheduler() -> RunScheduler:
+    if _run_scheduler is None:
+        raise HTTPException(status_code=500, detail="Run scheduler not initialized")
+    return _run_scheduler
+
+
+def get_run_registry() -> RunRegistry:
+    if _run_registry is None:
+        raise HTTPException(status_code=500, detail="Run registry not initialized")
+    return _run_registry
+
+
+def get_event_bus() -> EventBus:
+    if _event_bus is None:
+        raise HTTPException(status_code=500, detail="Event bus not initialized")
+    return _event_bus
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global _db, _session_manager, _agent_factory
+    global _db, _session_manager, _agent_factory, _run_events
+    global _artifact_store, _payload_capper, _run_supervisor, _executor_pool
+    global _run_scheduler, _run_registry, _event_bus
 
     # Initialize OTEL if Langfuse is configured
     if config.has_langfuse():
@@ -81,15 +171,94 @@ async def lifespan(app: FastAPI):
     _db = SessionDatabase(db_url=config.database_url)
     await _db.init_db()
 
-    # Session manager initialization
-    _session_manager = SessionManager(db_url=config.database_url)
+    # Session manager initialization (shares the pooled engine of _db)
+    _session_manager = SessionManager(db=_db)
     await _session_manager.initialize()
 
+    # Carries run events and interrupts to and from the other workers
+    _event_bus = create_event_bus(_db)
+    await _event_bus.start()
+
+    # Replay buffers for in-progress runs, stored to the database on completion
+    _run_events = RunEventRegistry(
+        _db, capacity=config.stream_replay_buffer_events, bus=_event_bus
+    )
+
+    # Images and other large outputs are served by URL instead of inlined
+    _artifact_store = create_artifact_store()
+    # Oversized step fields are streamed as previews; full text is an artifact
+    _payload_capper = StepPayloadCapper(
+        config.step_event_field_limits, _artifact_store
+    )
+
+    # Code sandboxes are started ahead of the agents that lease them
+    _executor_pool = ExecutorPool(
+        create_sandbox_backend(),
+        min_idle=config.executor_pool_min_idle,
+        max_idle=config.executor_pool_max_idle,
+        idle_ttl=config.executor_pool_idle_ttl_seconds,
+        max_age=config.executor_pool_max_age_seconds,
+    )
+    _executor_pool.start()
+
     # Agent factory initialization
-    _agent_factory = SessionAgentFactory(_session_manager)
+    _agent_factory = SessionAgentFactory(
+        _session_manager, executor_pool=_executor_pool
+    )
+
+    # Runs belong to the server, not to the request that started them
+    _run_supervisor = RunSupervisor(
+        history_size=config.run_history_size,
+        run_timeout=config.run_timeout_seconds or None,
+        step_timeout=config.step_timeout_seconds or None,
+    )
+    # Bounds concurrent agent runs; the rest wait their turn in a fair queue
+    _run_scheduler = RunScheduler(
+        max_concurrent=config.run_max_concurrent,
+        max_workers=config.run_worker_threads,
+    )
+
+    # Which worker owns each session's run, so any worker can serve its clients
+    _run_registry = create_run_registry(_db)
+    await _run_registry.start(_run_snapshots)
+    _event_bus.on_command(_handle_run_command)
     logger.info("Web UI initialized with PostgreSQL database")
     yield
     logger.info("Web UI shutting down")
+    # Cancelled runs still publish their last events and spill their logs
+    await _run_supervisor.shutdown()
+    await _run_registry.close()
+    _run_scheduler.shutdown()
+    await close_async_clients()
+    await _agent_factory.close()
+    await anyio.to_thread.run_sync(_executor_pool.close)
+    await _run_events.close()
+    await _event_bus.close()
+    await _session_manager.close()
+    await dispose_engines()
+
+
+def _run_snapshots() -> Dict[str, Any]:
+    return {
+        record.session_id: (record.run_number, record.to_dict())
+        for record in get_run_supervisor().active_records()
+    }
+
+
+def _handle_run_command(command: dict) -> None:
+    # Sent by the worker that received the request for a run this one owns
+    if command.get("op") == "cancel":
+        if get_run_supervisor().cancel(command["session_id"]):
+            logger.info(f"Interrupted run for session {command['session_id']}")
+
+
+async def _active_run_number(session_id: str) -> Optional[int]:
+    """Number of the session's run in progress on any worker, if any."""
+    record = get_run_supervisor().active(session_id)
+    if record is not None:
+        return record.run_number
+    claim = await get_run_registry().active(session_id)
+    return claim.run_number if claim is not None else None
 
 
 app = FastAPI(title="CORA Web API", lifespan=lifespan)
@@ -102,14 +271,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def create_step_callback(session_id: str, run_number: int):
+def create_step_callback(
+    session_id: str,
+    run_number: int,
+    publish: Optional[Callable[[dict], None]] = None,
+    on_step: Optional[Callable[[Any], None]] = None,
+    payload_capper: Optional[StepPayloadCapper] = None,
+    base_url: str = "/",
+):
     step_counter = {"count": 0}
-    try:
-        app_loop = asyncio.get_running_loop()
-    except RuntimeError:
-        app_loop = None
 
     def callback(memory_step: Any) -> None:
+        if on_step is not None:
+            on_step(memory_step)
         step_index = step_counter["count"]
         step_counter["count"] += 1
         step_number = step_index + 1
@@ -165,20 +339,17 @@ def create_step_callback(session_id: str, run_number: int):
                 "total_tokens": getattr(token_usage, "total_tokens", 0),
             }
 
-        # Safe queue push from thread
-        if app_loop and session_id in _step_queues:
-            app_loop.call_soon_threadsafe(
-                _step_queues[session_id].put_nowait, event_data
-            )
+        # The run publishes its own final event with the serialized output
+        if publish is not None and event_data["type"] != "final":
+            if payload_capper is not None:
+                payload_capper.cap(event_data, base_url)
+            publish(event_data)
 
-        # Safe DB save from thread
+        # Buffered write-behind; safe to call from the agent thread
         session_manager = _session_manager
-        if app_loop and session_manager:
-            asyncio.run_coroutine_threadsafe(
-                session_manager.save_step_token_from_step(
-                    session_id, run_number, step_index, memory_step
-                ),
-                app_loop,
+        if session_manager:
+            session_manager.record_step_tokens(
+                session_id, run_number, step_index, memory_step
             )
 
     return callback
@@ -194,24 +365,44 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    db = get_db()
+    session_manager = get_session_manager()
+    return JSONResponse(
+        content={
+            "db_pool": db.pool_status(),
+            "step_metrics_writer": session_manager.metrics_writer.stats(),
+            "session_cache": session_manager.cache.stats(),
+            "agent_pool": get_agent_factory().stats(),
+            "executor_pool": _executor_pool.stats() if _executor_pool else None,
+            "runs": get_run_supervisor().stats(),
+            "scheduler": get_run_scheduler().stats(),
+            "run_events": get_run_events().stats(),
+            "run_registry": get_run_registry().stats(),
+            "event_bus": get_event_bus().stats(),
+            "stream_latency": _stream_latency.stats(),
+            "step_payloads": _payload_capper.stats() if _payload_capper else None,
+            "streams": {
+                session_id: channel.stats()
+                for session_id, channel in _step_channels.items()
+            },
+        }
+    )
+
+
 @app.get("/sessions")
-async def list_sessions():
+async def list_sessions(limit: int = 50, cursor: Optional[str] = None):
     db = get_db()
-    sessions = await db.get_all_sessions()
+    limit = max(1, min(limit, MAX_SESSIONS_PAGE_SIZE))
+    try:
+        sessions, next_cursor = await db.list_sessions_page(limit, cursor)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     return JSONResponse(
         content={
-            "sessions": [
-                {
-                    "id": s.id,
-                    "title": s.title,
-                    "status": s.status.value
-                    if hasattr(s.status, "value")
-                    else s.status,
-                    "created_at": s.created_at.isoformat() if s.created_at else None,
-                    "updated_at": s.updated_at.isoformat() if s.updated_at else None,
-                }
-                for s in sessions
-            ]
+            "sessions": sessions,
+            "next_cursor": next_cursor,
         }
     )
 
@@ -244,6 +435,12 @@ async def get_session(session_id: str):
         return JSONResponse(content={"error": "Session not found"}, status_code=404)
 
     tokens = await session_manager.get_session_tokens(session_id)
+    # Only the latest page is inlined (oldest first, for rendering); older
+    # history is fetched from /sessions/{id}/messages with messages_cursor
+    messages, messages_cursor = await db.get_messages_page(
+        session_id, DEFAULT_MESSAGES_PAGE_SIZE
+    )
+    active_run = await _active_run_number(session_id)
 
     return JSONResponse(
         content={
@@ -260,252 +457,642 @@ async def get_session(session_id: str):
                 if session.updated_at
                 else None,
             },
-            "messages": [
-                {
-                    "id": m.id,
-                    "role": m.role.value if hasattr(m.role, "value") else m.role,
-                    "content": m.content,
-                    "timestamp": m.timestamp.isoformat() if m.timestamp else None,
-                }
-                for m in session.messages
-            ],
+            "messages": list(reversed(messages)),
+            "messages_cursor": messages_cursor,
             "tokens": tokens,
+            # Set while a run is in progress; attach to it via /runs/{n}/events
+            "active_run": active_run,
+        }
+    )
+
+
+@app.get("/sessions/{session_id}/messages")
+async def list_messages(
+    session_id: str,
+    limit: int = DEFAULT_MESSAGES_PAGE_SIZE,
+    before: Optional[int] = None,
+):
+    db = get_db()
+    limit = max(1, min(limit, MAX_MESSAGES_PAGE_SIZE))
+    messages, next_before = await db.get_messages_page(session_id, limit, before)
+    return JSONResponse(
+        content={
+            "messages": messages,
+            "next_before": next_before,
         }
     )
 
 
 @app.patch("/sessions/{session_id}")
 async def update_session_title(request: Request, session_id: str):
-    db = get_db()
+    session_manager = get_session_manager()
     body = await request.json()
     title = body.get("title", "New Chat")
 
-    await db.update_session_title(session_id, title)
+    await session_manager.update_session_title(session_id, title)
 
     return JSONResponse(content={"success": True})
 
 
 @app.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
-    db = get_db()
-    await db.delete_session(session_id)
+    session_manager = get_session_manager()
+    await session_manager.delete_session(session_id)
+    get_agent_factory().discard_agent(session_id)
 
     return JSONResponse(content={"success": True, "redirect_url": "/"})
 
 
 @app.post("/sessions/{session_id}/interrupt")
 async def interrupt_session(session_id: str):
-    if session_id not in _active_runs:
-        return JSONResponse(
-            content={"error": "No active run found for this session"},
-            status_code=404,
+    # The run task publishes the cancelled event to every stream
+    if get_run_supervisor().cancel(session_id):
+        logger.info(f"Interrupted run for session {session_id}")
+    else:
+        registry = get_run_registry()
+        claim = await registry.active(session_id)
+        if claim is None or claim.worker_id == registry.worker_id:
+            return JSONResponse(
+                content={"error": "No active run found for this session"},
+                status_code=404,
+            )
+        await get_event_bus().send_command(
+            claim.worker_id, {"op": "cancel", "session_id": session_id}
         )
+        logger.info(
+            f"Sent interrupt for session {session_id} to worker {claim.worker_id}"
+        )
+    return JSONResponse(content={"success": True, "message": "Agent interrupted"})
 
-    run_info = _active_runs[session_id]
-    agent = run_info.get("agent")
-    task = run_info.get("task")
-    queue = run_info.get("queue")
 
-    if agent:
-        try:
-            agent.interrupt()
-            logger.info(f"Interrupted agent for session {session_id}")
-        except Exception as e:
-            logger.warning(f"Failed to interrupt agent: {e}")
+async def _attach_response(
+    session_id: str, run_number: int, after_seq: int
+) -> Union[EventSourceResponse, JSONResponse]:
+    registry = get_run_registry()
 
-    if task and not task.done():
-        try:
-            task.cancel()
-            logger.info(f"Cancelled task for session {session_id}")
-        except Exception as e:
-            logger.warning(f"Failed to cancel task: {e}")
+    async def live_elsewhere() -> bool:
+        claim = await registry.active(session_id)
+        return (
+            claim is not None
+            and claim.worker_id != registry.worker_id
+            and claim.run_number == run_number
+        )
 
-    if queue:
-        try:
-            await queue.put({"type": "cancelled"})
-            logger.info(f"Sent cancellation signal to queue for session {session_id}")
-        except Exception as e:
-            logger.warning(f"Failed to send cancellation signal: {e}")
+    events = await get_run_events().replay(
+        session_id, run_number, after_seq, live_elsewhere
+    )
+    if events is None:
+        return JSONResponse(content={"error": "Run not found"}, status_code=404)
 
-    return JSONResponse(content={"success": True, "message": "Agent interrupted"})
+    async def event_generator():
+        # Frames are shared by every follower of the run; nothing is re-encoded
+        async for entry in events:
+            yield entry.frame
 
+    return EventSourceResponse(event_generator())
 
-@app.get("/sessions/{session_id}/stream")
-async def stream_chat(request: Request, session_id: str, query: str = ""):
+
+def _run_urls(session_id: str, run_number: int) -> dict:
+    status_url = f"/sessions/{session_id}/runs/{run_number}"
+    return {"status_url": status_url, "events_url": f"{status_url}/events"}
+
+
+async def _run_sub_agent(agent: Any, task: str) -> Any:
+    scheduler = get_run_scheduler()
+    if config.agent_run_mode == "async":
+        output = None
+        async for event in run_agent_async(
+            agent, task, run_sync=scheduler.run_in_worker
+        ):
+            if isinstance(event, FinalAnswerStep):
+                output = event.output
+        return output
+    return await scheduler.run_in_worker(agent.run, task)
+
+
+async def _fan_out_regions(
+    session_id: str,
+    run_number: int,
+    query: str,
+    regions: List[str],
+    publish: Callable[[dict], None],
+) -> str:
+    """Investigate each region with its own sub-agent; returns the merge task."""
+    agent_factory = get_agent_factory()
+    session_manager = get_session_manager()
+    cancel_token = current_cancel_token()
+    # Sub-agents in flight, so a cancelled run interrupts their code
+    interrupts: Dict[int, Callable[[], None]] = {}
+
+    def token_callback(name: str) -> Callable[[Any], None]:
+        step_counter = {"count": 0}
+
+        def callback(memory_step: Any) -> None:
+            if not isinstance(memory_step, (PlanningStep, ActionStep)):
+                return
+            if cancel_token is not None:
+                cancel_token.next_step()
+            step_index = step_counter["count"]
+            step_counter["count"] += 1
+            session_manager.record_step_tokens(
+                session_id, run_number, step_index, memory_step, agent_name=name
+            )
+
+        return callback
+
+    def on_result(name: str, result: Optional[SubAgentResult]) -> None:
+        if result is None:
+            publish({"type": "subagent", "agent": name, "state": "running"})
+            return
+        state = "failed" if result.error is not None else "completed"
+        publish({"type": "subagent", "state": state, **result.to_dict()})
+
+    async def build(name: str) -> CodeAgent:
+        agent = await agent_factory.create_sub_agent([name], token_callback(name))
+        if cancel_token is not None:
+            interrupts[id(agent)] = cancel_token.on_cancel(
+                functools.partial(agent_factory.interrupt_code, agent)
+            )
+        return agent
+
+    def release(agent: CodeAgent, recycle: bool) -> None:
+        # Its sandbox may be leased to another agent next
+        interrupts.pop(id(agent), lambda: None)()
+        agent_factory.release_agent(agent, recycle=recycle)
+
+    fan_out = SubAgentFanOut(
+        build=build,
+        run=_run_sub_agent,
+        release=release,
+        max_parallel=config.fanout_max_parallel,
+        on_result=on_result,
+    )
+    results = await fan_out.run(region_subtasks(query, regions))
+    return merge_task(query, results)
+
+
+async def _start_run(
+    session_id: str,
+    query: str,
+    base_url: str,
+    step_channel: Optional[StepEventChannel] = None,
+    queue_key: Optional[str] = None,
+    regions: Optional[List[str]] = None,
+) -> Union[RunRecord, JSONResponse]:
+    """Record a new run of the session and hand it to the run supervisor.
+
+    ``step_channel`` relays the run's events live to the client that started
+    it; every other client follows the run's event log. ``queue_key`` picks
+    the run scheduler queue the run waits in; it defaults to the session.
+    A run that names more than one of ``regions`` fans out to a sub-agent
+    per region, and the session's agent merges their findings; its memory
+    keeps ``query`` as the task.
+    """
     db = get_db()
     session_manager = get_session_manager()
     agent_factory = get_agent_factory()
-
-    if not query:
+    run_events = get_run_events()
+    supervisor = get_run_supervisor()
+    scheduler = get_run_scheduler()
+    run_registry = get_run_registry()
+
+    # Another tab must watch the run in progress rather than start a second one
+    record = supervisor.claim(session_id)
+    if record is None:
         return JSONResponse(
-            content={"error": "Query parameter is required"}, status_code=400
+            content={
+                "error": "A run is already in progress for this session",
+                "active_run": supervisor.active(session_id).run_number,
+            },
+            status_code=409,
+        )
+    # ... and so must a tab whose request landed on another worker
+    try:
+        claimed = await run_registry.claim(session_id)
+    except BaseException:
+        supervisor.release(record)
+        raise
+    if not claimed:
+        supervisor.release(record)
+        return JSONResponse(
+            content={
+                "error": "A run is already in progress for this session",
+                "active_run": await _active_run_number(session_id),
+            },
+            status_code=409,
         )
 
-    session = await db.get_session(session_id)
-    if not session:
+    # Title, user message, RUNNING status and run number in one transaction
+    try:
+        run = await session_manager.begin_run(session_id, query)
+    except BaseException:
+        supervisor.release(record)
+        await run_registry.release(session_id)
+        raise
+    if run is None:
+        supervisor.release(record)
+        await run_registry.release(session_id)
         return JSONResponse(content={"error": "Session not found"}, status_code=404)
+    run_number = run.run_number
+    record.run_number = run_number
+
+    event_log = run_events.open(session_id, run_number)
+    if step_channel is not None:
+        _step_channels[session_id] = step_channel
+
+    def publish(event: dict) -> None:
+        # Thread-safe: every event is logged for replay, then relayed live
+        logged = event_log.append(event)
+        if logged is not None and step_channel is not None:
+            stamped, data = logged
+            step_channel.publish(stamped, data)
+
+    # Model output is relayed as delta events while each step is generated
+    relay = DeltaRelay(
+        publish,
+        run_number,
+        max_delay=config.stream_delta_max_delay_ms / 1000,
+        max_chars=config.stream_delta_max_chars,
+    )
+    step_callback = create_step_callback(
+        session_id,
+        run_number,
+        publish,
+        on_step=relay.on_step,
+        payload_capper=_payload_capper,
+        base_url=base_url,
+    )
 
-    # Check if this is the first user message
-    existing_user_messages = [m for m in session.messages if m.role == MessageRole.USER]
-    if not existing_user_messages:
-        # First user message - set title (27 chars + "..." = 30 chars)
-        title = query[:27] + "..." if len(query) > 30 else query
-        await db.update_session_title(session_id, title)
+    publish(
+        {
+            "type": "message",
+            "role": "user",
+            "content": query,
+        }
+    )
 
-    await db.add_message(session_id, MessageRole.USER, query)
-    await db.update_session_status(session_id, SessionStatus.RUNNING)
+    def on_queue_position(position: int) -> None:
+        record.queue_position = position
+        publish({"type": "queued", "position": position})
 
-    run_number = await session_manager.get_next_run_number(session_id)
+    def on_step(memory_step: Any) -> None:
+        record.cancel_token.next_step()
+        step_callback(memory_step)
 
-    step_queue: asyncio.Queue = asyncio.Queue(maxsize=100)
-    _step_queues[session_id] = step_queue
+    async def execute_run(record: RunRecord):
+        # Owned by the supervisor, so the run finishes whether or not anyone watches
+        is_cancelled = False
+        # Model streams and boto3 clients in the run's threads observe it
+        set_cancel_token(record.cancel_token)
+        try:
+            # Waits here while max_concurrent runs are in progress
+            async with scheduler.slot(queue_key or session_id, on_queue_position):
+                record.mark_running()
+                task = query
+                # Opt-in per run: AWS_REGIONS alone never fans out
+                if regions and len(regions) > 1 and config.fanout_max_parallel > 0:
+                    task = await _fan_out_regions(
+                        session_id, run_number, query, regions, publish
+                    )
+                agent = await agent_factory.get_agent(session_id, on_step)
+                record.agent = agent
+                # The supervisor stops the agent loop; this stops its code cell
+                record.cancel_token.on_cancel(
+                    functools.partial(agent_factory.interrupt_code, agent)
+                )
 
-    step_callback = create_step_callback(session_id, run_number)
+                relay.planning_interval = agent.planning_interval
 
-    agent_task = None
+                async def run_agent_on_loop():
+                    try:
+                        return await relay.aconsume(
+                            run_agent_async(
+                                agent,
+                                task,
+                                reset=False,
+                                run_sync=scheduler.run_in_worker,
+                            )
+                        )
+                    finally:
+                        _stream_latency.record(relay)
 
-    async def event_generator():
-        nonlocal session, agent_task
-        agent = None
-        agent_task = None
-        response = None
-        agent_completed = False
-        agent_exception = None
-        is_cancelled = False
+                def run_agent():
+                    try:
+                        return relay.consume(
+                            agent.run(task, stream=True, reset=False)
+                        )
+                    except Exception as e:
+                        logger.exception(
+                            f"Error in agent.run for session {session_id}"
+                        )
+                        return e
+                    finally:
+                        _stream_latency.record(relay)
+
+                if config.agent_run_mode == "async":
+                    # Holds a worker thread only while a code cell executes
+                    response = await run_agent_on_loop()
+                else:
+                    # Agent runs get their own threads, not the shared anyio limiter
+                    response = await scheduler.run_in_worker(run_agent)
+            if isinstance(response, Exception):
+                raise response
+
+            # PNG encoding and the artifact upload block; keep them off the loop
+            serialized = await anyio.to_thread.run_sync(
+                functools.partial(
+                    serialize_agent_output,
+                    response,
+                    session_id,
+                    base_url,
+                    artifact_store=get_artifact_store(),
+                )
+            )
+            final_output = serialized.output
 
-        _active_runs[session_id] = {
-            "agent": None,
-            "task": None,
-            "queue": step_queue,
-        }
+            await db.add_message(session_id, MessageRole.AGENT, final_output)
 
-        yield {
-            "data": json.dumps(
+            publish(
                 {
-                    "type": "message",
-                    "role": "user",
-                    "content": query,
+                    "type": "final",
+                    "output": serialized.output,
+                    "output_type": serialized.output_type,
+                    "url": serialized.url,
+                    "mime_type": serialized.mime_type,
                 }
-            ),
-        }
+            )
 
+            await session_manager.update_session_status(
+                session_id, SessionStatus.COMPLETED
+            )
+            if task is not query:
+                restore_task(agent, task, query)
+            agent_factory.save_agent(agent, session_id, run_number)
+
+        except asyncio.CancelledError:
+            if record.agent is not None:
+                # The agent thread may still be executing code in its sandbox
+                agent_factory.release_agent(record.agent, recycle=False)
+            # Nobody is left to move the session out of RUNNING
+            if record.cancel_token.reason is CancelReason.TIMED_OUT:
+                publish({"type": "timed_out", "error": record.cancel_token.message})
+                await session_manager.update_session_status(
+                    session_id, SessionStatus.TIMED_OUT
+                )
+            else:
+                is_cancelled = True
+                publish({"type": "cancelled"})
+                await session_manager.update_session_status(
+                    session_id, SessionStatus.IDLE
+                )
+            raise
+        except Exception as e:
+            logger.exception(f"Agent error: {e}")
+            if record.agent is not None:
+                agent_factory.release_agent(record.agent)
+            publish(
+                {
+                    "type": "error",
+                    "error": str(e),
+                }
+            )
+            await session_manager.update_session_status(
+                session_id, SessionStatus.IDLE
+            )
+            raise
+
+        finally:
+            if not is_cancelled:
+                publish({"type": "done"})
+            if step_channel is not None:
+                step_channel.close()
+                if _step_channels.get(session_id) is step_channel:
+                    del _step_channels[session_id]
+            run_events.complete(event_log)
+
+    async def execute_claimed_run(record: RunRecord):
         try:
-            agent = await agent_factory.get_agent(session_id, step_callback)
-            _active_runs[session_id]["agent"] = agent
-
-            def run_agent():
-                try:
-                    return agent.run(query, reset=False)
-                except Exception as e:
-                    logger.exception(f"Error in agent.run for session {session_id}")
-                    return e
-
-            async def run_agent_async():
-                nonlocal response, agent_completed, agent_exception
-                try:
-                    # Run agent in thread pool to avoid blocking event loop
-                    response = await anyio.to_thread.run_sync(run_agent)
-                    if isinstance(response, Exception):
-                        agent_exception = response
-                except Exception as e:
-                    logger.exception(
-                        f"Exception in run_agent_async for session {session_id}"
-                    )
-                    agent_exception = e
-                finally:
-                    agent_completed = True
+            await execute_run(record)
+        finally:
+            await run_registry.release(session_id)
 
-            async def read_queue():
-                nonlocal agent_completed, is_cancelled, agent_exception
-                while not agent_completed or not step_queue.empty():
-                    # If an exception occurred, we want to stop reading and let the main loop handle it
-                    if agent_exception:
-                        break
+    supervisor.start(record, execute_claimed_run)
+    # Other workers can now attach to the run; later states follow by heartbeat
+    await run_registry.update(session_id, run_number, record.to_dict())
+    return record
 
-                    try:
-                        event_data = await asyncio.wait_for(
-                            step_queue.get(), timeout=0.2
-                        )
-                        event_type = event_data.get("type", "step")
-
-                        if event_type == "cancelled":
-                            is_cancelled = True
-                            break
-                        elif event_type in ["planning", "action"]:
-                            yield {"data": json.dumps(event_data)}
-                    except asyncio.TimeoutError:
-                        continue
-                    except Exception as e:
-                        logger.error(f"Error reading from step queue: {e}")
-                        break
 
-            agent_task = asyncio.create_task(run_agent_async())
-            _active_runs[session_id]["task"] = agent_task
+@app.post("/sessions/{session_id}/runs")
+async def create_run(request: Request, session_id: str):
+    """Start a run and return at once; its events are read from events_url."""
+    body = await request.json()
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        return JSONResponse(content={"error": "query is required"}, status_code=400)
+    regions = body.get("regions")
+    if regions is not None and (
+        not isinstance(regions, list)
+        or not all(isinstance(region, str) and region for region in regions)
+    ):
+        return JSONResponse(
+            content={"error": "regions must be a list of region names"},
+            status_code=400,
+        )
 
-            async for event in read_queue():
-                if is_cancelled:
-                    break
-                yield event
+    result = await _start_run(
+        session_id,
+        query,
+        str(request.base_url),
+        queue_key=request.headers.get("x-user-id"),
+        regions=regions,
+    )
+    if isinstance(result, JSONResponse):
+        return result
+    return JSONResponse(
+        content={
+            **result.to_dict(),
+            **_run_urls(session_id, result.run_number),
+        },
+        status_code=202,
+    )
 
-            if is_cancelled:
-                if agent_task and not agent_task.done():
-                    agent_task.cancel()
-                yield {"data": json.dumps({"type": "cancelled"})}
-            else:
-                await agent_task
 
-                if agent_exception:
-                    raise agent_exception
+@app.get("/sessions/{session_id}/runs/{run_number}")
+async def get_run(session_id: str, run_number: int):
+    record = get_run_supervisor().get(session_id, run_number)
+    if record is not None:
+        content = record.to_dict()
+        log = get_run_events().get(session_id, run_number)
+        content["events"] = log.stats() if log is not None else None
+        return JSONResponse(content={**content, **_run_urls(session_id, run_number)})
 
-                for step in agent.memory.steps:
-                    agent_factory.save_agent(agent, session_id, run_number)
+    # Runs in progress on another worker
+    claim = await get_run_registry().active(session_id)
+    if claim is not None and claim.run_number == run_number and claim.snapshot:
+        return JSONResponse(
+            content={**claim.snapshot, **_run_urls(session_id, run_number)}
+        )
 
-                serialized = serialize_agent_output(
-                    response, session_id, str(request.base_url)
-                )
-                final_output = serialized.output
-
-                await db.add_message(session_id, MessageRole.AGENT, final_output)
-
-                yield {
-                    "data": json.dumps(
-                        {
-                            "type": "final",
-                            "output": serialized.output,
-                            "output_type": serialized.output_type,
-                            "url": serialized.url,
-                            "mime_type": serialized.mime_type,
-                        }
-                    ),
-                }
+    # Runs from before a restart or beyond the supervisor's history
+    outcome = await get_db().get_run_outcome(session_id, run_number)
+    if outcome is None:
+        return JSONResponse(content={"error": "Run not found"}, status_code=404)
+    event_type, data = outcome
+    state = {
+        "final": RunState.COMPLETED,
+        "error": RunState.FAILED,
+        "cancelled": RunState.CANCELLED,
+        "timed_out": RunState.TIMED_OUT,
+    }[event_type]
+    return JSONResponse(
+        content={
+            "run_id": f"{session_id}:{run_number}",
+            "session_id": session_id,
+            "run_number": run_number,
+            "state": state.value,
+            "error": json.loads(data).get("error")
+            if event_type in ("error", "timed_out")
+            else None,
+            **_run_urls(session_id, run_number),
+        }
+    )
 
-                await db.update_session_status(session_id, SessionStatus.COMPLETED)
-                agent_factory.save_agent(agent, session_id, run_number)
 
-        except Exception as e:
-            logger.exception(f"Agent error: {e}")
-            yield {
-                "data": json.dumps(
-                    {
-                        "type": "error",
-                        "error": str(e),
-                    }
-                ),
-            }
-            await db.update_session_status(session_id, SessionStatus.IDLE)
+@app.get("/sessions/{session_id}/runs/{run_number}/events")
+async def attach_run(
+    request: Request,
+    session_id: str,
+    run_number: int,
+    last_event_id: Optional[str] = None,
+):
+    # EventSource sends Last-Event-ID on reconnect; a fresh tab passes it as a query param
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+    after_seq = 0
+    if last_event_id:
+        parsed = parse_event_id(last_event_id)
+        if parsed is None:
+            return JSONResponse(
+                content={"error": f"Invalid event id {last_event_id!r}"},
+                status_code=400,
+            )
+        if parsed[0] == run_number:
+            after_seq = parsed[1]
+    return await _attach_response(session_id, run_number, after_seq)
+
+
+@app.get("/sessions/{session_id}/events")
+async def watch_session(
+    request: Request, session_id: str, last_event_id: Optional[str] = None
+):
+    """Follow the run currently in progress, from its start or after Last-Event-ID."""
+    run_number = await _active_run_number(session_id)
+    if run_number is None:
+        return JSONResponse(
+            content={"error": "No active run found for this session"},
+            status_code=404,
+        )
+    return await attach_run(request, session_id, run_number, last_event_id)
 
-        finally:
-            if session_id in _step_queues:
-                del _step_queues[session_id]
-            if session_id in _active_runs:
-                del _active_runs[session_id]
 
-        if not is_cancelled:
-            yield {"data": json.dumps({"type": "done"})}
+@app.get("/sessions/{session_id}/stream")
+async def stream_chat(
+    request: Request, session_id: str, query: str = "", regions: str = ""
+):
+    # An EventSource reconnecting to this URL must not start the run again
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        parsed = parse_event_id(last_event_id)
+        if parsed is not None:
+            return await _attach_response(session_id, *parsed)
+
+    if not query:
+        return JSONResponse(
+            content={"error": "Query parameter is required"}, status_code=400
+        )
+
+    step_channel = StepEventChannel(
+        asyncio.get_running_loop(),
+        max_pending_bytes=config.stream_max_pending_bytes,
+        policy=OverflowPolicy(config.stream_overflow_policy),
+    )
+    result = await _start_run(
+        session_id,
+        query,
+        str(request.base_url),
+        step_channel,
+        queue_key=request.headers.get("x-user-id"),
+        # Comma-separated, e.g. regions=us-east-1,eu-west-1
+        regions=[region for region in regions.split(",") if region] or None,
+    )
+    if isinstance(result, JSONResponse):
+        return result
+
+    async def event_generator():
+        try:
+            async for event_data, data in step_channel.encoded():
+                event_type = event_data.get("type", "step")
+                if event_type in [
+                    "message",
+                    "queued",
+                    "subagent",
+                    "delta",
+                    "planning",
+                    "action",
+                    "final",
+                    "error",
+                    "timed_out",
+                ]:
+                    yield {"id": event_data["event_id"], "data": data}
+                elif event_type in ["cancelled", "done"]:
+                    yield {"id": event_data["event_id"], "data": data}
+                    break
+        finally:
+            # The run keeps going; a reconnecting client replays from the event log
+            step_channel.close()
 
     return EventSourceResponse(event_generator())
 
 
+@app.get("/artifacts/{key}")
+async def get_artifact(request: Request, key: str):
+    store = get_artifact_store()
+    info = await anyio.to_thread.run_sync(store.head_object, key)
+    if info is None:
+        return JSONResponse(content={"error": "Artifact not found"}, status_code=404)
+
+    # Content-addressed, so a URL's bytes never change
+    headers = {
+        "ETag": info.etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, info.etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == info.etag):
+        try:
+            byte_range = parse_byte_range(range_header, info.size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{info.size}"
+            return Response(status_code=416, headers=headers)
+
+    try:
+        data = await anyio.to_thread.run_sync(store.get_object, key, byte_range)
+    except ArtifactNotFoundError:
+        return JSONResponse(content={"error": "Artifact not found"}, status_code=404)
+
+    if byte_range is None:
+        return Response(content=data, media_type=info.content_type, headers=headers)
+    headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{info.size}"
+    return Response(
+        content=data, status_code=206, media_type=info.content_type, headers=headers
+    )
+
+
 @app.get("/sessions/{session_id}/tokens")
 async def get_tokens(session_id: str):
     session_manager = get_session_manager()
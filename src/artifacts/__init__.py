@@ -0,0 +1,20 @@
+from src.artifacts.http import etag_matches, parse_byte_range
+from src.artifacts.store import (
+    ArtifactInfo,
+    ArtifactNotFoundError,
+    ArtifactStore,
+    LocalArtifactStore,
+    S3ArtifactStore,
+    create_artifact_store,
+)
+
+__all__ = [
+    "ArtifactInfo",
+    "ArtifactNotFoundError",
+    "ArtifactStore",
+    "LocalArtifactStore",
+    "S3ArtifactStore",
+    "create_artifact_store",
+    "etag_matches",
+    "parse_byte_range",
+]
@@ -0,0 +1,36 @@
+from typing import Optional, Tuple
+
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single ``bytes=`` range.
+
+    Returns None for headers that should be ignored (other units, multiple
+    ranges, bad syntax) and raises ValueError if the range is unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash or not (first or last):
+        return None
+    if (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if size == 0:
+        raise ValueError("Empty artifact")
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("Range starts past the end of the artifact")
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
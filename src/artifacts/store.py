@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ArtifactNotFoundError(KeyError):
+    """Raised when an artifact key is not in the store."""
+
+
+@dataclass
+class ArtifactInfo:
+    # sha256 of the content; also the object key and the ETag
+    key: str
+    size: int
+    content_type: str
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.key}"'
+
+
+def artifact_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_artifact_key(key: str) -> bool:
+    return bool(_KEY_PATTERN.match(key))
+
+
+class ArtifactStore(ABC):
+    """Content-addressed blob store with an S3-style object interface.
+
+    Objects are keyed by the sha256 of their content, so storing the same
+    bytes twice is a no-op. Methods block on I/O; call them from a worker
+    thread rather than the event loop.
+    """
+
+    @abstractmethod
+    def head_object(self, key: str) -> Optional[ArtifactInfo]:
+        """Metadata of an object, or None if it does not exist."""
+
+    @abstractmethod
+    def put_object(self, key: str, data: bytes, content_type: str) -> None:
+        ...
+
+    @abstractmethod
+    def get_object(
+        self, key: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> bytes:
+        """Object content, or the inclusive ``(start, end)`` byte range of it."""
+
+    @abstractmethod
+    def delete_object(self, key: str) -> None:
+        ...
+
+    def put(self, data: bytes, content_type: str) -> ArtifactInfo:
+        """Store content under its hash, skipping the upload if it already exists."""
+        key = artifact_key(data)
+        info = self.head_object(key)
+        if info is None:
+            self.put_object(key, data, content_type)
+            info = ArtifactInfo(key=key, size=len(data), content_type=content_type)
+        return info
+
+
+class LocalArtifactStore(ArtifactStore):
+    """Stores artifacts as files under ``root``, fanned out by key prefix."""
+
+    def __init__(self, root: Path) -> None:
+        self._root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        if not is_artifact_key(key):
+            raise ArtifactNotFoundError(key)
+        return self._root / key[:2] / key[2:4] / key
+
+    def _meta_path(self, key: str) -> Path:
+        return self._path(key).with_suffix(".json")
+
+    def head_object(self, key: str) -> Optional[ArtifactInfo]:
+        try:
+            path = self._path(key)
+            size = path.stat().st_size
+            meta = json.loads(self._meta_path(key).read_text())
+        except (ArtifactNotFoundError, FileNotFoundError):
+            return None
+        return ArtifactInfo(key=key, size=size, content_type=meta["content_type"])
+
+    def put_object(self, key: str, data: bytes, content_type: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Metadata first, then the content via rename: a concurrent head_object
+        # never sees content without its metadata
+        meta = json.dumps({"content_type": content_type}).encode()
+        self._write_atomic(self._meta_path(key), meta)
+        self._write_atomic(path, data)
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def get_object(
+        self, key: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> bytes:
+        try:
+            with open(self._path(key), "rb") as f:
+                if byte_range is None:
+                    return f.read()
+                start, end = byte_range
+                f.seek(start)
+                return f.read(end - start + 1)
+        except FileNotFoundError:
+            raise ArtifactNotFoundError(key)
+
+    def delete_object(self, key: str) -> None:
+        for path in (self._path(key), self._meta_path(key)):
+            path.unlink(missing_ok=True)
+
+
+class S3ArtifactStore(ArtifactStore):
+    """Stores artifacts in an S3 (or S3-compatible) bucket under ``prefix``."""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "artifacts/",
+        endpoint_url: Optional[str] = None,
+        client=None,
+    ) -> None:
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self._client = client
+        self._bucket = bucket
+        self._prefix = prefix
+
+    def _object_key(self, key: str) -> str:
+        if not is_artifact_key(key):
+            raise ArtifactNotFoundError(key)
+        return f"{self._prefix}{key}"
+
+    @staticmethod
+    def _is_missing(error: Exception) -> bool:
+        code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def head_object(self, key: str) -> Optional[ArtifactInfo]:
+        try:
+            response = self._client.head_object(
+                Bucket=self._bucket, Key=self._object_key(key)
+            )
+        except ArtifactNotFoundError:
+            return None
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return ArtifactInfo(
+            key=key,
+            size=response["ContentLength"],
+            content_type=response.get("ContentType", "application/octet-stream"),
+        )
+
+    def put_object(self, key: str, data: bytes, content_type: str) -> None:
+        self._client.put_object(
+            Bucket=self._bucket,
+            Key=self._object_key(key),
+            Body=data,
+            ContentType=content_type,
+        )
+
+    def get_object(
+        self, key: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> bytes:
+        kwargs = {"Bucket": self._bucket, "Key": self._object_key(key)}
+        if byte_range is not None:
+            kwargs["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        try:
+            response = self._client.get_object(**kwargs)
+        except Exception as e:
+            if self._is_missing(e):
+                raise ArtifactNotFoundError(key)
+            raise
+        return response["Body"].read()
+
+    def delete_object(self, key: str) -> None:
+        self._client.delete_object(Bucket=self._bucket, Key=self._object_key(key))
+
+
+def create_artifact_store() -> ArtifactStore:
+    """Build the artifact store selected by ARTIFACT_STORE (``local`` or ``s3``)."""
+    from src.config import get_config
+    from src.utils.serializers import get_uploads_dir
+
+    config = get_config()
+    if config.artifact_store == "s3":
+        return S3ArtifactStore(
+            bucket=config.artifact_s3_bucket,
+            prefix=config.artifact_s3_prefix,
+            endpoint_url=config.artifact_s3_endpoint_url,
+        )
+    return LocalArtifactStore(config.artifact_dir or get_uploads_dir() / "artifacts")
@@ -1,5 +1,6 @@
 import os
-from typing import Optional
+import socket
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,6 +13,35 @@ def _get_required_env(name: str) -> str:
     return value
 
 
+def _get_int_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RuntimeError(f"Environment variable {name} must be an integer, got {value!r}")
+
+
+def _get_int_map_env(name: str, default: Dict[str, int]) -> Dict[str, int]:
+    """Parse ``key=int,key=int`` into a dict, falling back to default when unset."""
+    value = os.getenv(name)
+    if not value:
+        return dict(default)
+    result = {}
+    for item in value.split(","):
+        key, sep, number = item.partition("=")
+        try:
+            if not sep or not key.strip():
+                raise ValueError(item)
+            result[key.strip()] = int(number)
+        except ValueError:
+            raise RuntimeError(
+                f"Environment variable {name} must look like key=int,key=int, got {value!r}"
+            )
+    return result
+
+
 class Config:
     _instance: Optional["Config"] = None
 
@@ -24,6 +54,221 @@ class Config:
     def database_url(self) -> str:
         return _get_required_env("DATABASE_URL")
 
+    @property
+    def db_pool_size(self) -> int:
+        return _get_int_env("DB_POOL_SIZE", 10)
+
+    @property
+    def db_max_overflow(self) -> int:
+        return _get_int_env("DB_MAX_OVERFLOW", 20)
+
+    @property
+    def db_pool_timeout(self) -> int:
+        return _get_int_env("DB_POOL_TIMEOUT", 30)
+
+    @property
+    def db_pool_recycle(self) -> int:
+        return _get_int_env("DB_POOL_RECYCLE", 1800)
+
+    @property
+    def db_statement_cache_size(self) -> int:
+        # Keep 0 when PgBouncer (transaction pooling) sits in front of Postgres
+        return _get_int_env("DB_STATEMENT_CACHE_SIZE", 0)
+
+    @property
+    def step_metrics_batch_size(self) -> int:
+        return _get_int_env("STEP_METRICS_BATCH_SIZE", 100)
+
+    @property
+    def step_metrics_flush_interval_ms(self) -> int:
+        return _get_int_env("STEP_METRICS_FLUSH_INTERVAL_MS", 500)
+
+    @property
+    def step_metrics_max_pending(self) -> int:
+        return _get_int_env("STEP_METRICS_MAX_PENDING", 10000)
+
+    @property
+    def session_cache_max_entries(self) -> int:
+        return _get_int_env("SESSION_CACHE_MAX_ENTRIES", 256)
+
+    @property
+    def session_cache_ttl_seconds(self) -> int:
+        return _get_int_env("SESSION_CACHE_TTL_SECONDS", 30)
+
+    @property
+    def stream_max_pending_bytes(self) -> int:
+        return _get_int_env("STREAM_MAX_PENDING_BYTES", 4 * 1024 * 1024)
+
+    @property
+    def stream_replay_buffer_events(self) -> int:
+        return _get_int_env("STREAM_REPLAY_BUFFER_EVENTS", 1000)
+
+    @property
+    def agent_pool_max_agents(self) -> int:
+        return _get_int_env("AGENT_POOL_MAX_AGENTS", 32)
+
+    @property
+    def agent_pool_idle_ttl_seconds(self) -> int:
+        return _get_int_env("AGENT_POOL_IDLE_TTL_SECONDS", 900)
+
+    @property
+    def agent_pool_max_memory_bytes(self) -> int:
+        return _get_int_env("AGENT_POOL_MAX_MEMORY_BYTES", 256 * 1024 * 1024)
+
+    @property
+    def executor_backend(self) -> str:
+        value = os.getenv("EXECUTOR_BACKEND") or "modal"
+        if value not in ("modal", "local"):
+            raise RuntimeError(
+                f"Environment variable EXECUTOR_BACKEND must be modal or local, got {value!r}"
+            )
+        return value
+
+    @property
+    def executor_pool_min_idle(self) -> int:
+        return _get_int_env("EXECUTOR_POOL_MIN_IDLE", 2)
+
+    @property
+    def executor_pool_max_idle(self) -> int:
+        return _get_int_env("EXECUTOR_POOL_MAX_IDLE", 4)
+
+    @property
+    def executor_pool_idle_ttl_seconds(self) -> int:
+        return _get_int_env("EXECUTOR_POOL_IDLE_TTL_SECONDS", 300)
+
+    @property
+    def executor_pool_max_age_seconds(self) -> int:
+        return _get_int_env("EXECUTOR_POOL_MAX_AGE_SECONDS", 3600)
+
+    @property
+    def executor_cell_timeout_seconds(self) -> int:
+        return _get_int_env("EXECUTOR_CELL_TIMEOUT_SECONDS", 120)
+
+    @property
+    def executor_cell_cpu_seconds(self) -> int:
+        return _get_int_env("EXECUTOR_CELL_CPU_SECONDS", 60)
+
+    @property
+    def executor_memory_limit_mb(self) -> int:
+        return _get_int_env("EXECUTOR_MEMORY_LIMIT_MB", 2048)
+
+    @property
+    def agent_run_mode(self) -> str:
+        value = os.getenv("AGENT_RUN_MODE") or "thread"
+        if value not in ("thread", "async"):
+            raise RuntimeError(
+                f"Environment variable AGENT_RUN_MODE must be thread or async, got {value!r}"
+            )
+        return value
+
+    @property
+    def aws_regions(self) -> List[str]:
+        value = os.getenv("AWS_REGIONS") or "us-east-2"
+        return [region.strip() for region in value.split(",") if region.strip()]
+
+    @property
+    def fanout_max_parallel(self) -> int:
+        return _get_int_env("FANOUT_MAX_PARALLEL", 3)
+
+    @property
+    def run_max_concurrent(self) -> int:
+        return _get_int_env("RUN_MAX_CONCURRENT", 4)
+
+    @property
+    def run_worker_threads(self) -> int:
+        # Thread mode needs a thread per run; async mode only one per code cell.
+        # Each run's sub-agents run on the same pool, and a cancelled run keeps
+        # its thread until its code cell returns, so leave one spare per slot.
+        per_run = 1 + self.fanout_max_parallel
+        return _get_int_env(
+            "RUN_WORKER_THREADS", self.run_max_concurrent * (per_run + 1)
+        )
+
+    @property
+    def run_history_size(self) -> int:
+        return _get_int_env("RUN_HISTORY_SIZE", 256)
+
+    @property
+    def run_timeout_seconds(self) -> int:
+        return _get_int_env("RUN_TIMEOUT_SECONDS", 900)
+
+    @property
+    def step_timeout_seconds(self) -> int:
+        return _get_int_env("STEP_TIMEOUT_SECONDS", 300)
+
+    @property
+    def run_registry_backend(self) -> str:
+        value = os.getenv("RUN_REGISTRY_BACKEND") or "memory"
+        if value not in ("memory", "postgres"):
+            raise RuntimeError(
+                f"Environment variable RUN_REGISTRY_BACKEND must be memory or postgres, got {value!r}"
+            )
+        return value
+
+    @property
+    def worker_id(self) -> str:
+        return os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+    @property
+    def run_heartbeat_seconds(self) -> int:
+        return _get_int_env("RUN_HEARTBEAT_SECONDS", 5)
+
+    @property
+    def run_claim_stale_seconds(self) -> int:
+        return _get_int_env("RUN_CLAIM_STALE_SECONDS", 30)
+
+    @property
+    def stream_delta_max_delay_ms(self) -> int:
+        return _get_int_env("STREAM_DELTA_MAX_DELAY_MS", 100)
+
+    @property
+    def stream_delta_max_chars(self) -> int:
+        return _get_int_env("STREAM_DELTA_MAX_CHARS", 1024)
+
+    @property
+    def stream_overflow_policy(self) -> str:
+        value = os.getenv("STREAM_OVERFLOW_POLICY") or "coalesce"
+        if value not in ("coalesce", "drop_oldest", "block"):
+            raise RuntimeError(
+                "Environment variable STREAM_OVERFLOW_POLICY must be one of "
+                f"coalesce, drop_oldest, block; got {value!r}"
+            )
+        return value
+
+    @property
+    def step_event_field_limits(self) -> Dict[str, int]:
+        # Max characters per step event field before it is replaced by a preview
+        return _get_int_map_env(
+            "STEP_EVENT_FIELD_LIMITS",
+            {"observations": 4096, "model_output": 8192, "code_action": 8192, "plan": 8192},
+        )
+
+    @property
+    def artifact_store(self) -> str:
+        value = os.getenv("ARTIFACT_STORE") or "local"
+        if value not in ("local", "s3"):
+            raise RuntimeError(
+                f"Environment variable ARTIFACT_STORE must be local or s3, got {value!r}"
+            )
+        return value
+
+    @property
+    def artifact_dir(self) -> Optional[str]:
+        return os.getenv("ARTIFACT_DIR")
+
+    @property
+    def artifact_s3_bucket(self) -> str:
+        return _get_required_env("ARTIFACT_S3_BUCKET")
+
+    @property
+    def artifact_s3_prefix(self) -> str:
+        return os.getenv("ARTIFACT_S3_PREFIX", "artifacts/")
+
+    @property
+    def artifact_s3_endpoint_url(self) -> Optional[str]:
+        # Set for S3-compatible services such as MinIO
+        return os.getenv("ARTIFACT_S3_ENDPOINT_URL")
+
     @property
     def llm_provider_name(self) -> str:
         return _get_required_env("LLM_PROVIDER_NAME")
@@ -40,6 +285,10 @@ class Config:
     def llm_api_key(self) -> str:
         return _get_required_env("LLM_API_KEY")
 
+    @property
+    def llm_max_connections(self) -> int:
+        return _get_int_env("LLM_MAX_CONNECTIONS", 100)
+
     @property
     def modal_token_id(self) -> str:
         return _get_required_env("MODAL_TOKEN_ID")
@@ -0,0 +1,17 @@
+from src.executors.backends import (
+    LocalSubprocessBackend,
+    ModalSandboxBackend,
+    SandboxBackend,
+    SubprocessExecutor,
+    create_sandbox_backend,
+)
+from src.executors.pool import ExecutorPool
+
+__all__ = [
+    "ExecutorPool",
+    "LocalSubprocessBackend",
+    "ModalSandboxBackend",
+    "SandboxBackend",
+    "SubprocessExecutor",
+    "create_sandbox_backend",
+]
@@ -0,0 +1,440 @@
+import json
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlsplit, urlunsplit
+
+from smolagents.local_python_executor import CodeOutput
+from smolagents.monitoring import AgentLogger, LogLevel
+from smolagents.remote_executors import RemotePythonExecutor
+from smolagents.utils import MAX_LENGTH_TRUNCATE_CONTENT, AgentError
+
+KERNEL_PATH = Path(__file__).parent / "kernel.py"
+
+
+def _kernel_env() -> Dict[str, str]:
+    """Environment of a local kernel: PATH and the AWS credentials and region.
+
+    Agent code runs there, so the server's database URL, LLM key and
+    Modal tokens are left out.
+    """
+    env = {key: value for key, value in os.environ.items() if key.startswith("AWS_")}
+    env["PATH"] = os.environ.get("PATH", os.defpath)
+    # Profiles in ~/.aws still resolve without HOME
+    aws_dir = Path.home() / ".aws"
+    env.setdefault("AWS_SHARED_CREDENTIALS_FILE", str(aws_dir / "credentials"))
+    env.setdefault("AWS_CONFIG_FILE", str(aws_dir / "config"))
+    return env
+
+
+def _import_code(preimports: Sequence[str]) -> str:
+    return "\n".join(f"import {module}" for module in preimports)
+
+
+class SandboxBackend(ABC):
+    """Starts, resets and stops the code sandboxes an ``ExecutorPool`` leases out.
+
+    Methods block on sandbox I/O; call them from a worker thread.
+    """
+
+    def __init__(self, preimports: Sequence[str] = ()) -> None:
+        # Imported when a sandbox starts, so agent code finds them loaded
+        self.preimports = list(preimports)
+
+    @abstractmethod
+    def create(self) -> RemotePythonExecutor:
+        """Start a sandbox with its kernel running and the preimports loaded."""
+
+    @abstractmethod
+    def reset(self, executor: RemotePythonExecutor) -> None:
+        """Give the sandbox a fresh kernel with only the preimports loaded."""
+
+    def destroy(self, executor: RemotePythonExecutor) -> None:
+        executor.cleanup()
+
+    def interrupt(self, executor: RemotePythonExecutor) -> None:
+        """Interrupt the code the kernel is running, if the sandbox supports it."""
+
+
+class _KernelLost(Exception):
+    """The kernel stopped answering mid-request and has to be replaced."""
+
+
+class SubprocessExecutor(RemotePythonExecutor):
+    """Runs agent code in a local child-process kernel (see ``kernel.py``).
+
+    A stand-in for a remote sandbox: same executor interface and final
+    answer protocol, with the process boundary as isolation. A cell may use
+    ``cell_cpu_seconds`` of CPU time and ``cell_timeout`` seconds of wall
+    time, and the kernel ``memory_limit_mb`` of memory. A cell that outruns
+    its wall time, or kills the kernel, gets the kernel killed and replaced;
+    the tools and variables last sent are restored, the cell's other state
+    is lost. Once ``cleanup`` has run the kernel is never replaced, so a
+    cell it cuts short fails instead. Output beyond ``max_output_chars`` is
+    truncated in the kernel, so it never crosses the pipe.
+
+    The kernel gets only the environment of ``_kernel_env``. Agent code
+    runs through smolagents' restricted interpreter there, so it reaches
+    only the modules ``authorize_imports`` allows and no files. ``reset``
+    replaces the kernel with a fresh one, so nothing a lease changes
+    (modules, environment, working directory) reaches the next.
+    """
+
+    def __init__(
+        self,
+        additional_imports: list[str],
+        logger,
+        preimports: Sequence[str] = (),
+        allow_pickle: bool = False,
+        cell_timeout: Optional[float] = None,
+        cell_cpu_seconds: Optional[int] = None,
+        memory_limit_mb: Optional[int] = None,
+        max_output_chars: Optional[int] = None,
+    ) -> None:
+        super().__init__(additional_imports, logger, allow_pickle)
+        self._lock = threading.Lock()
+        # Serializes replacing the kernel with stopping it for good
+        self._lifecycle_lock = threading.Lock()
+        self._closed = False
+        self._command = [sys.executable, "-u", str(KERNEL_PATH)]
+        if memory_limit_mb:
+            self._command.append(f"--memory-limit-mb={memory_limit_mb}")
+        if max_output_chars:
+            self._command.append(f"--max-output-chars={max_output_chars}")
+        self._command += list(preimports)
+        self._cell_timeout = cell_timeout
+        self._cell_cpu_seconds = cell_cpu_seconds
+        self._tools: Optional[dict] = None
+        self._variables: Optional[dict] = None
+        self._authorized_imports: Optional[List[str]] = None
+        self._restarting = False
+        # Set while sending tool definitions and variables, not agent code
+        self._trusted = False
+        # Names of the tools being defined, while sending them
+        self._tool_names: List[str] = []
+        self.restarts = 0
+        self._process = self._start()
+        self.installed_packages = self.install_packages(additional_imports)
+
+    def _start(self) -> subprocess.Popen:
+        process = subprocess.Popen(
+            self._command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env=_kernel_env(),
+        )
+        line = process.stdout.readline()
+        if not line:
+            process.wait()
+            raise AgentError("Local kernel exited", self.logger)
+        ready = json.loads(line)
+        if ready.get("failed_imports"):
+            self.logger.log(
+                f"Kernel could not preimport {', '.join(ready['failed_imports'])}",
+                level=LogLevel.INFO,
+            )
+        return process
+
+    def _request(self, request: dict, timeout: Optional[float] = None) -> dict:
+        with self._lock:
+            try:
+                self._process.stdin.write(json.dumps(request) + "\n")
+                self._process.stdin.flush()
+            except OSError:
+                raise _KernelLost("The kernel exited")
+            if timeout is not None:
+                # One reply per request, so nothing is left in the read buffer
+                ready, _, _ = select.select([self._process.stdout], [], [], timeout)
+                if not ready:
+                    raise _KernelLost(f"Code execution timed out after {timeout:g}s")
+            line = self._process.stdout.readline()
+            if not line:
+                raise _KernelLost(
+                    f"The kernel exited with code {self._process.wait()}, "
+                    "e.g. after running out of memory or CPU time"
+                )
+            return json.loads(line)
+
+    def _replace(self) -> None:
+        with self._lifecycle_lock:
+            if self._closed:
+                raise _KernelLost("The kernel was stopped")
+            self._kill()
+            self._process = self._start()
+
+    def _restart(self) -> None:
+        self._replace()
+        self.restarts += 1
+        self._restarting = True
+        try:
+            if self._authorized_imports is not None:
+                self._authorize()
+            # Without final_answer the agent could not finish the run
+            if self._tools is not None:
+                self._send_tools(self._tools)
+            if self._variables:
+                self._send_trusted(super().send_variables, self._variables)
+        finally:
+            self._restarting = False
+
+    def _send_trusted(self, send, value: dict) -> None:
+        self._trusted = True
+        try:
+            send(value)
+        finally:
+            self._trusted = False
+
+    def _send_tools(self, tools: dict) -> None:
+        self._tool_names = list(tools)
+        try:
+            self._send_trusted(super().send_tools, tools)
+        finally:
+            self._tool_names = []
+
+    def send_tools(self, tools: dict) -> None:
+        self._send_tools(tools)
+        self._tools = tools
+
+    def send_variables(self, variables: dict) -> None:
+        self._send_trusted(super().send_variables, variables)
+        self._variables = variables
+
+    def authorize_imports(self, imports: Sequence[str]) -> None:
+        """Let agent code import only ``imports`` (``CodeAgent.authorized_imports``)."""
+        self._authorized_imports = list(imports)
+        self._authorize()
+
+    def _authorize(self) -> None:
+        try:
+            self._request({"op": "authorize", "imports": self._authorized_imports})
+        except _KernelLost as e:
+            raise AgentError(str(e), self.logger)
+
+    def run_code_raise_errors(self, code: str) -> CodeOutput:
+        request = {
+            "op": "run",
+            "code": code,
+            "cpu_seconds": self._cell_cpu_seconds,
+            "trusted": self._trusted,
+            "tools": self._tool_names,
+        }
+        try:
+            reply = self._request(request, self._cell_timeout)
+        except _KernelLost as e:
+            if self._restarting or self._closed:
+                raise AgentError(str(e), self.logger)
+            self.logger.log(f"{e}; restarting the kernel", level=LogLevel.INFO)
+            try:
+                self._restart()
+            except _KernelLost as lost:
+                raise AgentError(f"{e}; {lost}", self.logger)
+            raise AgentError(
+                f"{e}. The kernel was restarted: variables and imports from "
+                "earlier code are gone. Split long-running work into smaller steps.",
+                self.logger,
+            )
+        error = reply["error"]
+        if error is None:
+            return CodeOutput(
+                output=reply["result"], logs=reply["logs"], is_final_answer=False
+            )
+        if error["ename"] == self.FINAL_ANSWER_EXCEPTION:
+            final_answer = self._deserialize_final_answer(
+                error["evalue"], self.allow_pickle
+            )
+            return CodeOutput(
+                output=final_answer, logs=reply["logs"], is_final_answer=True
+            )
+        raise AgentError(
+            f"{reply['logs']}\n"
+            f"Executing code yielded an error:\n"
+            f"{error['ename']}\n"
+            f"{error['evalue']}\n"
+            f"{error['traceback']}",
+            self.logger,
+        )
+
+    def install_packages(self, additional_imports: list[str]):
+        if additional_imports:
+            self.logger.log(
+                f"Local kernel does not install packages: {', '.join(additional_imports)}",
+                level=LogLevel.INFO,
+            )
+        return []
+
+    def reset(self) -> None:
+        """Replace the kernel with a fresh one with only the preimports loaded."""
+        try:
+            self._replace()
+        except _KernelLost as e:
+            raise AgentError(str(e), self.logger)
+        self._tools = None
+        self._variables = None
+        self._authorized_imports = None
+
+    def interrupt(self) -> None:
+        """Raise KeyboardInterrupt in the running cell; safe from any thread."""
+        if self._process.poll() is None:
+            self._process.send_signal(signal.SIGINT)
+
+    def cleanup(self) -> None:
+        """Stop the kernel for good, including one running a cell."""
+        with self._lifecycle_lock:
+            self._closed = True
+            self._kill()
+
+    def _kill(self) -> None:
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+
+
+class LocalSubprocessBackend(SandboxBackend):
+    """Local child-process kernels, for hosts without Modal.
+
+    Agent code runs outside the server process, so a CPU-bound cell cannot
+    hold the server's GIL, under the per-cell limits of ``SubprocessExecutor``.
+    """
+
+    def __init__(
+        self,
+        preimports: Sequence[str] = (),
+        cell_timeout: Optional[float] = None,
+        cell_cpu_seconds: Optional[int] = None,
+        memory_limit_mb: Optional[int] = None,
+        max_output_chars: Optional[int] = None,
+    ) -> None:
+        super().__init__(preimports)
+        self._limits = {
+            "cell_timeout": cell_timeout,
+            "cell_cpu_seconds": cell_cpu_seconds,
+            "memory_limit_mb": memory_limit_mb,
+            "max_output_chars": max_output_chars,
+        }
+
+    def create(self) -> RemotePythonExecutor:
+        return SubprocessExecutor(
+            additional_imports=[],
+            logger=AgentLogger(level=LogLevel.INFO),
+            preimports=self.preimports,
+            **self._limits,
+        )
+
+    def reset(self, executor: RemotePythonExecutor) -> None:
+        executor.reset()
+
+    def interrupt(self, executor: RemotePythonExecutor) -> None:
+        executor.interrupt()
+
+
+class ModalSandboxBackend(SandboxBackend):
+    """Modal sandboxes running a Jupyter kernel gateway.
+
+    The image definition and app are resolved once and shared by every
+    sandbox. Sandboxes are created with a ``timeout`` past the pool's
+    ``max_age``, so the pool retires them before Modal kills them.
+    """
+
+    def __init__(
+        self,
+        secret_name: Optional[str] = None,
+        preimports: Sequence[str] = (),
+        app_name: str = "cora-smolagent-execution",
+        timeout: int = 60 * 60,
+    ) -> None:
+        super().__init__(preimports)
+        self._secret_name = secret_name
+        self._app_name = app_name
+        self._timeout = timeout
+        self._create_kwargs: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def _shared_create_kwargs(self) -> dict:
+        with self._lock:
+            if self._create_kwargs is None:
+                import modal
+
+                from src.config import get_config
+
+                # Credentials come from the secret named by MODAL_AWS_SECRET_NAME
+                secret_name = self._secret_name or get_config().modal_aws_secret_name
+                self._create_kwargs = {
+                    "app": modal.App.lookup(self._app_name, create_if_missing=True),
+                    "secrets": [modal.Secret.from_name(secret_name)],
+                    "image": modal.Image.debian_slim().uv_pip_install(
+                        "boto3", "jupyter", "jupyter_kernel_gateway"
+                    ),
+                    "timeout": self._timeout,
+                }
+            return dict(self._create_kwargs)
+
+    def create(self) -> RemotePythonExecutor:
+        from smolagents.remote_executors import ModalExecutor
+
+        executor = ModalExecutor(
+            additional_imports=[],
+            logger=AgentLogger(level=LogLevel.INFO),
+            app_name=self._app_name,
+            create_kwargs=self._shared_create_kwargs(),
+        )
+        try:
+            if self.preimports:
+                executor.run_code_raise_errors(_import_code(self.preimports))
+        except Exception:
+            executor.cleanup()
+            raise
+        return executor
+
+    def reset(self, executor: RemotePythonExecutor) -> None:
+        # A fresh kernel process; %reset would keep sys.modules, os.environ
+        # and the working directory of the last lease
+        self._kernel_action(executor, "restart", timeout=60)
+        if self.preimports:
+            executor.run_code_raise_errors(_import_code(self.preimports))
+
+    def interrupt(self, executor: RemotePythonExecutor) -> None:
+        # Only raises KeyboardInterrupt in the cell: unlike the local kernel,
+        # the Jupyter kernel does not refuse AWS requests made after it
+        self._kernel_action(executor, "interrupt")
+
+    @staticmethod
+    def _kernel_action(
+        executor: RemotePythonExecutor, action: str, timeout: float = 10
+    ) -> None:
+        import requests
+
+        # The kernel gateway's REST endpoint next to the kernel's channels socket
+        url = urlsplit(executor.ws_url)
+        path = url.path.removesuffix("/channels") + "/" + action
+        requests.post(
+            urlunsplit(("https", url.netloc, path, url.query, "")), timeout=timeout
+        ).raise_for_status()
+
+
+def create_sandbox_backend() -> SandboxBackend:
+    """Build the backend selected by EXECUTOR_BACKEND (``modal`` or ``local``)."""
+    from src.config import get_config
+
+    config = get_config()
+    preimports = ["boto3", "botocore.exceptions"]
+    if config.executor_backend == "local":
+        return LocalSubprocessBackend(
+            preimports,
+            cell_timeout=config.executor_cell_timeout_seconds or None,
+            cell_cpu_seconds=config.executor_cell_cpu_seconds or None,
+            memory_limit_mb=config.executor_memory_limit_mb or None,
+            max_output_chars=MAX_LENGTH_TRUNCATE_CONTENT,
+        )
+    return ModalSandboxBackend(
+        preimports=preimports,
+        # Margin for the lease in progress when the pool decides to retire it
+        timeout=config.executor_pool_max_age_seconds + 15 * 60,
+    )
@@ -0,0 +1,241 @@
+"""Line-protocol Python kernel, run as a child process by SubprocessExecutor.
+
+Reads one JSON request per line on stdin and writes one JSON reply per
+line. ``{"op": "run", "code": ...}`` runs agent code through smolagents'
+Python interpreter (as ``LocalPythonExecutor`` does) against a persistent
+state, and replies with its captured output, the repr of a trailing
+expression (like a notebook cell) and any error. The interpreter only
+allows the imports, modules and functions it is given: no ``open``,
+``exec`` or dunder attributes, and no modules reached through allowed ones.
+``{"op": "authorize", "imports": [...]}`` sets the allowed imports
+(smolagents' ``BASE_BUILTIN_MODULES`` until then). Code sent with
+``"trusted": true`` (tool definitions, variables) runs as plain Python;
+the names it binds become the agent's variables, except those listed in
+``"tools"``, which become the interpreter's tools. Modules named on the command line are imported
+before the kernel reports ready, and reachable as far as they are allowed.
+
+An optional ``"cpu_seconds"`` caps the CPU time of a cell, and SIGINT
+interrupts it with KeyboardInterrupt; between cells SIGINT is ignored. If
+botocore is among the preimports, AWS requests an interrupted cell makes
+afterwards, e.g. in a tool that catches the KeyboardInterrupt, are refused
+the same way. ``--memory-limit-mb`` caps the kernel's address space from
+then on, and ``--max-output-chars`` truncates each reply's output and
+result.
+
+Needs smolagents, but not the application, on its path.
+"""
+
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import signal
+import sys
+import traceback
+
+from smolagents.local_python_executor import BASE_PYTHON_TOOLS, evaluate_python_code
+from smolagents.utils import BASE_BUILTIN_MODULES
+
+try:
+    import resource
+except ImportError:  # Unix only; without it the limits are not enforced
+    resource = None
+
+
+class CPULimitExceeded(BaseException):
+    """Raised in a cell that outruns its CPU time; agent code can't swallow it."""
+
+
+def _on_sigxcpu(signum, frame):
+    raise CPULimitExceeded("Cell exceeded its CPU time limit")
+
+
+def _limit_cpu(seconds) -> None:
+    """Let the next cell use ``seconds`` of CPU time; ``None`` lifts the limit."""
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds is None:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        return
+    # RLIMIT_CPU counts the whole process, so the cell's budget starts at its usage
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + 1 + int(seconds)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+# Set when the running cell is interrupted, cleared when the next one starts
+_interrupted = False
+
+
+def _on_sigint(signum, frame):
+    global _interrupted
+    _interrupted = True
+    raise KeyboardInterrupt
+
+
+def _refuse_if_interrupted(**kwargs):
+    if _interrupted:
+        raise KeyboardInterrupt("The cell was interrupted; AWS request refused")
+
+
+def _refuse_aws_requests_when_interrupted() -> None:
+    """Hook every botocore session created from now on, retries included."""
+    handlers = sys.modules.get("botocore.handlers")
+    if handlers is not None:
+        handlers.BUILTIN_HANDLERS.append(("before-send", _refuse_if_interrupted))
+
+
+TRUSTED_CODE = "<tools>"
+
+
+class AgentSandbox:
+    """What agent code can reach: the tools, its variables and the allowed imports."""
+
+    def __init__(self) -> None:
+        self.state = {}
+        self.tools = dict(BASE_PYTHON_TOOLS)
+        self.authorized_imports = list(BASE_BUILTIN_MODULES)
+
+    def adopt(self, namespace: dict, before: dict, tools=()) -> None:
+        """Expose what trusted code bound in ``namespace`` since ``before``."""
+        for name, value in namespace.items():
+            if name.startswith("_") or before.get(name) is value:
+                continue
+            if name in tools:
+                # Static, so agent code cannot rebind them
+                self.tools[name] = value
+            else:
+                self.state[name] = value
+
+    def evaluate(self, code: str):
+        try:
+            result, _ = evaluate_python_code(
+                code,
+                static_tools=self.tools,
+                state=self.state,
+                authorized_imports=self.authorized_imports,
+                # The executor enforces its own wall-clock limit
+                timeout_seconds=None,
+            )
+        finally:
+            # Written to the redirected stdout, after any stray output
+            sys.stdout.write(str(self.state.pop("_print_outputs", "")))
+        tree = ast.parse(code)
+        if tree.body and isinstance(tree.body[-1], ast.Expr) and result is not None:
+            return repr(result)
+        return None
+
+
+def _exec_trusted(code: str, namespace: dict):
+    tree = ast.parse(code)
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, TRUSTED_CODE, "exec"), namespace)
+    if last is not None:
+        value = eval(compile(last, TRUSTED_CODE, "eval"), namespace)
+        if value is not None:
+            return repr(value)
+    return None
+
+
+def _truncate(text, max_chars: int):
+    if text is None or not max_chars or len(text) <= max_chars:
+        return text
+    half = max_chars // 2
+    return (
+        text[:half]
+        + f"\n..._This content has been truncated to stay below {max_chars} characters_...\n"
+        + text[-half:]
+    )
+
+
+def _run(execute, cpu_seconds=None) -> dict:
+    """Run ``execute()``, which returns the cell's result, under the cell limits."""
+    global _interrupted
+    output = io.StringIO()
+    _interrupted = False
+    try:
+        signal.signal(signal.SIGINT, _on_sigint)
+        _limit_cpu(cpu_seconds)
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            result = execute()
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        _limit_cpu(None)
+    except BaseException as e:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        _limit_cpu(None)
+        return {
+            "logs": output.getvalue(),
+            "result": None,
+            "error": {
+                "ename": type(e).__name__,
+                "evalue": str(e),
+                "traceback": "".join(traceback.format_exception(e)),
+            },
+        }
+    return {"logs": output.getvalue(), "result": result, "error": None}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--memory-limit-mb", type=int, default=0)
+    parser.add_argument("--max-output-chars", type=int, default=0)
+    parser.add_argument("preimports", nargs="*")
+    args = parser.parse_args()
+
+    # Replies get a private copy of stdout; stray writes to fd 1 go to stderr
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    # An interrupt meant for a cell must not stop the kernel between cells
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    namespace = {"__name__": "__main__"}
+    failed_imports = []
+    for module in args.preimports:
+        try:
+            exec(f"import {module}", namespace)
+        except Exception:
+            failed_imports.append(module)
+    _refuse_aws_requests_when_interrupted()
+    sandbox = AgentSandbox()
+    sandbox.adopt(namespace, {})
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+        if args.memory_limit_mb:
+            limit = args.memory_limit_mb * 1024 * 1024
+            _, hard = resource.getrlimit(resource.RLIMIT_AS)
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    protocol.write(json.dumps({"ready": True, "failed_imports": failed_imports}) + "\n")
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request["op"] == "authorize":
+            sandbox.authorized_imports = list(request["imports"])
+            reply = {"error": None}
+        elif request.get("trusted"):
+            before = dict(namespace)
+            reply = _run(
+                lambda: _exec_trusted(request["code"], namespace),
+                request.get("cpu_seconds"),
+            )
+            sandbox.adopt(namespace, before, request.get("tools", ()))
+        else:
+            reply = _run(
+                lambda: sandbox.evaluate(request["code"]), request.get("cpu_seconds")
+            )
+            reply["logs"] = _truncate(reply["logs"], args.max_output_chars)
+            reply["result"] = _truncate(reply["result"], args.max_output_chars)
+        protocol.write(json.dumps(reply) + "\n")
+
+
+if __name__ == "__main__":
+    main()
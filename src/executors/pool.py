@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from smolagents.remote_executors import RemotePythonExecutor
+
+from src.executors.backends import SandboxBackend
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Sandbox:
+    executor: RemotePythonExecutor
+    created_at: float
+    idle_since: float
+
+
+class ExecutorPool:
+    """Pre-started code sandboxes leased to agents.
+
+    ``min_idle`` sandboxes are kept started with their preimports loaded,
+    so a new agent gets one without a cold start; when none is idle,
+    ``lease`` starts one on the spot. A released sandbox has its kernel
+    reset and rejoins the idle set, unless ``max_idle`` are idle already or
+    it is older than ``max_age``. A maintenance thread reaps sandboxes idle
+    for ``idle_ttl`` beyond ``min_idle`` and tops the idle set back up.
+    All methods block on sandbox I/O; call them from worker threads.
+    """
+
+    def __init__(
+        self,
+        backend: SandboxBackend,
+        min_idle: int = 2,
+        max_idle: int = 4,
+        idle_ttl: float = 300.0,
+        max_age: float = 3600.0,
+        maintenance_interval: float = 10.0,
+    ) -> None:
+        self._backend = backend
+        self._min_idle = min_idle
+        self._max_idle = max(max_idle, min_idle)
+        self._idle_ttl = idle_ttl
+        self._max_age = max_age
+        self._maintenance_interval = maintenance_interval
+
+        self._lock = threading.Lock()
+        self._idle: List[_Sandbox] = []
+        self._leased: Dict[int, _Sandbox] = {}
+        self._starting = 0
+        self._closed = False
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._warm_leases = 0
+        self._cold_leases = 0
+        self._started = 0
+        self._failed_starts = 0
+        self._total_start_ms = 0.0
+        self._resets = 0
+        self._failed_resets = 0
+        self._reaped = 0
+
+    def start(self) -> None:
+        """Start the maintenance thread, which fills the idle set."""
+        self._thread = threading.Thread(
+            target=self._maintain, name="executor-pool", daemon=True
+        )
+        self._thread.start()
+
+    def lease(self) -> RemotePythonExecutor:
+        """Take an idle sandbox, or start one if none is idle."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Executor pool is closed")
+            # Most recently released first; the oldest idle ones age out
+            sandbox = self._idle.pop() if self._idle else None
+            if sandbox is not None:
+                self._warm_leases += 1
+            else:
+                self._cold_leases += 1
+        # Refill the idle set in the background
+        self._wakeup.set()
+        if sandbox is None:
+            sandbox = self._create()
+        with self._lock:
+            self._leased[id(sandbox.executor)] = sandbox
+        return sandbox.executor
+
+    def owns(self, executor: RemotePythonExecutor) -> bool:
+        with self._lock:
+            return id(executor) in self._leased
+
+    def release(self, executor: RemotePythonExecutor) -> None:
+        """Return a leased sandbox; it is reset for the next lease or stopped."""
+        with self._lock:
+            sandbox = self._leased.pop(id(executor), None)
+        if sandbox is None:
+            return
+        keep = not self._closed and time.monotonic() - sandbox.created_at < self._max_age
+        if keep:
+            try:
+                self._backend.reset(executor)
+            except Exception as e:
+                logger.warning(f"Failed to reset sandbox, stopping it: {e}")
+                keep = False
+            with self._lock:
+                if keep:
+                    self._resets += 1
+                else:
+                    self._failed_resets += 1
+        if keep:
+            with self._lock:
+                if not self._closed and len(self._idle) < self._max_idle:
+                    sandbox.idle_since = time.monotonic()
+                    self._idle.append(sandbox)
+                    return
+        self._destroy(sandbox)
+
+    def discard(self, executor: RemotePythonExecutor) -> None:
+        """Stop a leased sandbox whose kernel may still be in use."""
+        with self._lock:
+            sandbox = self._leased.pop(id(executor), None)
+        if sandbox is not None:
+            self._destroy(sandbox)
+
+    def interrupt(self, executor: RemotePythonExecutor) -> None:
+        """Interrupt the code a leased sandbox is running; it stays leased."""
+        if self.owns(executor):
+            self._backend.interrupt(executor)
+
+    def _create(self) -> _Sandbox:
+        start = time.perf_counter()
+        try:
+            executor = self._backend.create()
+        except Exception:
+            with self._lock:
+                self._failed_starts += 1
+            raise
+        with self._lock:
+            self._started += 1
+            self._total_start_ms += (time.perf_counter() - start) * 1000
+        now = time.monotonic()
+        return _Sandbox(executor=executor, created_at=now, idle_since=now)
+
+    def _destroy(self, sandbox: _Sandbox) -> None:
+        try:
+            self._backend.destroy(sandbox.executor)
+        except Exception as e:
+            logger.warning(f"Failed to stop sandbox: {e}")
+
+    def _reap(self) -> List[_Sandbox]:
+        now = time.monotonic()
+        with self._lock:
+            expired = [s for s in self._idle if now - s.created_at >= self._max_age]
+            keep = [s for s in self._idle if now - s.created_at < self._max_age]
+            # Oldest first; idle ones beyond min_idle go once idle_ttl passes
+            while len(keep) > self._min_idle and now - keep[0].idle_since >= self._idle_ttl:
+                expired.append(keep.pop(0))
+            self._idle = keep
+            self._reaped += len(expired)
+        return expired
+
+    def _maintain(self) -> None:
+        while not self._closed:
+            self._wakeup.clear()
+            for sandbox in self._reap():
+                self._destroy(sandbox)
+            while True:
+                with self._lock:
+                    if self._closed or len(self._idle) + self._starting >= self._min_idle:
+                        break
+                    self._starting += 1
+                try:
+                    sandbox = self._create()
+                except Exception as e:
+                    logger.warning(f"Failed to pre-start sandbox: {e}")
+                    with self._lock:
+                        self._starting -= 1
+                    break
+                with self._lock:
+                    self._starting -= 1
+                    self._idle.append(sandbox)
+            self._wakeup.wait(self._maintenance_interval)
+        # Sandboxes pre-started while the pool was closing
+        with self._lock:
+            leftovers, self._idle = self._idle, []
+        for sandbox in leftovers:
+            self._destroy(sandbox)
+
+    def close(self) -> None:
+        """Stop every idle and leased sandbox."""
+        with self._lock:
+            self._closed = True
+            sandboxes = self._idle + list(self._leased.values())
+            self._idle = []
+            self._leased.clear()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        for sandbox in sandboxes:
+            self._destroy(sandbox)
+
+    def stats(self) -> dict:
+        with self._lock:
+            leases = self._warm_leases + self._cold_leases
+            return {
+                "idle": len(self._idle),
+                "leased": len(self._leased),
+                "starting": self._starting,
+                "min_idle": self._min_idle,
+                "max_idle": self._max_idle,
+                "warm_leases": self._warm_leases,
+                "cold_leases": self._cold_leases,
+                "warm_rate": round(self._warm_leases / leases, 3) if leases else 0.0,
+                "started": self._started,
+                "failed_starts": self._failed_starts,
+                "avg_start_ms": round(self._total_start_ms / self._started, 3)
+                if self._started
+                else 0.0,
+                "resets": self._resets,
+                "failed_resets": self._failed_resets,
+                "reaped": self._reaped,
+            }
@@ -1,17 +1,23 @@
 from typing import Optional
-from smolagents import OpenAIModel
 from src.config import get_config
+from src.models.async_model import AsyncOpenAIModel, close_async_clients
 
 
-def create_model() -> OpenAIModel:
+def create_model() -> AsyncOpenAIModel:
     config = get_config()
 
     # Smolagents OpenAIModel can be used for most providers as long as they
     # provide an OpenAI-compatible interface (like OpenRouter, Anthropic proxy, etc.)
-    return OpenAIModel(
+    client_kwargs = {}
+    if config.step_timeout_seconds:
+        # A stalled request must not hold the run's thread past its step deadline
+        client_kwargs["timeout"] = float(config.step_timeout_seconds)
+    return AsyncOpenAIModel(
         model_id=config.llm_model_id,
         api_base=config.llm_api_base,
         api_key=config.llm_api_key,
+        client_kwargs=client_kwargs,
+        max_connections=config.llm_max_connections,
     )
 
 
@@ -28,4 +34,9 @@ except RuntimeError as e:
     logging.getLogger(__name__).warning(f"Failed to initialize LLM: {e}")
     openrouter_model = None
 
-__all__ = ["openrouter_model", "create_model"]
+__all__ = [
+    "openrouter_model",
+    "create_model",
+    "AsyncOpenAIModel",
+    "close_async_clients",
+]
@@ -0,0 +1,173 @@
+import asyncio
+import weakref
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from smolagents import OpenAIModel
+from smolagents.models import (
+    ChatMessage,
+    ChatMessageStreamDelta,
+    ChatMessageToolCallStreamDelta,
+    TokenUsage,
+    remove_content_after_stop_sequences,
+)
+
+from src.runs.cancellation import current_cancel_token
+
+# One pooled client per event loop and endpoint; httpx connections belong to
+# the loop that opened them
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _client_for(client_kwargs: dict, max_connections: int):
+    import httpx
+    import openai
+
+    loop = asyncio.get_running_loop()
+    clients = _clients.setdefault(loop, {})
+    key = (tuple(sorted(client_kwargs.items())), max_connections)
+    client = clients.get(key)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+        )
+        client = openai.AsyncOpenAI(**client_kwargs, http_client=http_client)
+        clients[key] = client
+    return client
+
+
+async def close_async_clients() -> None:
+    """Close the pooled clients opened on the running loop."""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
+
+
+class AsyncOpenAIModel(OpenAIModel):
+    """``OpenAIModel`` that can also be called from the event loop.
+
+    The sync methods are unchanged, except that ``generate_stream`` stops
+    at the next chunk once the calling run is cancelled. ``agenerate_stream``
+    and ``agenerate`` use an ``openai.AsyncOpenAI`` client over a connection
+    pool shared by every model with the same endpoint on the loop, so a
+    waiting model call holds a socket rather than a thread. Retries of
+    rate-limited and failed requests are left to the client's own
+    ``max_retries``.
+    """
+
+    def __init__(self, *args, max_connections: int = 100, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_connections = max_connections
+
+    def generate_stream(self, *args, **kwargs) -> Iterator[ChatMessageStreamDelta]:
+        token = current_cancel_token()
+        stream = super().generate_stream(*args, **kwargs)
+        try:
+            for delta in stream:
+                if token is not None:
+                    token.raise_if_cancelled()
+                yield delta
+        finally:
+            # Abandons the response instead of reading it to the end
+            stream.close()
+
+    @property
+    def async_client(self):
+        return _client_for(self.client_kwargs, self.max_connections)
+
+    def _async_completion_kwargs(
+        self,
+        messages: List[ChatMessage | dict],
+        stop_sequences: Optional[List[str]],
+        response_format: Optional[Dict[str, str]],
+        **kwargs,
+    ) -> dict:
+        return self._prepare_completion_kwargs(
+            messages=messages,
+            stop_sequences=stop_sequences,
+            response_format=response_format,
+            model=self.model_id,
+            custom_role_conversions=self.custom_role_conversions,
+            convert_images_to_image_urls=True,
+            **kwargs,
+        )
+
+    async def agenerate_stream(
+        self,
+        messages: List[ChatMessage | dict],
+        stop_sequences: Optional[List[str]] = None,
+        response_format: Optional[Dict[str, str]] = None,
+        **kwargs,
+    ) -> AsyncIterator[ChatMessageStreamDelta]:
+        completion_kwargs = self._async_completion_kwargs(
+            messages, stop_sequences, response_format, **kwargs
+        )
+        stream = await self.async_client.chat.completions.create(
+            **completion_kwargs,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        try:
+            async for event in stream:
+                if event.usage:
+                    yield ChatMessageStreamDelta(
+                        content="",
+                        token_usage=TokenUsage(
+                            input_tokens=event.usage.prompt_tokens,
+                            output_tokens=event.usage.completion_tokens,
+                        ),
+                    )
+                if event.choices:
+                    choice = event.choices[0]
+                    if choice.delta:
+                        yield ChatMessageStreamDelta(
+                            content=choice.delta.content,
+                            tool_calls=[
+                                ChatMessageToolCallStreamDelta(
+                                    index=delta.index,
+                                    id=delta.id,
+                                    type=delta.type,
+                                    function=delta.function,
+                                )
+                                for delta in choice.delta.tool_calls
+                            ]
+                            if choice.delta.tool_calls
+                            else None,
+                        )
+                    elif not getattr(choice, "finish_reason", None):
+                        raise ValueError(f"No content or tool calls in event: {event}")
+        finally:
+            # Returns the connection to the pool even when the run is cancelled
+            await stream.close()
+
+    async def agenerate(
+        self,
+        messages: List[ChatMessage | dict],
+        stop_sequences: Optional[List[str]] = None,
+        response_format: Optional[Dict[str, str]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        completion_kwargs = self._async_completion_kwargs(
+            messages, stop_sequences, response_format, **kwargs
+        )
+        response = await self.async_client.chat.completions.create(
+            **completion_kwargs
+        )
+        content = response.choices[0].message.content
+        if stop_sequences is not None and not self.supports_stop_parameter:
+            content = remove_content_after_stop_sequences(content, stop_sequences)
+        return ChatMessage(
+            role=response.choices[0].message.role,
+            content=content,
+            tool_calls=response.choices[0].message.tool_calls,
+            raw=response,
+            token_usage=TokenUsage(
+                input_tokens=response.usage.prompt_tokens,
+                output_tokens=response.usage.completion_tokens,
+            ),
+        )
@@ -0,0 +1,34 @@
+from src.runs.cancellation import (
+    CancelReason,
+    CancelToken,
+    RunCancelled,
+    current_cancel_token,
+    set_cancel_token,
+)
+from src.runs.registry import (
+    InMemoryRunRegistry,
+    PostgresRunRegistry,
+    RunClaim,
+    RunRegistry,
+    create_run_registry,
+)
+from src.runs.scheduler import RunScheduler, RunTicket
+from src.runs.supervisor import RunRecord, RunState, RunSupervisor
+
+__all__ = [
+    "CancelReason",
+    "CancelToken",
+    "InMemoryRunRegistry",
+    "PostgresRunRegistry",
+    "RunCancelled",
+    "RunClaim",
+    "RunRecord",
+    "RunRegistry",
+    "RunScheduler",
+    "RunState",
+    "RunSupervisor",
+    "RunTicket",
+    "create_run_registry",
+    "current_cancel_token",
+    "set_cancel_token",
+]
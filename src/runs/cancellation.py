@@ -0,0 +1,153 @@
+import contextvars
+import logging
+import threading
+import time
+from enum import Enum
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CancelReason(str, Enum):
+    INTERRUPTED = "interrupted"
+    TIMED_OUT = "timed_out"
+
+
+class RunCancelled(Exception):
+    """Raised where a cancelled run's work observes its ``CancelToken``."""
+
+    def __init__(self, reason: CancelReason, message: str) -> None:
+        super().__init__(message)
+        self.reason = reason
+
+
+class CancelToken:
+    """Cancellation state of one run, shared by the event loop and agent threads.
+
+    The run may take ``run_timeout`` seconds and each of its steps
+    ``step_timeout`` seconds (None for no limit), counted from ``start``;
+    ``next_step`` restarts the step clock. The token does not enforce the
+    deadlines itself: whoever owns the run polls ``seconds_left`` and
+    cancels it. ``cancel`` keeps the first reason and runs the callbacks
+    registered with ``on_cancel`` once, in the cancelling thread, so they
+    must not block. Work in threads observes it with ``raise_if_cancelled``.
+    """
+
+    def __init__(
+        self,
+        run_timeout: Optional[float] = None,
+        step_timeout: Optional[float] = None,
+    ) -> None:
+        self.run_timeout = run_timeout
+        self.step_timeout = step_timeout
+        self._lock = threading.Lock()
+        self._run_deadline: Optional[float] = None
+        self._step_deadline: Optional[float] = None
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[CancelReason] = None
+        self.message: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    @property
+    def has_deadline(self) -> bool:
+        return self.run_timeout is not None or self.step_timeout is not None
+
+    def start(self) -> None:
+        """Start the run and step clocks."""
+        now = time.monotonic()
+        with self._lock:
+            if self.run_timeout is not None:
+                self._run_deadline = now + self.run_timeout
+            if self.step_timeout is not None:
+                self._step_deadline = now + self.step_timeout
+
+    def next_step(self) -> None:
+        """Restart the step clock when a step finishes."""
+        if self.step_timeout is None:
+            return
+        with self._lock:
+            if self._step_deadline is not None:
+                self._step_deadline = time.monotonic() + self.step_timeout
+
+    def seconds_left(self) -> Optional[float]:
+        """Seconds until the nearest deadline; None before ``start`` or without any."""
+        with self._lock:
+            deadlines = [
+                d for d in (self._run_deadline, self._step_deadline) if d is not None
+            ]
+        if not deadlines:
+            return None
+        return min(deadlines) - time.monotonic()
+
+    def expire(self) -> bool:
+        """Cancel the run as timed out if a deadline has passed."""
+        now = time.monotonic()
+        with self._lock:
+            run_deadline, step_deadline = self._run_deadline, self._step_deadline
+        if run_deadline is not None and now >= run_deadline:
+            message = f"Run exceeded its {self.run_timeout:g}s time limit"
+        elif step_deadline is not None and now >= step_deadline:
+            message = f"Step exceeded its {self.step_timeout:g}s time limit"
+        else:
+            return False
+        return self.cancel(CancelReason.TIMED_OUT, message)
+
+    def cancel(
+        self,
+        reason: CancelReason = CancelReason.INTERRUPTED,
+        message: str = "Run was interrupted",
+    ) -> bool:
+        """Cancel the run; False if it was already cancelled."""
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            self.message = message
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancel callback failed: {e}")
+        return True
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call ``callback`` when the run is cancelled, or now if it already is.
+
+        Returns a function that unregisters the callback, for resources the
+        run gives back before it ends.
+        """
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        if self.reason is not None:
+            raise RunCancelled(self.reason, self.message)
+
+
+# Bound by the run's task and inherited by the worker threads it starts
+_current_token: "contextvars.ContextVar[Optional[CancelToken]]" = (
+    contextvars.ContextVar("cancel_token", default=None)
+)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    """The token of the run the calling code belongs to, if any."""
+    return _current_token.get()
+
+
+def set_cancel_token(token: Optional[CancelToken]) -> None:
+    """Bind ``token`` to the current context, e.g. at the start of a run's task."""
+    _current_token.set(token)
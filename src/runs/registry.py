@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Session id -> (run number, snapshot) of every run this worker owns
+SnapshotProvider = Callable[[], Dict[str, Tuple[Optional[int], dict]]]
+
+
+@dataclass
+class RunClaim:
+    session_id: str
+    worker_id: str
+    # None until the run is recorded in the database
+    run_number: Optional[int] = None
+    # The owner's last ``RunRecord.to_dict()``
+    snapshot: dict = field(default_factory=dict)
+
+
+class RunRegistry(ABC):
+    """Which worker owns each session's active run, shared by every worker.
+
+    A worker claims the session before starting a run and releases it when
+    the run ends, so two workers never run the same session at once. Other
+    workers look the claim up to report the run's state and to route
+    interrupts and event streams to its owner.
+    """
+
+    def __init__(self, worker_id: str) -> None:
+        self.worker_id = worker_id
+
+    async def start(self, snapshots: SnapshotProvider) -> None:
+        """Start publishing ``snapshots()`` of this worker's runs."""
+
+    async def close(self) -> None:
+        """Release every claim this worker still holds."""
+
+    @abstractmethod
+    async def claim(self, session_id: str) -> bool:
+        """Claim the session for a run of this worker; False if another run owns it."""
+
+    @abstractmethod
+    async def update(
+        self, session_id: str, run_number: Optional[int], snapshot: dict
+    ) -> None:
+        """Publish the run number and state of a run this worker owns. Never raises."""
+
+    @abstractmethod
+    async def release(self, session_id: str) -> None:
+        """Give up this worker's claim on the session. Never raises."""
+
+    @abstractmethod
+    async def active(self, session_id: str) -> Optional[RunClaim]:
+        """The claim on the session's active run, whichever worker owns it."""
+
+    def stats(self) -> dict:
+        return {"worker_id": self.worker_id}
+
+
+class InMemoryRunRegistry(RunRegistry):
+    """Registry for a single worker process."""
+
+    def __init__(self, worker_id: str) -> None:
+        super().__init__(worker_id)
+        self._claims: Dict[str, RunClaim] = {}
+
+    async def claim(self, session_id: str) -> bool:
+        if session_id in self._claims:
+            return False
+        self._claims[session_id] = RunClaim(session_id, self.worker_id)
+        return True
+
+    async def update(
+        self, session_id: str, run_number: Optional[int], snapshot: dict
+    ) -> None:
+        claim = self._claims.get(session_id)
+        if claim is not None:
+            claim.run_number = run_number
+            claim.snapshot = snapshot
+
+    async def release(self, session_id: str) -> None:
+        self._claims.pop(session_id, None)
+
+    async def active(self, session_id: str) -> Optional[RunClaim]:
+        return self._claims.get(session_id)
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "backend": "memory",
+            "claims": len(self._claims),
+        }
+
+
+class PostgresRunRegistry(RunRegistry):
+    """Registry in the ``active_runs`` table, shared by workers on one database.
+
+    Every ``heartbeat_interval`` seconds the worker refreshes its claims
+    with the snapshots of its runs. A claim not refreshed for
+    ``stale_after`` seconds belongs to a dead worker and is taken over by
+    the next run of its session.
+    """
+
+    def __init__(
+        self,
+        db,
+        worker_id: str,
+        heartbeat_interval: float = 5.0,
+        stale_after: float = 30.0,
+    ) -> None:
+        super().__init__(worker_id)
+        self._db = db
+        self._heartbeat_interval = heartbeat_interval
+        self._stale_after = stale_after
+        self._claimed: Set[str] = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._conflicts = 0
+        self._heartbeats = 0
+        self._failed_heartbeats = 0
+
+    async def start(self, snapshots: SnapshotProvider) -> None:
+        self._heartbeat = asyncio.create_task(self._beat(snapshots))
+
+    async def _beat(self, snapshots: SnapshotProvider) -> None:
+        while True:
+            await asyncio.sleep(self._heartbeat_interval)
+            runs = snapshots()
+            # Claims whose run has not been handed to the supervisor yet
+            for session_id in self._claimed - runs.keys():
+                runs[session_id] = (None, {})
+            try:
+                await self._db.refresh_active_runs(
+                    self.worker_id,
+                    {
+                        session_id: (run_number, json.dumps(snapshot))
+                        for session_id, (run_number, snapshot) in runs.items()
+                    },
+                )
+                self._heartbeats += 1
+            except Exception as e:
+                self._failed_heartbeats += 1
+                logger.warning(f"Failed to refresh run claims: {e}")
+
+    async def close(self) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+        for session_id in list(self._claimed):
+            await self.release(session_id)
+
+    async def claim(self, session_id: str) -> bool:
+        claimed = await self._db.claim_active_run(
+            session_id, self.worker_id, self._stale_after
+        )
+        if claimed:
+            self._claimed.add(session_id)
+        else:
+            self._conflicts += 1
+        return claimed
+
+    async def update(
+        self, session_id: str, run_number: Optional[int], snapshot: dict
+    ) -> None:
+        try:
+            await self._db.refresh_active_runs(
+                self.worker_id, {session_id: (run_number, json.dumps(snapshot))}
+            )
+        except Exception as e:
+            # The next heartbeat publishes it
+            logger.warning(f"Failed to update run claim of {session_id}: {e}")
+
+    async def release(self, session_id: str) -> None:
+        self._claimed.discard(session_id)
+        try:
+            await self._db.release_active_run(session_id, self.worker_id)
+        except Exception as e:
+            # The claim goes stale once its heartbeats stop
+            logger.warning(f"Failed to release run claim of {session_id}: {e}")
+
+    async def active(self, session_id: str) -> Optional[RunClaim]:
+        row = await self._db.get_active_run(session_id, self._stale_after)
+        if row is None:
+            return None
+        worker_id, run_number, snapshot = row
+        return RunClaim(session_id, worker_id, run_number, json.loads(snapshot))
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "backend": "postgres",
+            "claims": len(self._claimed),
+            "conflicts": self._conflicts,
+            "heartbeats": self._heartbeats,
+            "failed_heartbeats": self._failed_heartbeats,
+        }
+
+
+def create_run_registry(db) -> RunRegistry:
+    """Build the registry selected by RUN_REGISTRY_BACKEND (memory or postgres)."""
+    from src.config import get_config
+
+    config = get_config()
+    if config.run_registry_backend == "postgres":
+        return PostgresRunRegistry(
+            db,
+            config.worker_id,
+            heartbeat_interval=config.run_heartbeat_seconds,
+            stale_after=config.run_claim_stale_seconds,
+        )
+    return InMemoryRunRegistry(config.worker_id)
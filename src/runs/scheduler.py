@@ -0,0 +1,183 @@
+import asyncio
+import contextvars
+import functools
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Deque, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class RunTicket:
+    # Runs with the same key (user or session) share one queue
+    key: str
+    on_position: Optional[Callable[[int], None]] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    admitted_at: Optional[float] = None
+    position: Optional[int] = None
+    waiter: Optional[asyncio.Future] = field(default=None, repr=False)
+
+
+class RunScheduler:
+    """Admits agent runs up to ``max_concurrent`` at a time, fairly across keys.
+
+    Waiting runs are queued per key (a user, or a session when the user is
+    unknown), and keys take turns, so one user's burst cannot starve the
+    others. A waiting run is told its position whenever it changes.
+    Admitted runs execute their blocking agent work on a dedicated pool of
+    ``max_workers`` threads (by default one per run slot), separate from the
+    default thread limiter that serves the rest of the application.
+    """
+
+    def __init__(
+        self, max_concurrent: int = 4, max_workers: Optional[int] = None
+    ) -> None:
+        self._max_concurrent = max_concurrent
+        self._max_workers = max_workers or max_concurrent
+        self._queues: OrderedDict[str, Deque[RunTicket]] = OrderedDict()
+        self._running = 0
+        self._workers = ThreadPoolExecutor(
+            max_workers=self._max_workers, thread_name_prefix="agent-run"
+        )
+
+        self._admitted = 0
+        self._abandoned = 0
+        self._queued_runs = 0
+        self._total_wait_ms = 0.0
+        self._max_wait_ms = 0.0
+        self._finished = 0
+        self._total_run_ms = 0.0
+        self._max_run_ms = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @asynccontextmanager
+    async def slot(
+        self, key: str, on_position: Optional[Callable[[int], None]] = None
+    ) -> AsyncIterator[RunTicket]:
+        """Wait for the run's turn and hold a run slot until the block exits."""
+        ticket = await self.acquire(key, on_position)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    async def acquire(
+        self, key: str, on_position: Optional[Callable[[int], None]] = None
+    ) -> RunTicket:
+        ticket = RunTicket(key=key, on_position=on_position)
+        if self._running < self._max_concurrent and not self._queues:
+            self._admit(ticket)
+            return ticket
+
+        ticket.waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(ticket)
+        self._queued_runs += 1
+        self._update_positions()
+        try:
+            await ticket.waiter
+        except asyncio.CancelledError:
+            if ticket.admitted_at is not None:
+                # Admitted just as the waiting task was cancelled
+                self.release(ticket)
+            else:
+                self._remove(ticket)
+                self._abandoned += 1
+            raise
+        return ticket
+
+    def release(self, ticket: RunTicket) -> None:
+        self._running -= 1
+        run_ms = (time.monotonic() - ticket.admitted_at) * 1000
+        self._finished += 1
+        self._total_run_ms += run_ms
+        self._max_run_ms = max(self._max_run_ms, run_ms)
+        self._dispatch()
+
+    async def run_in_worker(self, func: Callable[..., T], *args) -> T:
+        """Run blocking agent work on the dedicated worker pool."""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._workers, functools.partial(context.run, func, *args)
+        )
+
+    def _admit(self, ticket: RunTicket) -> None:
+        self._running += 1
+        self._admitted += 1
+        ticket.admitted_at = time.monotonic()
+        ticket.position = None
+        wait_ms = (ticket.admitted_at - ticket.enqueued_at) * 1000
+        self._total_wait_ms += wait_ms
+        self._max_wait_ms = max(self._max_wait_ms, wait_ms)
+
+    def _dispatch(self) -> None:
+        while self._running < self._max_concurrent and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            # The key goes to the back of the rotation
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if ticket.waiter.done():
+                # Cancelled, and not yet removed by its waiting task
+                continue
+            self._admit(ticket)
+            ticket.waiter.set_result(None)
+        self._update_positions()
+
+    def _remove(self, ticket: RunTicket) -> None:
+        queue = self._queues.get(ticket.key)
+        if queue is None or ticket not in queue:
+            # Already dropped by _dispatch
+            return
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[ticket.key]
+        self._update_positions()
+
+    def _update_positions(self) -> None:
+        # Dispatch order: the first run of every key in rotation, then the second...
+        queues = list(self._queues.values())
+        position = 0
+        depth = 0
+        while True:
+            tickets = [queue[depth] for queue in queues if len(queue) > depth]
+            if not tickets:
+                break
+            for ticket in tickets:
+                position += 1
+                if ticket.position != position:
+                    ticket.position = position
+                    if ticket.on_position is not None:
+                        ticket.on_position(position)
+            depth += 1
+
+    def shutdown(self) -> None:
+        self._workers.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self._max_concurrent,
+            "max_workers": self._max_workers,
+            "running": self._running,
+            "queued": self.queued,
+            "queued_keys": len(self._queues),
+            "admitted": self._admitted,
+            "queued_runs": self._queued_runs,
+            "abandoned": self._abandoned,
+            "avg_wait_ms": round(self._total_wait_ms / self._admitted, 3)
+            if self._admitted
+            else 0.0,
+            "max_wait_ms": round(self._max_wait_ms, 3),
+            "avg_run_ms": round(self._total_run_ms / self._finished, 3)
+            if self._finished
+            else 0.0,
+            "max_run_ms": round(self._max_run_ms, 3),
+        }
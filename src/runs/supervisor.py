@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.runs.cancellation import CancelReason, CancelToken
+
+logger = logging.getLogger(__name__)
+
+
+class RunState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    TIMED_OUT = "timed_out"
+
+
+@dataclass
+class RunRecord:
+    session_id: str
+    # Assigned once the run is recorded in the database
+    run_number: Optional[int] = None
+    state: RunState = RunState.QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    # Place in the run scheduler's queue while QUEUED
+    queue_position: Optional[int] = None
+    agent: Any = None
+    task: Optional[asyncio.Task] = None
+    cancel_token: CancelToken = field(default_factory=CancelToken)
+
+    @property
+    def run_id(self) -> str:
+        return f"{self.session_id}:{self.run_number}"
+
+    def mark_running(self) -> None:
+        self.state = RunState.RUNNING
+        self.started_at = time.time()
+        self.queue_position = None
+        # Deadlines count from here, not from when the run was queued
+        self.cancel_token.start()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (
+            RunState.COMPLETED,
+            RunState.FAILED,
+            RunState.CANCELLED,
+            RunState.TIMED_OUT,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "session_id": self.session_id,
+            "run_number": self.run_number,
+            "state": self.state.value,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "queue_position": self.queue_position,
+        }
+
+
+class RunSupervisor:
+    """Owns agent runs so they outlive the HTTP request that started them.
+
+    At most one run is active per session. A session is claimed before its
+    run is recorded in the database, so concurrent requests cannot both
+    start one. Runs execute as tasks owned by the supervisor; clients only
+    observe them through the run event log. Finished runs stay queryable in
+    a bounded history. A running run that outlives ``run_timeout`` seconds,
+    or whose current step outlives ``step_timeout`` seconds, is cancelled
+    and finishes TIMED_OUT.
+    """
+
+    def __init__(
+        self,
+        history_size: int = 256,
+        run_timeout: Optional[float] = None,
+        step_timeout: Optional[float] = None,
+        # How often a queued run's deadlines are checked for having started
+        watch_interval: float = 1.0,
+    ) -> None:
+        self._active: Dict[str, RunRecord] = {}
+        self._history: OrderedDict[Tuple[str, int], RunRecord] = OrderedDict()
+        self._history_size = history_size
+        self._run_timeout = run_timeout
+        self._step_timeout = step_timeout
+        self._watch_interval = watch_interval
+        self._finished = {
+            state: 0
+            for state in (
+                RunState.COMPLETED,
+                RunState.FAILED,
+                RunState.CANCELLED,
+                RunState.TIMED_OUT,
+            )
+        }
+        self._total_run_ms = 0.0
+
+    def claim(self, session_id: str) -> Optional[RunRecord]:
+        """Reserve the session for a new run; None if one is already active."""
+        if session_id in self._active:
+            return None
+        record = RunRecord(
+            session_id=session_id,
+            cancel_token=CancelToken(self._run_timeout, self._step_timeout),
+        )
+        self._active[session_id] = record
+        return record
+
+    def release(self, record: RunRecord) -> None:
+        """Give back a claim whose run never started."""
+        if self._active.get(record.session_id) is record and record.task is None:
+            del self._active[record.session_id]
+
+    def active(self, session_id: str) -> Optional[RunRecord]:
+        return self._active.get(session_id)
+
+    def active_records(self) -> List[RunRecord]:
+        return list(self._active.values())
+
+    def get(self, session_id: str, run_number: int) -> Optional[RunRecord]:
+        record = self._active.get(session_id)
+        if record is not None and record.run_number == run_number:
+            return record
+        return self._history.get((session_id, run_number))
+
+    def start(
+        self, record: RunRecord, runner: Callable[[RunRecord], Awaitable[None]]
+    ) -> None:
+        """Run ``runner(record)`` in a supervised task.
+
+        The record stays QUEUED until the runner calls ``mark_running``. The
+        runner reports failure by raising; cancellation (from ``cancel``, a
+        deadline or shutdown) arrives as CancelledError and should be
+        re-raised after cleanup. ``record.cancel_token`` says why.
+        """
+        record.task = asyncio.create_task(self._supervise(record, runner))
+
+    async def _supervise(
+        self, record: RunRecord, runner: Callable[[RunRecord], Awaitable[None]]
+    ) -> None:
+        watchdog = None
+        if record.cancel_token.has_deadline:
+            watchdog = asyncio.create_task(self._watch(record))
+        try:
+            await runner(record)
+            record.state = RunState.COMPLETED
+        except asyncio.CancelledError:
+            if record.cancel_token.reason is CancelReason.TIMED_OUT:
+                record.state = RunState.TIMED_OUT
+                record.error = record.cancel_token.message
+            else:
+                record.state = RunState.CANCELLED
+        except Exception as e:
+            record.state = RunState.FAILED
+            record.error = str(e)
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            record.finished_at = time.time()
+            record.agent = None
+            self._finished[record.state] += 1
+            if record.started_at is not None:
+                self._total_run_ms += (record.finished_at - record.started_at) * 1000
+            if self._active.get(record.session_id) is record:
+                del self._active[record.session_id]
+            self._history[(record.session_id, record.run_number)] = record
+            while len(self._history) > self._history_size:
+                self._history.popitem(last=False)
+
+    async def _watch(self, record: RunRecord) -> None:
+        token = record.cancel_token
+        while not token.cancelled:
+            left = token.seconds_left()
+            if left is None:
+                # Still queued; the clocks start when the run does
+                await asyncio.sleep(self._watch_interval)
+            elif left > 0:
+                # A finished step may have moved the deadline meanwhile
+                await asyncio.sleep(left)
+            elif token.expire():
+                logger.info(f"Run {record.run_id} timed out: {token.message}")
+                self._interrupt(record)
+
+    def cancel(self, session_id: str) -> bool:
+        """Interrupt the session's active run; False if there is none."""
+        record = self._active.get(session_id)
+        if record is None:
+            return False
+        record.cancel_token.cancel()
+        self._interrupt(record)
+        return True
+
+    def _interrupt(self, record: RunRecord) -> None:
+        if record.agent is not None:
+            try:
+                # Stops the agent thread at its next step
+                record.agent.interrupt()
+            except Exception as e:
+                logger.warning(f"Failed to interrupt agent: {e}")
+        if record.task is not None and not record.task.done():
+            record.task.cancel()
+
+    async def shutdown(self, timeout: float = 10.0) -> None:
+        """Cancel every active run and wait for their cleanup."""
+        tasks = [r.task for r in self._active.values() if r.task is not None]
+        for session_id in list(self._active):
+            self.cancel(session_id)
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    def stats(self) -> dict:
+        finished = sum(self._finished.values())
+        return {
+            "active": len(self._active),
+            **{state.value: count for state, count in self._finished.items()},
+            "avg_run_ms": round(self._total_run_ms / finished, 3) if finished else 0.0,
+        }
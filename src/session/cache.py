@@ -0,0 +1,111 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from src.session.models import Session
+
+
+@dataclass
+class CachedSession:
+    session: Optional[Session] = None
+    session_loaded_at: float = 0.0
+    # Decoded memory steps plus how many of them are stored in agent_steps
+    steps: Optional[list] = None
+    step_count: Optional[int] = None
+
+
+class SessionCache:
+    """Bounded LRU cache of session metadata and agent memory, keyed by session id.
+
+    Metadata entries expire after ``ttl`` seconds so changes made by other
+    processes sharing the database become visible; memory entries are
+    revalidated by the caller against the stored step count. Local writes
+    must call ``invalidate``.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 30.0) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries: OrderedDict[str, CachedSession] = OrderedDict()
+
+        self._metadata_hits = 0
+        self._metadata_misses = 0
+        self._memory_hits = 0
+        self._memory_misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _touch(self, session_id: str) -> Optional[CachedSession]:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            self._entries.move_to_end(session_id)
+        return entry
+
+    def _entry(self, session_id: str) -> CachedSession:
+        entry = self._touch(session_id)
+        if entry is None:
+            entry = CachedSession()
+            self._entries[session_id] = entry
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return entry
+
+    def get_session(self, session_id: str) -> Optional[Session]:
+        entry = self._touch(session_id)
+        if (
+            entry is not None
+            and entry.session is not None
+            and time.monotonic() - entry.session_loaded_at < self._ttl
+        ):
+            self._metadata_hits += 1
+            return entry.session
+        self._metadata_misses += 1
+        return None
+
+    def put_session(self, session: Session) -> None:
+        entry = self._entry(session.id)
+        entry.session = session
+        entry.session_loaded_at = time.monotonic()
+
+    def get_memory(self, session_id: str) -> Optional[CachedSession]:
+        entry = self._touch(session_id)
+        if entry is not None and entry.steps is not None:
+            self._memory_hits += 1
+            return entry
+        self._memory_misses += 1
+        return None
+
+    def put_memory(self, session_id: str, steps: list, step_count: int) -> None:
+        entry = self._entry(session_id)
+        entry.steps = steps
+        entry.step_count = step_count
+
+    def get_step_count(self, session_id: str) -> Optional[int]:
+        entry = self._entries.get(session_id)
+        return entry.step_count if entry is not None else None
+
+    def invalidate_session(self, session_id: str) -> None:
+        """Drop cached metadata (after a local write to the sessions row)."""
+        entry = self._entries.get(session_id)
+        if entry is not None and entry.session is not None:
+            entry.session = None
+            self._invalidations += 1
+
+    def invalidate(self, session_id: str) -> None:
+        """Drop everything cached for a session."""
+        if self._entries.pop(session_id, None) is not None:
+            self._invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_entries": self._max_entries,
+            "metadata_hits": self._metadata_hits,
+            "metadata_misses": self._metadata_misses,
+            "memory_hits": self._memory_hits,
+            "memory_misses": self._memory_misses,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+        }
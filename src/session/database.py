@@ -1,40 +1,145 @@
+import base64
+import binascii
 import uuid
-from datetime import datetime
-from typing import List, Optional
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-from sqlalchemy import select, update, delete, func
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy import (
+    bindparam,
+    case,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    text,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 
 from src.config import get_config
+from src.session.migrations import ROLLUP_REBUILD_STATEMENTS, apply_revisions
 from src.session.models import (
+    ActiveRun,
+    AgentMemoryStep,
+    AgentRunTokenTotals,
     Base,
     Message,
     MessageRole,
+    RunEvent,
     Session,
     SessionStatus,
+    SessionTokenTotals,
     AgentRunMetrics,
 )
 
 
-class SessionDatabase:
-    def __init__(self, db_url: Optional[str] = None):
-        if db_url is None:
-            # Strictly use config which enforces DATABASE_URL presence
-            db_url = get_config().database_url
+_engines: Dict[str, AsyncEngine] = {}
+
+
+def _normalize_db_url(db_url: str) -> str:
+    # Ensure we use the asyncpg driver
+    if db_url.startswith("postgresql://"):
+        db_url = db_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return db_url
+
+
+def get_engine(db_url: Optional[str] = None) -> AsyncEngine:
+    """Return the process-wide pooled engine for a database URL, creating it once."""
+    config = get_config()
+    if db_url is None:
+        # Strictly use config which enforces DATABASE_URL presence
+        db_url = config.database_url
+    db_url = _normalize_db_url(db_url)
+
+    engine = _engines.get(db_url)
+    if engine is None:
+        engine = create_async_engine(
+            db_url,
+            pool_size=config.db_pool_size,
+            max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout,
+            pool_recycle=config.db_pool_recycle,
+            pool_pre_ping=True,
+            connect_args={"statement_cache_size": config.db_statement_cache_size},
+            echo=False,
+        )
+        _engines[db_url] = engine
+    return engine
+
+
+async def dispose_engines() -> None:
+    """Close every pooled engine; called once on application shutdown."""
+    while _engines:
+        _, engine = _engines.popitem()
+        await engine.dispose()
+
+
+def encode_session_cursor(updated_at: datetime, session_id: str) -> str:
+    """Encode a keyset position (updated_at, id) as an opaque URL-safe cursor."""
+    raw = f"{updated_at.isoformat()}|{session_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_session_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor produced by encode_session_cursor; raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        updated_at, session_id = raw.split("|", 1)
+        return datetime.fromisoformat(updated_at), session_id
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
 
-        # Ensure we use the asyncpg driver
-        if db_url.startswith("postgresql://"):
-            db_url = db_url.replace("postgresql://", "postgresql+asyncpg://", 1)
 
-        self.engine = create_async_engine(db_url, poolclass=NullPool, connect_args={"statement_cache_size": 0}, echo=False)
+@dataclass
+class RunStart:
+    """What stream_chat needs once begin_run has opened a run."""
+
+    session_id: str
+    run_number: int
+    title: str
+    message_id: int
+
+
+def make_session_title(query: str) -> str:
+    # First user message becomes the title (27 chars + "..." = 30 chars)
+    return query[:27] + "..." if len(query) > 30 else query
+
+
+class SessionDatabase:
+    def __init__(
+        self, db_url: Optional[str] = None, engine: Optional[AsyncEngine] = None
+    ):
+        self.engine = engine if engine is not None else get_engine(db_url)
         self.async_session = async_sessionmaker(
             self.engine, expire_on_commit=False, class_=AsyncSession
         )
 
+    def pool_status(self) -> dict:
+        pool = self.engine.pool
+        return {
+            "pool_class": type(pool).__name__,
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+        }
+
     async def init_db(self) -> None:
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await apply_revisions(conn)
 
     def _generate_session_id(self) -> str:
         return str(uuid.uuid4())
@@ -72,6 +177,86 @@ class SessionDatabase:
             result = await session.execute(stmt)
             return list(result.scalars().all())
 
+    async def list_sessions_page(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """List session summaries newest-first using keyset pagination.
+
+        Only the sidebar columns are selected, so relationships and the
+        agent_steps blob are never loaded.
+        """
+        async with self.async_session() as session:
+            stmt = select(
+                Session.id,
+                Session.title,
+                Session.status,
+                Session.created_at,
+                Session.updated_at,
+            )
+            if cursor:
+                updated_at, session_id = decode_session_cursor(cursor)
+                stmt = stmt.where(
+                    tuple_(Session.updated_at, Session.id)
+                    < tuple_(updated_at, session_id)
+                )
+            stmt = stmt.order_by(Session.updated_at.desc(), Session.id.desc()).limit(
+                limit + 1
+            )
+            result = await session.execute(stmt)
+            rows = result.all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = (
+            encode_session_cursor(rows[-1].updated_at, rows[-1].id)
+            if has_more
+            else None
+        )
+        sessions = [
+            {
+                "id": row.id,
+                "title": row.title,
+                "status": row.status.value
+                if hasattr(row.status, "value")
+                else row.status,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+            }
+            for row in rows
+        ]
+        return sessions, next_cursor
+
+    async def get_messages_page(
+        self, session_id: str, limit: int = 50, before: Optional[int] = None
+    ) -> Tuple[List[dict], Optional[int]]:
+        """Page through a session's messages newest-first.
+
+        ``before`` is an exclusive message id cursor; the returned cursor is
+        the id to pass as ``before`` for the next (older) page, or None.
+        """
+        async with self.async_session() as session:
+            stmt = select(
+                Message.id, Message.role, Message.content, Message.timestamp
+            ).where(Message.session_id == session_id)
+            if before is not None:
+                stmt = stmt.where(Message.id < before)
+            stmt = stmt.order_by(Message.id.desc()).limit(limit + 1)
+            result = await session.execute(stmt)
+            rows = result.all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        messages = [
+            {
+                "id": row.id,
+                "role": row.role.value if hasattr(row.role, "value") else row.role,
+                "content": row.content,
+                "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+            }
+            for row in rows
+        ]
+        return messages, rows[-1].id if has_more else None
+
     async def get_most_recent_session(self) -> Optional[Session]:
         async with self.async_session() as session:
             stmt = select(Session).order_by(Session.updated_at.desc()).limit(1)
@@ -100,6 +285,71 @@ class SessionDatabase:
             await session.execute(stmt)
             await session.commit()
 
+    async def begin_run(self, session_id: str, query: str) -> Optional[RunStart]:
+        """Open a run in a single statement and transaction.
+
+        Allocates the next run number from the session's counter row, marks
+        the session RUNNING, titles it from the query if this is its first
+        user message, and stores the user message. Returns None if the session
+        does not exist.
+        """
+        now = datetime.now()
+        has_user_message = (
+            select(Message.id)
+            .where(Message.session_id == session_id, Message.role == MessageRole.USER)
+            .exists()
+        )
+        run = (
+            update(Session)
+            .where(Session.id == session_id)
+            .values(
+                last_run_number=Session.last_run_number + 1,
+                status=SessionStatus.RUNNING,
+                updated_at=now,
+                title=case(
+                    (has_user_message, Session.title),
+                    else_=make_session_title(query),
+                ),
+            )
+            .returning(Session.id, Session.last_run_number, Session.title)
+            .cte("run")
+        )
+        message = (
+            insert(Message)
+            .from_select(
+                ["session_id", "role", "content", "timestamp"],
+                select(
+                    run.c.id,
+                    # Explicit cast so Postgres types the SELECT column as the enum
+                    cast(
+                        literal(MessageRole.USER, Message.__table__.c.role.type),
+                        Message.__table__.c.role.type,
+                    ),
+                    literal(query, Message.__table__.c.content.type),
+                    literal(now, Message.__table__.c.timestamp.type),
+                ),
+            )
+            .returning(Message.id)
+            .cte("message")
+        )
+        stmt = select(
+            run.c.last_run_number, run.c.title, message.c.id.label("message_id")
+        ).select_from(run.join(message, true()))
+
+        async with self.async_session() as session:
+            result = await session.execute(stmt)
+            row = result.one_or_none()
+            await session.commit()
+
+        if row is None:
+            return None
+        return RunStart(
+            session_id=session_id,
+            run_number=row.last_run_number,
+            title=row.title,
+            message_id=row.message_id,
+        )
+
     async def get_session_status(self, session_id: str) -> Optional[SessionStatus]:
         async with self.async_session() as session:
             stmt = select(Session.status).where(Session.id == session_id)
@@ -116,16 +366,292 @@ class SessionDatabase:
             await session.execute(stmt)
             await session.commit()
 
-    async def save_agent_steps(self, session_id: str, agent_steps: bytes) -> None:
+    async def append_agent_steps(
+        self,
+        session_id: str,
+        run_number: int,
+        start_index: int,
+        steps: List[Tuple[str, bytes]],
+        clear_legacy_blob: bool = False,
+    ) -> None:
+        """Append serialized (step_type, payload) memory steps starting at start_index.
+
+        Already persisted positions are left untouched, so retries are idempotent.
+        """
+        if not steps:
+            return
+        now = datetime.now()
+        stmt = pg_insert(AgentMemoryStep).values(
+            [
+                {
+                    "session_id": session_id,
+                    "step_index": start_index + offset,
+                    "run_number": run_number,
+                    "step_type": step_type,
+                    "payload": payload,
+                    "created_at": now,
+                }
+                for offset, (step_type, payload) in enumerate(steps)
+            ]
+        )
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[AgentMemoryStep.session_id, AgentMemoryStep.step_index]
+        )
+        values = {"updated_at": now}
+        if clear_legacy_blob:
+            values["agent_steps"] = None
+        async with self.async_session() as session:
+            await session.execute(stmt)
+            await session.execute(
+                update(Session).where(Session.id == session_id).values(**values)
+            )
+            await session.commit()
+
+    async def truncate_agent_steps(self, session_id: str, from_index: int) -> None:
+        async with self.async_session() as session:
+            await session.execute(
+                delete(AgentMemoryStep).where(
+                    AgentMemoryStep.session_id == session_id,
+                    AgentMemoryStep.step_index >= from_index,
+                )
+            )
+            await session.commit()
+
+    async def get_agent_step_count(self, session_id: str) -> int:
+        async with self.async_session() as session:
+            stmt = select(func.max(AgentMemoryStep.step_index)).where(
+                AgentMemoryStep.session_id == session_id
+            )
+            result = await session.execute(stmt)
+            max_index = result.scalar()
+            return max_index + 1 if max_index is not None else 0
+
+    async def stream_agent_steps(self, session_id: str) -> AsyncIterator[bytes]:
+        """Yield serialized memory step payloads in memory order."""
         async with self.async_session() as session:
             stmt = (
-                update(Session)
-                .where(Session.id == session_id)
-                .values(agent_steps=agent_steps, updated_at=datetime.now())
+                select(AgentMemoryStep.payload)
+                .where(AgentMemoryStep.session_id == session_id)
+                .order_by(AgentMemoryStep.step_index.asc())
+                .execution_options(yield_per=50)
             )
+            result = await session.stream_scalars(stmt)
+            async for payload in result:
+                yield payload
+
+    async def get_legacy_agent_steps(self, session_id: str) -> Optional[bytes]:
+        async with self.async_session() as session:
+            stmt = select(Session.agent_steps).where(Session.id == session_id)
+            result = await session.execute(stmt)
+            return result.scalar_one_or_none()
+
+    async def save_run_events(
+        self, session_id: str, run_number: int, events: List[Tuple[int, str, str]]
+    ) -> None:
+        """Store (seq, event_type, data) events of a run; existing seqs are kept."""
+        if not events:
+            return
+        now = datetime.now()
+        stmt = pg_insert(RunEvent).values(
+            [
+                {
+                    "session_id": session_id,
+                    "run_number": run_number,
+                    "seq": seq,
+                    "event_type": event_type,
+                    "data": data,
+                    "created_at": now,
+                }
+                for seq, event_type, data in events
+            ]
+        )
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[RunEvent.session_id, RunEvent.run_number, RunEvent.seq]
+        )
+        async with self.async_session() as session:
             await session.execute(stmt)
             await session.commit()
 
+    async def get_run_events(
+        self, session_id: str, run_number: int, after_seq: int = 0
+    ) -> List[Tuple[int, str, str]]:
+        """Return (seq, event_type, data) of a stored run's events after after_seq."""
+        async with self.async_session() as session:
+            stmt = (
+                select(RunEvent.seq, RunEvent.event_type, RunEvent.data)
+                .where(
+                    RunEvent.session_id == session_id,
+                    RunEvent.run_number == run_number,
+                    RunEvent.seq > after_seq,
+                )
+                .order_by(RunEvent.seq.asc())
+            )
+            result = await session.execute(stmt)
+            return [(row.seq, row.event_type, row.data) for row in result]
+
+    async def get_run_outcome(
+        self, session_id: str, run_number: int
+    ) -> Optional[Tuple[str, str]]:
+        """Return (event_type, data) of a stored run's outcome event.
+
+        That is its final, error, cancelled or timed_out event.
+        """
+        async with self.async_session() as session:
+            stmt = (
+                select(RunEvent.event_type, RunEvent.data)
+                .where(
+                    RunEvent.session_id == session_id,
+                    RunEvent.run_number == run_number,
+                    RunEvent.event_type.in_(
+                        ("final", "error", "cancelled", "timed_out")
+                    ),
+                )
+                .order_by(RunEvent.seq.desc())
+                .limit(1)
+            )
+            row = (await session.execute(stmt)).first()
+            return (row.event_type, row.data) if row else None
+
+    async def publish_run_events(
+        self,
+        events: List[Tuple[str, int, int, str, str]],
+        channel: str,
+        payloads: List[str],
+    ) -> None:
+        """Store (session_id, run_number, seq, event_type, data) events, then NOTIFY.
+
+        ``payloads`` are sent on ``channel`` in order, in the same
+        transaction, so a listener never hears of an event it cannot read.
+        """
+        async with self.async_session() as session:
+            if events:
+                now = datetime.now()
+                stmt = pg_insert(RunEvent).values(
+                    [
+                        {
+                            "session_id": session_id,
+                            "run_number": run_number,
+                            "seq": seq,
+                            "event_type": event_type,
+                            "data": data,
+                            "created_at": now,
+                        }
+                        for session_id, run_number, seq, event_type, data in events
+                    ]
+                )
+                stmt = stmt.on_conflict_do_nothing(
+                    index_elements=[
+                        RunEvent.session_id,
+                        RunEvent.run_number,
+                        RunEvent.seq,
+                    ]
+                )
+                await session.execute(stmt)
+            if payloads:
+                await session.execute(
+                    text(
+                        "SELECT pg_notify(:channel, payload) "
+                        "FROM unnest(CAST(:payloads AS text[])) "
+                        "WITH ORDINALITY AS t(payload, position) ORDER BY position"
+                    ),
+                    {"channel": channel, "payloads": payloads},
+                )
+            await session.commit()
+
+    async def notify(self, channel: str, payload: str) -> None:
+        async with self.async_session() as session:
+            await session.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": channel, "payload": payload},
+            )
+            await session.commit()
+
+    async def claim_active_run(
+        self, session_id: str, worker_id: str, stale_after: float
+    ) -> bool:
+        """Record ``worker_id`` as running the session; False if a live worker is.
+
+        A claim whose heartbeat is older than ``stale_after`` seconds is taken over.
+        """
+        stmt = pg_insert(ActiveRun).values(
+            session_id=session_id,
+            worker_id=worker_id,
+            run_number=None,
+            snapshot="{}",
+            heartbeat_at=func.now(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ActiveRun.session_id],
+            set_={
+                "worker_id": stmt.excluded.worker_id,
+                "run_number": None,
+                "snapshot": stmt.excluded.snapshot,
+                "heartbeat_at": stmt.excluded.heartbeat_at,
+            },
+            where=ActiveRun.heartbeat_at
+            < func.now() - timedelta(seconds=stale_after),
+        ).returning(ActiveRun.session_id)
+        async with self.async_session() as session:
+            claimed = (await session.execute(stmt)).first() is not None
+            await session.commit()
+            return claimed
+
+    async def refresh_active_runs(
+        self, worker_id: str, snapshots: Dict[str, Tuple[Optional[int], str]]
+    ) -> None:
+        """Heartbeat the worker's claims with their (run_number, snapshot JSON)."""
+        if not snapshots:
+            return
+        stmt = (
+            update(ActiveRun.__table__)
+            .where(
+                ActiveRun.__table__.c.session_id == bindparam("b_session_id"),
+                ActiveRun.__table__.c.worker_id == worker_id,
+            )
+            .values(
+                run_number=bindparam("b_run_number"),
+                snapshot=bindparam("b_snapshot"),
+                heartbeat_at=func.now(),
+            )
+        )
+        async with self.async_session() as session:
+            await session.execute(
+                stmt,
+                [
+                    {
+                        "b_session_id": session_id,
+                        "b_run_number": run_number,
+                        "b_snapshot": snapshot,
+                    }
+                    for session_id, (run_number, snapshot) in snapshots.items()
+                ],
+            )
+            await session.commit()
+
+    async def release_active_run(self, session_id: str, worker_id: str) -> None:
+        async with self.async_session() as session:
+            await session.execute(
+                delete(ActiveRun).where(
+                    ActiveRun.session_id == session_id,
+                    ActiveRun.worker_id == worker_id,
+                )
+            )
+            await session.commit()
+
+    async def get_active_run(
+        self, session_id: str, stale_after: float
+    ) -> Optional[Tuple[str, Optional[int], str]]:
+        """Return (worker_id, run_number, snapshot) of a live claim on the session."""
+        async with self.async_session() as session:
+            stmt = select(
+                ActiveRun.worker_id, ActiveRun.run_number, ActiveRun.snapshot
+            ).where(
+                ActiveRun.session_id == session_id,
+                ActiveRun.heartbeat_at >= func.now() - timedelta(seconds=stale_after),
+            )
+            row = (await session.execute(stmt)).first()
+            return (row.worker_id, row.run_number, row.snapshot) if row else None
+
     async def set_active_session(self, session_id: str) -> None:
         async with self.async_session() as session:
             await session.execute(update(Session).values(is_active=False))
@@ -165,18 +691,17 @@ class SessionDatabase:
 
     async def get_next_run_number(self, session_id: str) -> int:
         async with self.async_session() as session:
-            stmt = select(func.max(AgentRunMetrics.run_number)).where(
-                AgentRunMetrics.session_id == session_id
-            )
+            stmt = select(Session.last_run_number).where(Session.id == session_id)
             result = await session.execute(stmt)
-            max_run = result.scalar()
-            return (max_run or 0) + 1
+            last_run = result.scalar()
+            return (last_run or 0) + 1
 
     async def get_next_step_number(self, session_id: str, run_number: int) -> int:
         async with self.async_session() as session:
             stmt = select(func.max(AgentRunMetrics.step_number)).where(
                 AgentRunMetrics.session_id == session_id,
                 AgentRunMetrics.run_number == run_number,
+                AgentRunMetrics.agent_name == "",
             )
             result = await session.execute(stmt)
             max_step = result.scalar()
@@ -190,46 +715,214 @@ class SessionDatabase:
         step_type: str,
         input_tokens: int,
         output_tokens: int,
+        agent_name: str = "",
     ) -> None:
-        total_tokens = input_tokens + output_tokens
+        await self.save_step_tokens(
+            [
+                {
+                    "session_id": session_id,
+                    "run_number": run_number,
+                    "agent_name": agent_name,
+                    "step_number": step_number,
+                    "step_type": step_type,
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                }
+            ]
+        )
+
+    async def save_step_tokens(self, rows: List[dict]) -> None:
+        """Upsert many step token rows in one multi-row INSERT ... ON CONFLICT.
+
+        The per-run and per-session token rollups are adjusted by the change
+        each row makes, in the same transaction. Each (session_id, run_number,
+        agent_name, step_number) key must appear at most once; rows without an
+        agent_name belong to the session's own agent.
+        """
+        if not rows:
+            return
+        now = datetime.now()
+        values = [
+            {
+                "agent_name": "",
+                **row,
+                "total_tokens": row["input_tokens"] + row["output_tokens"],
+                "created_at": now,
+            }
+            for row in rows
+        ]
+        keys = [
+            (v["session_id"], v["run_number"], v["agent_name"], v["step_number"])
+            for v in values
+        ]
+        stmt = pg_insert(AgentRunMetrics).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                AgentRunMetrics.session_id,
+                AgentRunMetrics.run_number,
+                AgentRunMetrics.agent_name,
+                AgentRunMetrics.step_number,
+            ],
+            set_={
+                "step_type": stmt.excluded.step_type,
+                "input_tokens": stmt.excluded.input_tokens,
+                "output_tokens": stmt.excluded.output_tokens,
+                "total_tokens": stmt.excluded.total_tokens,
+                "created_at": stmt.excluded.created_at,
+            },
+        )
         async with self.async_session() as session:
-            # Check if exists to emulate ON CONFLICT
-            stmt = select(AgentRunMetrics).where(
-                AgentRunMetrics.session_id == session_id,
-                AgentRunMetrics.run_number == run_number,
-                AgentRunMetrics.step_number == step_number,
+            await self._lock_sessions(session, {key[0] for key in keys})
+            result = await session.execute(
+                select(
+                    AgentRunMetrics.session_id,
+                    AgentRunMetrics.run_number,
+                    AgentRunMetrics.agent_name,
+                    AgentRunMetrics.step_number,
+                    AgentRunMetrics.input_tokens,
+                    AgentRunMetrics.output_tokens,
+                ).where(
+                    tuple_(
+                        AgentRunMetrics.session_id,
+                        AgentRunMetrics.run_number,
+                        AgentRunMetrics.agent_name,
+                        AgentRunMetrics.step_number,
+                    ).in_(keys)
+                )
             )
-            result = await session.execute(stmt)
-            metric = result.scalar_one_or_none()
-
-            if metric:
-                metric.step_type = step_type
-                metric.input_tokens = input_tokens
-                metric.output_tokens = output_tokens
-                metric.total_tokens = total_tokens
-                metric.created_at = datetime.now()
+            previous = {
+                (row.session_id, row.run_number, row.agent_name, row.step_number): row
+                for row in result.all()
+            }
+            await session.execute(stmt)
+            await self._apply_token_deltas(session, values, previous, now)
+            await session.commit()
+
+    async def _lock_sessions(self, session: AsyncSession, session_ids: set) -> None:
+        # Serializes rollup maintenance per session across workers; sorted to avoid deadlocks
+        for session_id in sorted(session_ids):
+            await session.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:session_id))"),
+                {"session_id": session_id},
+            )
+
+    async def _apply_token_deltas(
+        self, session: AsyncSession, values: List[dict], previous: dict, now: datetime
+    ) -> None:
+        run_deltas: Dict[Tuple[str, int], List[int]] = {}
+        session_deltas: Dict[str, List[int]] = {}
+        for value in values:
+            key = (
+                value["session_id"],
+                value["run_number"],
+                value["agent_name"],
+                value["step_number"],
+            )
+            old = previous.get(key)
+            input_delta = value["input_tokens"] - (old.input_tokens if old else 0)
+            output_delta = value["output_tokens"] - (old.output_tokens if old else 0)
+
+            run_delta = run_deltas.setdefault(key[:2], [0, 0, 0])
+            run_delta[0] += input_delta
+            run_delta[1] += output_delta
+            run_delta[2] += 0 if old else 1
+            session_delta = session_deltas.setdefault(key[0], [0, 0])
+            session_delta[0] += input_delta
+            session_delta[1] += output_delta
+
+        run_stmt = pg_insert(AgentRunTokenTotals).values(
+            [
+                {
+                    "session_id": session_id,
+                    "run_number": run_number,
+                    "input_tokens": delta[0],
+                    "output_tokens": delta[1],
+                    "total_tokens": delta[0] + delta[1],
+                    "step_count": delta[2],
+                    "updated_at": now,
+                }
+                for (session_id, run_number), delta in run_deltas.items()
+            ]
+        )
+        run_stmt = run_stmt.on_conflict_do_update(
+            index_elements=[AgentRunTokenTotals.session_id, AgentRunTokenTotals.run_number],
+            set_={
+                "input_tokens": AgentRunTokenTotals.input_tokens
+                + run_stmt.excluded.input_tokens,
+                "output_tokens": AgentRunTokenTotals.output_tokens
+                + run_stmt.excluded.output_tokens,
+                "total_tokens": AgentRunTokenTotals.total_tokens
+                + run_stmt.excluded.total_tokens,
+                "step_count": AgentRunTokenTotals.step_count
+                + run_stmt.excluded.step_count,
+                "updated_at": run_stmt.excluded.updated_at,
+            },
+        )
+        await session.execute(run_stmt)
+
+        session_stmt = pg_insert(SessionTokenTotals).values(
+            [
+                {
+                    "session_id": session_id,
+                    "input_tokens": delta[0],
+                    "output_tokens": delta[1],
+                    "total_tokens": delta[0] + delta[1],
+                    "updated_at": now,
+                }
+                for session_id, delta in session_deltas.items()
+            ]
+        )
+        session_stmt = session_stmt.on_conflict_do_update(
+            index_elements=[SessionTokenTotals.session_id],
+            set_={
+                "input_tokens": SessionTokenTotals.input_tokens
+                + session_stmt.excluded.input_tokens,
+                "output_tokens": SessionTokenTotals.output_tokens
+                + session_stmt.excluded.output_tokens,
+                "total_tokens": SessionTokenTotals.total_tokens
+                + session_stmt.excluded.total_tokens,
+                "updated_at": session_stmt.excluded.updated_at,
+            },
+        )
+        await session.execute(session_stmt)
+
+    async def rebuild_token_rollups(self, session_id: Optional[str] = None) -> None:
+        """Recompute token rollups from raw agent_run_metrics (all sessions by default)."""
+        where = "WHERE session_id = :session_id" if session_id else ""
+        params = {"session_id": session_id} if session_id else {}
+        async with self.async_session() as session:
+            if session_id:
+                await self._lock_sessions(session, {session_id})
+                await session.execute(
+                    delete(AgentRunTokenTotals).where(
+                        AgentRunTokenTotals.session_id == session_id
+                    )
+                )
+                await session.execute(
+                    delete(SessionTokenTotals).where(
+                        SessionTokenTotals.session_id == session_id
+                    )
+                )
             else:
-                metric = AgentRunMetrics(
-                    session_id=session_id,
-                    run_number=run_number,
-                    step_number=step_number,
-                    step_type=step_type,
-                    input_tokens=input_tokens,
-                    output_tokens=output_tokens,
-                    total_tokens=total_tokens,
-                    created_at=datetime.now(),
+                # Step upserts that already wrote are committed (and counted)
+                # first; later ones wait and apply their deltas to the rebuild
+                await session.execute(
+                    text("LOCK TABLE agent_run_metrics IN SHARE ROW EXCLUSIVE MODE")
                 )
-                session.add(metric)
-
+                await session.execute(delete(AgentRunTokenTotals))
+                await session.execute(delete(SessionTokenTotals))
+            for statement in ROLLUP_REBUILD_STATEMENTS:
+                await session.execute(text(statement.format(where=where)), params)
             await session.commit()
 
     async def get_step_token(
-        self, session_id: str, run_number: int, step_number: int
+        self, session_id: str, run_number: int, step_number: int, agent_name: str = ""
     ) -> Optional[dict]:
         async with self.async_session() as session:
             stmt = select(AgentRunMetrics).where(
                 AgentRunMetrics.session_id == session_id,
                 AgentRunMetrics.run_number == run_number,
+                AgentRunMetrics.agent_name == agent_name,
                 AgentRunMetrics.step_number == step_number,
             )
             result = await session.execute(stmt)
@@ -239,6 +932,7 @@ class SessionDatabase:
                     "id": row.id,
                     "session_id": row.session_id,
                     "run_number": row.run_number,
+                    "agent_name": row.agent_name,
                     "step_number": row.step_number,
                     "step_type": row.step_type,
                     "input_tokens": row.input_tokens,
@@ -250,29 +944,36 @@ class SessionDatabase:
 
     async def get_run_tokens(self, session_id: str, run_number: int) -> dict:
         async with self.async_session() as session:
+            totals = await session.get(AgentRunTokenTotals, (session_id, run_number))
             stmt = (
-                select(AgentRunMetrics)
+                select(
+                    AgentRunMetrics.agent_name,
+                    AgentRunMetrics.step_number,
+                    AgentRunMetrics.step_type,
+                    AgentRunMetrics.input_tokens,
+                    AgentRunMetrics.output_tokens,
+                    AgentRunMetrics.total_tokens,
+                )
                 .where(
                     AgentRunMetrics.session_id == session_id,
                     AgentRunMetrics.run_number == run_number,
                 )
-                .order_by(AgentRunMetrics.step_number.asc())
+                .order_by(
+                    AgentRunMetrics.agent_name.asc(), AgentRunMetrics.step_number.asc()
+                )
             )
             result = await session.execute(stmt)
-            rows = result.scalars().all()
-
-            if not rows:
-                return {
-                    "session_id": session_id,
-                    "run_number": run_number,
-                    "input_tokens": 0,
-                    "output_tokens": 0,
-                    "total_tokens": 0,
-                    "steps": [],
-                }
+            rows = result.all()
 
-            steps = [
+        return {
+            "session_id": session_id,
+            "run_number": run_number,
+            "input_tokens": totals.input_tokens if totals else 0,
+            "output_tokens": totals.output_tokens if totals else 0,
+            "total_tokens": totals.total_tokens if totals else 0,
+            "steps": [
                 {
+                    "agent_name": row.agent_name,
                     "step_number": row.step_number,
                     "step_type": row.step_type,
                     "input_tokens": row.input_tokens,
@@ -280,43 +981,31 @@ class SessionDatabase:
                     "total_tokens": row.total_tokens,
                 }
                 for row in rows
-            ]
-
-            return {
-                "session_id": session_id,
-                "run_number": run_number,
-                "input_tokens": sum(row.input_tokens for row in rows),
-                "output_tokens": sum(row.output_tokens for row in rows),
-                "total_tokens": sum(row.total_tokens for row in rows),
-                "steps": steps,
-            }
+            ],
+        }
 
     async def get_session_tokens(self, session_id: str) -> dict:
         async with self.async_session() as session:
+            totals = await session.get(SessionTokenTotals, session_id)
             stmt = (
                 select(
-                    AgentRunMetrics.run_number,
-                    func.sum(AgentRunMetrics.input_tokens).label("input_tokens"),
-                    func.sum(AgentRunMetrics.output_tokens).label("output_tokens"),
-                    func.sum(AgentRunMetrics.total_tokens).label("total_tokens"),
+                    AgentRunTokenTotals.run_number,
+                    AgentRunTokenTotals.input_tokens,
+                    AgentRunTokenTotals.output_tokens,
+                    AgentRunTokenTotals.total_tokens,
                 )
-                .where(AgentRunMetrics.session_id == session_id)
-                .group_by(AgentRunMetrics.run_number)
-                .order_by(AgentRunMetrics.run_number.asc())
+                .where(AgentRunTokenTotals.session_id == session_id)
+                .order_by(AgentRunTokenTotals.run_number.asc())
             )
             result = await session.execute(stmt)
             rows = result.all()
 
-            if not rows:
-                return {
-                    "session_id": session_id,
-                    "input_tokens": 0,
-                    "output_tokens": 0,
-                    "total_tokens": 0,
-                    "runs": [],
-                }
-
-            runs = [
+        return {
+            "session_id": session_id,
+            "input_tokens": totals.input_tokens if totals else 0,
+            "output_tokens": totals.output_tokens if totals else 0,
+            "total_tokens": totals.total_tokens if totals else 0,
+            "runs": [
                 {
                     "run_number": row.run_number,
                     "input_tokens": row.input_tokens,
@@ -324,15 +1013,8 @@ class SessionDatabase:
                     "total_tokens": row.total_tokens,
                 }
                 for row in rows
-            ]
-
-            return {
-                "session_id": session_id,
-                "input_tokens": sum(r["input_tokens"] for r in runs),
-                "output_tokens": sum(r["output_tokens"] for r in runs),
-                "total_tokens": sum(r["total_tokens"] for r in runs),
-                "runs": runs,
-            }
+            ],
+        }
 
     async def get_all_run_tokens(self, session_id: str) -> List[dict]:
         res = await self.get_session_tokens(session_id)
@@ -355,7 +1037,9 @@ class SessionDatabase:
                 select(AgentRunMetrics)
                 .where(AgentRunMetrics.session_id == session_id)
                 .order_by(
-                    AgentRunMetrics.run_number.asc(), AgentRunMetrics.step_number.asc()
+                    AgentRunMetrics.run_number.asc(),
+                    AgentRunMetrics.agent_name.asc(),
+                    AgentRunMetrics.step_number.asc(),
                 )
             )
             result = await session.execute(stmt)
@@ -365,6 +1049,7 @@ class SessionDatabase:
                     "id": row.id,
                     "session_id": row.session_id,
                     "run_number": row.run_number,
+                    "agent_name": row.agent_name,
                     "step_number": row.step_number,
                     "step_type": row.step_type,
                     "input_tokens": row.input_tokens,
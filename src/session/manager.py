@@ -5,32 +5,63 @@ from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
+import anyio
 from smolagents import CodeAgent
-from smolagents.memory import ActionStep, PlanningStep
 
-from src.session.database import SessionDatabase
-from src.session.models import Message, MessageRole, Session
+from src.config import get_config
+from src.session.cache import SessionCache
+from src.session.database import RunStart, SessionDatabase
+from src.session.memory_codec import MemoryCodecError, decode_step, encode_step
+from src.session.metrics_writer import StepMetricsWriter
+from src.session.models import Message, MessageRole, Session, SessionStatus
 
 logger = logging.getLogger(__name__)
 
 
+def _decode_steps(payloads: list) -> list:
+    return [decode_step(payload) for payload in payloads]
+
+
 class SessionManager:
-    def __init__(self, db_url: Optional[str] = None):
-        self.db = SessionDatabase(db_url)
+    def __init__(
+        self, db_url: Optional[str] = None, db: Optional[SessionDatabase] = None
+    ):
+        self.db = db if db is not None else SessionDatabase(db_url)
+        config = get_config()
+        self.metrics_writer = StepMetricsWriter(
+            self.db,
+            batch_size=config.step_metrics_batch_size,
+            flush_interval=config.step_metrics_flush_interval_ms / 1000,
+            max_pending=config.step_metrics_max_pending,
+        )
+        self.cache = SessionCache(
+            max_entries=config.session_cache_max_entries,
+            ttl=config.session_cache_ttl_seconds,
+        )
         self._current_session: Optional[Session] = None
-        self._sessions: list[Session] = []
+        self._background_tasks: set[asyncio.Task] = set()
+        self._legacy_step_sessions: set[str] = set()
+        self._rewrite_step_sessions: set[str] = set()
         self._initialized = False
 
     async def initialize(self) -> None:
         if self._initialized:
             return
         await self.db.init_db()
+        self.metrics_writer.start()
         self._initialized = True
-        await self.load_sessions()
 
-    async def load_sessions(self) -> None:
-        self._sessions = await self.db.get_all_sessions()
-        logger.debug(f"Loaded {len(self._sessions)} sessions from database")
+    async def close(self) -> None:
+        """Wait for in-flight background saves and drain buffered step metrics."""
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await self.metrics_writer.close()
+
+    def _track(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
 
     async def create_session(self, title: Optional[str] = "New Session") -> Session:
         final_title = (
@@ -41,7 +72,7 @@ class SessionManager:
         logger.info(f"Creating new session: {final_title}")
         session = await self.db.create_session(final_title)
         self._current_session = session
-        self._sessions.insert(0, session)
+        self.cache.put_session(session)
         logger.info(f"Created session {session.id}: {session.title}")
         return session
 
@@ -56,21 +87,23 @@ class SessionManager:
 
     async def switch_session(self, session_id: str) -> Optional[Session]:
         logger.info(f"Switching to session {session_id}")
-        session = await self.db.get_session(session_id)
+        session = await self.get_session(session_id)
         if session is not None:
             await self.db.set_active_session(session_id)
+            self.cache.invalidate_session(session_id)
             self._current_session = session
-
-            if not any(s.id == session_id for s in self._sessions):
-                self._sessions.append(session)
-
             logger.info(f"Switched to session {session_id}: {session.title}")
             return session
         logger.warning(f"Session {session_id} not found")
         return None
 
     async def get_session(self, session_id: str) -> Optional[Session]:
-        return await self.db.get_session(session_id)
+        session = self.cache.get_session(session_id)
+        if session is None:
+            session = await self.db.get_session(session_id)
+            if session is not None:
+                self.cache.put_session(session)
+        return session
 
     async def add_message(
         self, role: MessageRole, content: str, session_id: Optional[str] = None
@@ -81,18 +114,13 @@ class SessionManager:
         if target_session_id is None:
             raise ValueError("No active session")
         message = await self.db.add_message(target_session_id, role, content)
-        if self._current_session and self._current_session.id == target_session_id:
-            self._current_session.messages.append(message)
         logger.debug(f"Added {role.value} message to session {target_session_id}")
         return message
 
     async def update_session_title(self, session_id: str, title: str) -> None:
         logger.info(f"Updating session {session_id} title to: {title}")
         await self.db.update_session_title(session_id, title)
-        for session in self._sessions:
-            if session.id == session_id:
-                session.title = title
-                break
+        self.cache.invalidate_session(session_id)
         if self._current_session and self._current_session.id == session_id:
             self._current_session.title = title
         logger.info(f"Session {session_id} title updated to: {title}")
@@ -100,55 +128,77 @@ class SessionManager:
     def get_current_session(self) -> Optional[Session]:
         return self._current_session
 
-    def get_all_sessions(self) -> list[Session]:
-        return self._sessions
+    async def begin_run(self, session_id: str, query: str) -> Optional[RunStart]:
+        run = await self.db.begin_run(session_id, query)
+        self.cache.invalidate_session(session_id)
+        return run
+
+    async def update_session_status(
+        self, session_id: str, status: SessionStatus
+    ) -> None:
+        await self.db.update_session_status(session_id, status)
+        self.cache.invalidate_session(session_id)
+
+    async def delete_session(self, session_id: str) -> None:
+        await self.db.delete_session(session_id)
+        self.cache.invalidate(session_id)
+        self._legacy_step_sessions.discard(session_id)
+        self._rewrite_step_sessions.discard(session_id)
+        if self._current_session and self._current_session.id == session_id:
+            self._current_session = None
 
     async def save_session(self, session: Session) -> None:
         if session.id:
             await self.db.update_session_timestamp(session.id)
+            self.cache.invalidate_session(session.id)
 
-    async def save_agent_steps(self, session_id: str, agent_steps: bytes) -> None:
-        await self.db.save_agent_steps(session_id, agent_steps)
-        for session in self._sessions:
-            if session.id == session_id:
-                session.agent_steps = agent_steps
-                break
-        if self._current_session and self._current_session.id == session_id:
-            self._current_session.agent_steps = agent_steps
-
-    async def get_agent_steps(self, session_id: str) -> Optional[bytes]:
-        for session in self._sessions:
-            if session.id == session_id:
-                return session.agent_steps if session.agent_steps else None
-
-        session = await self.db.get_session(session_id)
-        if session:
-            return session.agent_steps if session.agent_steps else None
-        return None
+    async def load_agent_state(self, session_id: str) -> list:
+        """Load agent memory steps for a session, in memory order.
+
+        Stored payloads are read on the event loop and decoded in a worker
+        thread, so restoring a long session does not stall other requests.
+        """
+        cached = self.cache.get_memory(session_id)
+        if cached is not None:
+            # Another process sharing the database may have appended steps
+            if await self.db.get_agent_step_count(session_id) == cached.step_count:
+                return list(cached.steps)
+            self.cache.invalidate(session_id)
+
+        # Compressed payloads are small next to the steps they decode to
+        payloads = [
+            payload async for payload in self.db.stream_agent_steps(session_id)
+        ]
+        try:
+            steps = await anyio.to_thread.run_sync(_decode_steps, payloads)
+        except MemoryCodecError as e:
+            logger.warning(f"Failed to load agent state for session {session_id}: {e}")
+            # Rewrite the stored steps from the fresh memory on the next save
+            self._rewrite_step_sessions.add(session_id)
+            self.cache.put_memory(session_id, [], 0)
+            return []
 
-    def get_current_agent_steps(self) -> Optional[bytes]:
-        if self._current_session:
-            return (
-                self._current_session.agent_steps
-                if self._current_session.agent_steps
-                else None
-            )
-        return None
+        if not steps:
+            steps = await self._load_legacy_agent_state(session_id)
 
-    async def load_agent_state(self, session_id: str) -> list:
-        """Load agent memory steps from database for a session."""
-        agent_steps_bytes = self.get_current_agent_steps()
-        if not agent_steps_bytes:
-            agent_steps_bytes = await self.get_agent_steps(session_id)
+        step_count = 0 if session_id in self._legacy_step_sessions else len(steps)
+        self.cache.put_memory(session_id, steps, step_count)
+        return list(steps)
 
+    async def _load_legacy_agent_state(self, session_id: str) -> list:
+        """Load steps pickled into sessions.agent_steps before per-step storage."""
+        agent_steps_bytes = await self.db.get_legacy_agent_steps(session_id)
         if not agent_steps_bytes:
             return []
 
         try:
-            return pickle.loads(agent_steps_bytes)
-        except (pickle.PickleError, EOFError, TypeError) as e:
+            steps = pickle.loads(agent_steps_bytes)
+        except (pickle.PickleError, EOFError, TypeError, AttributeError) as e:
             logger.warning(f"Failed to load agent state for session {session_id}: {e}")
             return []
+        # Migrated to agent_steps rows (and the blob cleared) on the next save
+        self._legacy_step_sessions.add(session_id)
+        return steps
 
     def extract_tokens_from_step(self, step, step_index: int = 0) -> Optional[dict]:
         """Extract token usage from an ActionStep or PlanningStep."""
@@ -165,53 +215,73 @@ class SessionManager:
             "total_tokens": getattr(tu, "total_tokens", 0),
         }
 
-    async def save_step_token_from_step(
-        self, session_id: str, run_number: int, step_index: int, step
+    def record_step_tokens(
+        self,
+        session_id: str,
+        run_number: int,
+        step_index: int,
+        step,
+        agent_name: str = "",
     ) -> None:
-        """Extract and save token usage from a step (non-blocking)."""
+        """Buffer token usage from a step for write-behind persistence (thread-safe).
+
+        ``agent_name`` names the sub-agent that took the step; it is empty
+        for the session's own agent.
+        """
         token_data = self.extract_tokens_from_step(step, step_index)
         if token_data:
-            try:
-                await self.db.save_step_token(
-                    session_id,
-                    run_number,
-                    token_data["step_number"],
-                    token_data["step_type"],
-                    token_data["input_tokens"],
-                    token_data["output_tokens"],
-                )
-            except Exception as e:
-                logger.warning(
-                    f"Failed to save step token for session {session_id}, run {run_number}: {e}"
-                )
+            self.metrics_writer.submit(
+                session_id,
+                run_number,
+                token_data["step_number"],
+                token_data["step_type"],
+                token_data["input_tokens"],
+                token_data["output_tokens"],
+                agent_name=agent_name,
+            )
 
     def save_agent_state(
         self, agent: CodeAgent, session_id: str, run_number: int
     ) -> None:
-        """Save agent memory steps and step tokens to database (non-blocking)."""
+        """Persist agent memory steps added since the last save (non-blocking).
+
+        Step tokens are recorded by the step callback via record_step_tokens.
+        """
+        steps = agent.memory.steps if hasattr(agent, "memory") and agent.memory else []
+        self._track(self.persist_agent_steps(session_id, run_number, list(steps)))
+
+    async def persist_agent_steps(
+        self, session_id: str, run_number: int, steps: list
+    ) -> None:
+        """Append only the memory steps not yet stored for the session."""
         try:
-            steps = (
-                agent.memory.steps if hasattr(agent, "memory") and agent.memory else []
+            start = self.cache.get_step_count(session_id)
+            if start is None:
+                start = await self.db.get_agent_step_count(session_id)
+            if session_id in self._rewrite_step_sessions or start > len(steps):
+                # Memory was reset or stored steps were unreadable: replace them
+                await self.db.truncate_agent_steps(session_id, 0)
+                start = 0
+
+            payloads = [
+                (type(step).__name__, encode_step(step)) for step in steps[start:]
+            ]
+            await self.db.append_agent_steps(
+                session_id,
+                run_number,
+                start,
+                payloads,
+                clear_legacy_blob=session_id in self._legacy_step_sessions,
             )
-
-            pickled = pickle.dumps(steps)
-            asyncio.create_task(self.save_agent_steps(session_id, pickled))
-
-            for step_index, step in enumerate(steps):
-                try:
-                    if isinstance(step, (ActionStep, PlanningStep)):
-                        token_usage = getattr(step, "token_usage", None)
-                        if token_usage:
-                            asyncio.create_task(
-                                self.save_step_token_from_step(
-                                    session_id, run_number, step_index, step
-                                )
-                            )
-                except Exception:
-                    pass
-        except (pickle.PickleError, TypeError) as e:
+            self.cache.put_memory(session_id, steps, start + len(payloads))
+            self._rewrite_step_sessions.discard(session_id)
+            self._legacy_step_sessions.discard(session_id)
+        except Exception as e:
             logger.warning(f"Failed to save agent state for session {session_id}: {e}")
 
+    async def get_agent_step_count(self, session_id: str) -> int:
+        return await self.db.get_agent_step_count(session_id)
+
     async def get_next_run_number(self, session_id: str) -> int:
         return await self.db.get_next_run_number(session_id)
 
@@ -250,8 +320,8 @@ class SessionManager:
         return await self.db.get_latest_run_number(session_id)
 
     async def get_session_cumulative_tokens(self, session_id: str) -> dict:
-        runs = await self.get_agent_run_metrics(session_id)
+        tokens = await self.db.get_session_tokens(session_id)
         return {
-            "input_tokens": sum(r["input_tokens"] for r in runs),
-            "output_tokens": sum(r["output_tokens"] for r in runs),
+            "input_tokens": tokens["input_tokens"],
+            "output_tokens": tokens["output_tokens"],
         }
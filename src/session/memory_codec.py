@@ -0,0 +1,280 @@
+"""Versioned, compressed encoding of smolagents memory steps.
+
+Each step is stored as a small header followed by a compressed JSON document
+holding only the fields CORA needs to rebuild the step. The layout is
+independent of smolagents' class internals, so upgrading smolagents does not
+invalidate stored sessions the way raw pickles do.
+
+Header: ``MAGIC`` (2 bytes) + schema version (1 byte) + compression id (1 byte).
+
+Fields that only exist for debugging and can be rebuilt by the agent
+(``model_input_messages``, the raw API response, observation images) are not
+stored. Payloads without the header are treated as legacy pickles.
+"""
+
+import base64
+import json
+import logging
+import pickle
+import zlib
+from typing import Any, Optional
+
+from smolagents import utils as smolagents_utils
+from smolagents.memory import (
+    ActionStep,
+    FinalAnswerStep,
+    PlanningStep,
+    SystemPromptStep,
+    TaskStep,
+    ToolCall,
+)
+from smolagents.models import ChatMessage
+from smolagents.monitoring import Timing, TokenUsage
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CM"
+SCHEMA_VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+# Tiny payloads grow when compressed; store them as-is
+_MIN_COMPRESS_SIZE = 256
+
+
+class MemoryCodecError(ValueError):
+    """Raised when a stored memory step cannot be decoded."""
+
+
+def _default_compression() -> int:
+    return COMPRESSION_ZSTD if zstandard is not None else COMPRESSION_ZLIB
+
+
+def _compress(data: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compress(data, 6)
+    return data
+
+
+def _decompress(data: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise MemoryCodecError("zstd-compressed step but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    if compression == COMPRESSION_NONE:
+        return data
+    raise MemoryCodecError(f"Unknown compression id {compression}")
+
+
+def _json_value(value: Any) -> Any:
+    """Best-effort JSON-safe copy of an arbitrary value (unknown types become str)."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(k): _json_value(v) for k, v in value.items()}
+    return str(value)
+
+
+def _encode_timing(timing: Optional[Timing]) -> Optional[list]:
+    if timing is None:
+        return None
+    return [timing.start_time, timing.end_time]
+
+
+def _decode_timing(data: Optional[list]) -> Timing:
+    if not data:
+        return Timing(start_time=0.0)
+    return Timing(start_time=data[0], end_time=data[1])
+
+
+def _encode_token_usage(token_usage: Optional[TokenUsage]) -> Optional[list]:
+    if token_usage is None:
+        return None
+    return [token_usage.input_tokens, token_usage.output_tokens]
+
+
+def _decode_token_usage(data: Optional[list]) -> Optional[TokenUsage]:
+    if data is None:
+        return None
+    return TokenUsage(input_tokens=data[0], output_tokens=data[1])
+
+
+def _encode_chat_message(message: Optional[ChatMessage]) -> Optional[dict]:
+    if message is None:
+        return None
+    encoded = {
+        "role": getattr(message.role, "value", message.role),
+        "content": _json_value(message.content),
+    }
+    if message.tool_calls:
+        encoded["tool_calls"] = [
+            {
+                "id": tc.id,
+                "type": tc.type,
+                "function": {
+                    "name": tc.function.name,
+                    "arguments": _json_value(tc.function.arguments),
+                    "description": tc.function.description,
+                },
+            }
+            for tc in message.tool_calls
+        ]
+    if message.token_usage is not None:
+        encoded["token_usage"] = _encode_token_usage(message.token_usage)
+    return encoded
+
+
+def _decode_chat_message(data: Optional[dict]) -> Optional[ChatMessage]:
+    if data is None:
+        return None
+    data = dict(data)
+    token_usage = _decode_token_usage(data.pop("token_usage", None))
+    return ChatMessage.from_dict(data, token_usage=token_usage)
+
+
+def _encode_error(error: Optional[Exception]) -> Optional[list]:
+    if error is None:
+        return None
+    return [type(error).__name__, str(getattr(error, "message", error))]
+
+
+def _decode_error(data: Optional[list]) -> Optional[Exception]:
+    if data is None:
+        return None
+    name, message = data
+    error_cls = getattr(smolagents_utils, name, None)
+    if not (isinstance(error_cls, type) and issubclass(error_cls, smolagents_utils.AgentError)):
+        error_cls = smolagents_utils.AgentError
+    # AgentError.__init__ logs through an AgentLogger; restore without re-logging
+    error = error_cls.__new__(error_cls)
+    Exception.__init__(error, message)
+    error.message = message
+    return error
+
+
+def _encode_fields(step: Any) -> dict:
+    if isinstance(step, ActionStep):
+        return {
+            "t": "action",
+            "step_number": step.step_number,
+            "timing": _encode_timing(step.timing),
+            "tool_calls": [
+                [tc.name, _json_value(tc.arguments), tc.id] for tc in step.tool_calls
+            ]
+            if step.tool_calls is not None
+            else None,
+            "error": _encode_error(step.error),
+            "model_output_message": _encode_chat_message(step.model_output_message),
+            "model_output": _json_value(step.model_output),
+            "code_action": step.code_action,
+            "observations": step.observations,
+            "action_output": _json_value(step.action_output),
+            "token_usage": _encode_token_usage(step.token_usage),
+            "is_final_answer": step.is_final_answer,
+        }
+    if isinstance(step, PlanningStep):
+        return {
+            "t": "planning",
+            "model_output_message": _encode_chat_message(step.model_output_message),
+            "plan": step.plan,
+            "timing": _encode_timing(step.timing),
+            "token_usage": _encode_token_usage(step.token_usage),
+        }
+    if isinstance(step, TaskStep):
+        return {"t": "task", "task": step.task}
+    if isinstance(step, FinalAnswerStep):
+        return {"t": "final", "output": _json_value(step.output)}
+    if isinstance(step, SystemPromptStep):
+        return {"t": "system", "system_prompt": step.system_prompt}
+    # Unknown step types keep working, at the cost of pickle's coupling
+    return {"t": "pickle", "data": base64.b64encode(pickle.dumps(step)).decode()}
+
+
+def _decode_fields(fields: dict) -> Any:
+    step_type = fields["t"]
+    if step_type == "action":
+        return ActionStep(
+            step_number=fields["step_number"],
+            timing=_decode_timing(fields["timing"]),
+            tool_calls=[
+                ToolCall(name=name, arguments=arguments, id=call_id)
+                for name, arguments, call_id in fields["tool_calls"]
+            ]
+            if fields["tool_calls"] is not None
+            else None,
+            error=_decode_error(fields["error"]),
+            model_output_message=_decode_chat_message(fields["model_output_message"]),
+            model_output=fields["model_output"],
+            code_action=fields["code_action"],
+            observations=fields["observations"],
+            action_output=fields["action_output"],
+            token_usage=_decode_token_usage(fields["token_usage"]),
+            is_final_answer=fields["is_final_answer"],
+        )
+    if step_type == "planning":
+        return PlanningStep(
+            model_input_messages=[],
+            model_output_message=_decode_chat_message(fields["model_output_message"]),
+            plan=fields["plan"],
+            timing=_decode_timing(fields["timing"]),
+            token_usage=_decode_token_usage(fields["token_usage"]),
+        )
+    if step_type == "task":
+        return TaskStep(task=fields["task"])
+    if step_type == "final":
+        return FinalAnswerStep(output=fields["output"])
+    if step_type == "system":
+        return SystemPromptStep(system_prompt=fields["system_prompt"])
+    if step_type == "pickle":
+        return pickle.loads(base64.b64decode(fields["data"]))
+    raise MemoryCodecError(f"Unknown memory step type {step_type!r}")
+
+
+def encode_step(step: Any, compression: Optional[int] = None) -> bytes:
+    """Encode one memory step into a versioned, compressed payload."""
+    if compression is None:
+        compression = _default_compression()
+    body = json.dumps(
+        _encode_fields(step), separators=(",", ":"), ensure_ascii=False
+    ).encode()
+    if len(body) < _MIN_COMPRESS_SIZE:
+        compression = COMPRESSION_NONE
+    header = MAGIC + bytes([SCHEMA_VERSION, compression])
+    return header + _compress(body, compression)
+
+
+def decode_step(payload: bytes) -> Any:
+    """Decode a payload produced by encode_step, or a legacy pickled step."""
+    if not payload.startswith(MAGIC):
+        try:
+            return pickle.loads(payload)
+        except Exception as e:
+            raise MemoryCodecError(f"Unreadable legacy pickled step: {e}") from e
+
+    if len(payload) < 4:
+        raise MemoryCodecError("Truncated memory step header")
+    version, compression = payload[2], payload[3]
+    if version > SCHEMA_VERSION:
+        raise MemoryCodecError(
+            f"Memory step schema version {version} is newer than supported {SCHEMA_VERSION}"
+        )
+    try:
+        fields = json.loads(_decompress(payload[4:], compression))
+        return _decode_fields(fields)
+    except MemoryCodecError:
+        raise
+    except Exception as e:
+        raise MemoryCodecError(f"Corrupted memory step: {e}") from e
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.exc import DBAPIError, IntegrityError, InterfaceError, OperationalError
+
+from src.session.database import SessionDatabase
+
+logger = logging.getLogger(__name__)
+
+StepKey = Tuple[str, int, str, int]
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether writing the same rows again may succeed.
+
+    The database rejects rows with constraint, data or SQL errors however
+    often they are retried; anything else, such as a lost connection or a
+    pool timeout, is worth another attempt.
+    """
+    if isinstance(error, (OperationalError, InterfaceError)):
+        return True
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated
+    return True
+
+
+class StepMetricsWriter:
+    """Bounded write-behind buffer for per-step token metrics.
+
+    Rows are keyed by (session_id, run_number, agent_name, step_number), so
+    a step reported twice is written once. The buffer is flushed as a single
+    multi-row upsert when it reaches the batch size or the flush interval
+    passes. ``submit`` is safe to call from agent worker threads.
+    """
+
+    def __init__(
+        self,
+        db: SessionDatabase,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_pending: int = 10_000,
+        max_attempts: int = 5,
+    ) -> None:
+        self._db = db
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._max_attempts = max_attempts
+        self._pending: Dict[StepKey, dict] = {}
+        # Failed writes of each pending row
+        self._attempts: Dict[StepKey, int] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+        self._flushes = 0
+        self._flushed_rows = 0
+        self._dropped_rows = 0
+        self._rejected_rows = 0
+        self._retried_rows = 0
+        self._failed_flushes = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the background flusher and drain everything still buffered.
+
+        The drain is retried like any flush; rows still pending after
+        ``max_attempts`` flushes are logged and counted as dropped.
+        """
+        if self._task is not None:
+            # Let a flush in flight finish rather than cancel it
+            self._stopping = True
+            self._wake()
+            await self._task
+            self._task = None
+        for _ in range(self._max_attempts):
+            with self._lock:
+                if not self._pending:
+                    return
+            await self.flush()
+        with self._lock:
+            lost = len(self._pending)
+            self._pending = {}
+            self._attempts.clear()
+            self._dropped_rows += lost
+        if lost:
+            logger.error(f"Dropping {lost} step metrics not written before shutdown")
+
+    def submit(
+        self,
+        session_id: str,
+        run_number: int,
+        step_number: int,
+        step_type: str,
+        input_tokens: int,
+        output_tokens: int,
+        agent_name: str = "",
+    ) -> bool:
+        """Buffer a step row; returns False if it was dropped because the buffer is full."""
+        key = (session_id, run_number, agent_name, step_number)
+        row = {
+            "session_id": session_id,
+            "run_number": run_number,
+            "agent_name": agent_name,
+            "step_number": step_number,
+            "step_type": step_type,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+        }
+        with self._lock:
+            if key not in self._pending and len(self._pending) >= self._max_pending:
+                self._dropped_rows += 1
+                logger.warning(
+                    f"Step metrics buffer full, dropping step {step_number} "
+                    f"of run {run_number} for session {session_id}"
+                )
+                return False
+            self._pending[key] = row
+            should_wake = len(self._pending) >= self._batch_size
+
+        if should_wake:
+            self._wake()
+        return True
+
+    def _wake(self) -> None:
+        # call_soon_threadsafe works from both the loop thread and agent threads
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=self._flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch = self._pending
+                self._pending = {}
+
+            try:
+                await self._write(batch)
+            except asyncio.CancelledError:
+                # Upserts are idempotent, so rows written already may come back
+                self._restore(batch)
+                raise
+
+    async def _write(self, batch: Dict[StepKey, dict]) -> None:
+        error = await self._save(batch)
+        if error is None:
+            return
+        sessions = {key[0] for key in batch}
+        if isinstance(error, IntegrityError) and len(sessions) > 1:
+            # One session's rows, e.g. of a session deleted meanwhile,
+            # fail the whole statement; write each session on its own
+            for session_id in sessions:
+                rows = {
+                    key: row for key, row in batch.items() if key[0] == session_id
+                }
+                error = await self._save(rows)
+                if error is not None:
+                    self._handle_failure(rows, error)
+            return
+        self._handle_failure(batch, error)
+
+    async def _save(self, batch: Dict[StepKey, dict]) -> Optional[Exception]:
+        started = time.perf_counter()
+        try:
+            await self._db.save_step_tokens(list(batch.values()))
+        except Exception as e:
+            self._failed_flushes += 1
+            return e
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._flushes += 1
+        self._flushed_rows += len(batch)
+        self._last_flush_ms = elapsed_ms
+        self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        with self._lock:
+            for key in batch:
+                self._attempts.pop(key, None)
+        return None
+
+    def _handle_failure(self, batch: Dict[StepKey, dict], error: Exception) -> None:
+        if _is_transient(error):
+            logger.warning(f"Failed to flush {len(batch)} step metrics: {error}")
+            self._requeue(batch)
+            return
+        sessions = sorted({key[0] for key in batch})
+        logger.error(
+            f"Dropping {len(batch)} step metrics of sessions {sessions} "
+            f"rejected by the database: {error}"
+        )
+        with self._lock:
+            for key in batch:
+                self._attempts.pop(key, None)
+            self._rejected_rows += len(batch)
+            self._dropped_rows += len(batch)
+
+    def _restore(self, batch: Dict[StepKey, dict]) -> None:
+        with self._lock:
+            for key, row in batch.items():
+                # Newer values win; the buffer may overshoot max_pending briefly
+                self._pending.setdefault(key, row)
+
+    def _requeue(self, batch: Dict[StepKey, dict]) -> None:
+        expired = 0
+        with self._lock:
+            for key, row in batch.items():
+                if key in self._pending:
+                    # A newer value arrived while the flush was in flight
+                    self._attempts.pop(key, None)
+                    continue
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= self._max_attempts:
+                    self._attempts.pop(key, None)
+                    expired += 1
+                    continue
+                if len(self._pending) >= self._max_pending:
+                    self._attempts.pop(key, None)
+                    self._dropped_rows += 1
+                    continue
+                self._attempts[key] = attempts
+                self._pending[key] = row
+                self._retried_rows += 1
+            self._dropped_rows += expired
+        if expired:
+            logger.error(
+                f"Dropping {expired} step metrics after "
+                f"{self._max_attempts} failed attempts"
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "flushes": self._flushes,
+            "flushed_rows": self._flushed_rows,
+            "dropped_rows": self._dropped_rows,
+            "rejected_rows": self._rejected_rows,
+            "retried_rows": self._retried_rows,
+            "failed_flushes": self._failed_flushes,
+            "last_flush_ms": round(self._last_flush_ms, 3),
+            "max_flush_ms": round(self._max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self._flushes, 3)
+            if self._flushes
+            else 0.0,
+        }
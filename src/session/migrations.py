@@ -0,0 +1,184 @@
+"""Ordered, idempotent schema revisions applied on top of ``create_all``.
+
+``Base.metadata.create_all`` only creates missing tables, so indexes and
+constraints added to existing tables are shipped here. Each revision runs
+once per database and is recorded in ``schema_revisions``.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.session.models import SchemaRevision
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key so concurrent workers serialize on startup migrations
+_MIGRATION_LOCK_KEY = 0x636F7261
+
+
+@dataclass(frozen=True)
+class Revision:
+    revision: int
+    description: str
+    statements: List[str]
+
+
+# Rebuild token rollups from raw agent_run_metrics; {where} optionally scopes
+# the source rows (e.g. "WHERE session_id = :session_id")
+ROLLUP_REBUILD_STATEMENTS = [
+    """
+    INSERT INTO agent_run_token_totals
+        (session_id, run_number, input_tokens, output_tokens, total_tokens,
+         step_count, updated_at)
+    SELECT session_id, run_number, SUM(input_tokens), SUM(output_tokens),
+           SUM(total_tokens), COUNT(*), NOW()
+    FROM agent_run_metrics {where}
+    GROUP BY session_id, run_number
+    ON CONFLICT (session_id, run_number) DO UPDATE SET
+        input_tokens = EXCLUDED.input_tokens,
+        output_tokens = EXCLUDED.output_tokens,
+        total_tokens = EXCLUDED.total_tokens,
+        step_count = EXCLUDED.step_count,
+        updated_at = EXCLUDED.updated_at
+    """,
+    """
+    INSERT INTO session_token_totals
+        (session_id, input_tokens, output_tokens, total_tokens, updated_at)
+    SELECT session_id, SUM(input_tokens), SUM(output_tokens),
+           SUM(total_tokens), NOW()
+    FROM agent_run_metrics {where}
+    GROUP BY session_id
+    ON CONFLICT (session_id) DO UPDATE SET
+        input_tokens = EXCLUDED.input_tokens,
+        output_tokens = EXCLUDED.output_tokens,
+        total_tokens = EXCLUDED.total_tokens,
+        updated_at = EXCLUDED.updated_at
+    """,
+]
+
+
+REVISIONS: List[Revision] = [
+    Revision(
+        revision=1,
+        description="Unique step-token key and session_id lookup indexes",
+        statements=[
+            # Drop duplicate step rows left by the old SELECT-then-INSERT path
+            """
+            DELETE FROM agent_run_metrics a
+            USING agent_run_metrics b
+            WHERE a.session_id = b.session_id
+              AND a.run_number = b.run_number
+              AND a.step_number = b.step_number
+              AND a.id < b.id
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_agent_run_metrics_session_run_step
+            ON agent_run_metrics (session_id, run_number, step_number)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_messages_session_id
+            ON messages (session_id)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_sessions_updated_at_id
+            ON sessions (updated_at, id)
+            """,
+        ],
+    ),
+    Revision(
+        revision=2,
+        description="Backfill per-run and per-session token rollups",
+        statements=[
+            ROLLUP_REBUILD_STATEMENTS[0].format(where=""),
+            ROLLUP_REBUILD_STATEMENTS[1].format(where=""),
+        ],
+    ),
+    Revision(
+        revision=3,
+        description="Index messages by (session_id, id) for history pagination",
+        statements=[
+            """
+            CREATE INDEX IF NOT EXISTS ix_messages_session_id_id
+            ON messages (session_id, id)
+            """,
+            # Superseded by the composite index above
+            "DROP INDEX IF EXISTS ix_messages_session_id",
+        ],
+    ),
+    Revision(
+        revision=4,
+        description="Per-session run counter",
+        statements=[
+            """
+            ALTER TABLE sessions
+            ADD COLUMN IF NOT EXISTS last_run_number INTEGER NOT NULL DEFAULT 0
+            """,
+            """
+            UPDATE sessions s SET last_run_number = r.max_run
+            FROM (
+                SELECT session_id, MAX(run_number) AS max_run
+                FROM (
+                    SELECT session_id, run_number FROM agent_run_metrics
+                    UNION ALL
+                    SELECT session_id, run_number FROM agent_steps
+                ) runs
+                GROUP BY session_id
+            ) r
+            WHERE r.session_id = s.id AND s.last_run_number < r.max_run
+            """,
+        ],
+    ),
+    Revision(
+        revision=5,
+        description="Per-sub-agent step tokens",
+        statements=[
+            """
+            ALTER TABLE agent_run_metrics
+            ADD COLUMN IF NOT EXISTS agent_name VARCHAR NOT NULL DEFAULT ''
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_agent_run_metrics_session_run_agent_step
+            ON agent_run_metrics (session_id, run_number, agent_name, step_number)
+            """,
+            "DROP INDEX IF EXISTS uq_agent_run_metrics_session_run_step",
+        ],
+    ),
+    Revision(
+        revision=6,
+        description="Timed-out session status",
+        statements=[
+            # SQLAlchemy stores enum member names
+            "ALTER TYPE sessionstatus ADD VALUE IF NOT EXISTS 'TIMED_OUT'",
+        ],
+    ),
+]
+
+
+async def apply_revisions(conn: AsyncConnection) -> None:
+    """Apply every revision not yet recorded in ``schema_revisions``."""
+    await conn.execute(
+        text("SELECT pg_advisory_xact_lock(:key)"), {"key": _MIGRATION_LOCK_KEY}
+    )
+    result = await conn.execute(select(SchemaRevision.revision))
+    applied = set(result.scalars().all())
+
+    for revision in REVISIONS:
+        if revision.revision in applied:
+            continue
+        logger.info(
+            f"Applying schema revision {revision.revision}: {revision.description}"
+        )
+        for statement in revision.statements:
+            await conn.execute(text(statement))
+        await conn.execute(
+            insert(SchemaRevision).values(
+                revision=revision.revision,
+                description=revision.description,
+                applied_at=datetime.now(),
+            )
+        )
@@ -10,9 +10,11 @@ from sqlalchemy import (
     DateTime,
     Enum as SQLEnum,
     ForeignKey,
+    Index,
     Integer,
     String,
     LargeBinary,
+    Text,
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
@@ -27,6 +29,8 @@ class SessionStatus(str, Enum):
     IDLE = "idle"
     RUNNING = "running"
     COMPLETED = "completed"
+    # The last run was stopped at its run or step deadline
+    TIMED_OUT = "timed_out"
 
 
 class Base(DeclarativeBase):
@@ -35,6 +39,7 @@ class Base(DeclarativeBase):
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (Index("ix_sessions_updated_at_id", "updated_at", "id"),)
 
     id: Mapped[str] = mapped_column(String, primary_key=True)  # UUID
     title: Mapped[str] = mapped_column(String, default="New Session")
@@ -46,24 +51,35 @@ class Session(Base):
         DateTime, default=datetime.now, onupdate=datetime.now
     )
     is_active: Mapped[bool] = mapped_column(Boolean, default=False)
-    agent_steps: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    # Per-session run counter; incremented atomically by begin_run
+    last_run_number: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0"
+    )
+    # Legacy pickled memory; never loaded unless explicitly selected
+    agent_steps: Mapped[Optional[bytes]] = mapped_column(
+        LargeBinary, nullable=True, deferred=True, deferred_raiseload=True
+    )
 
+    # Not loaded implicitly: query messages/metrics explicitly (paginated)
     messages: Mapped[List[Message]] = relationship(
         "Message",
         back_populates="session",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise_on_sql",
     )
     metrics: Mapped[List[AgentRunMetrics]] = relationship(
         "AgentRunMetrics",
         back_populates="session",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise_on_sql",
     )
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_session_id_id", "session_id", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     session_id: Mapped[str] = mapped_column(
@@ -73,17 +89,32 @@ class Message(Base):
     content: Mapped[str] = mapped_column(String)
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
 
-    session: Mapped[Session] = relationship("Session", back_populates="messages")
+    session: Mapped[Session] = relationship(
+        "Session", back_populates="messages", lazy="raise_on_sql"
+    )
 
 
 class AgentRunMetrics(Base):
     __tablename__ = "agent_run_metrics"
+    # The unique index's session_id prefix also serves FK lookups by session
+    __table_args__ = (
+        Index(
+            "uq_agent_run_metrics_session_run_agent_step",
+            "session_id",
+            "run_number",
+            "agent_name",
+            "step_number",
+            unique=True,
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     session_id: Mapped[str] = mapped_column(
         String, ForeignKey("sessions.id", ondelete="CASCADE")
     )
     run_number: Mapped[int] = mapped_column(Integer)
+    # Sub-agent the step belongs to; "" for the session's own agent
+    agent_name: Mapped[str] = mapped_column(String, default="", server_default="")
     step_number: Mapped[int] = mapped_column(Integer, default=1)
     step_type: Mapped[str] = mapped_column(String)
     input_tokens: Mapped[int] = mapped_column(Integer, default=0)
@@ -91,4 +122,107 @@ class AgentRunMetrics(Base):
     total_tokens: Mapped[int] = mapped_column(Integer, default=0)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
 
-    session: Mapped[Session] = relationship("Session", back_populates="metrics")
+    session: Mapped[Session] = relationship(
+        "Session", back_populates="metrics", lazy="raise_on_sql"
+    )
+
+
+class AgentRunTokenTotals(Base):
+    """Per-run token rollup, maintained with every agent_run_metrics write."""
+
+    __tablename__ = "agent_run_token_totals"
+
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True
+    )
+    run_number: Mapped[int] = mapped_column(Integer, primary_key=True)
+    input_tokens: Mapped[int] = mapped_column(Integer, default=0)
+    output_tokens: Mapped[int] = mapped_column(Integer, default=0)
+    total_tokens: Mapped[int] = mapped_column(Integer, default=0)
+    step_count: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class SessionTokenTotals(Base):
+    """Per-session token rollup, maintained with every agent_run_metrics write."""
+
+    __tablename__ = "session_token_totals"
+
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True
+    )
+    input_tokens: Mapped[int] = mapped_column(Integer, default=0)
+    output_tokens: Mapped[int] = mapped_column(Integer, default=0)
+    total_tokens: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class AgentMemoryStep(Base):
+    """One serialized agent memory step; rows are append-only per session."""
+
+    __tablename__ = "agent_steps"
+    __table_args__ = (
+        Index(
+            "uq_agent_steps_session_step_index",
+            "session_id",
+            "step_index",
+            unique=True,
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("sessions.id", ondelete="CASCADE")
+    )
+    # Position of the step in agent.memory.steps across all runs
+    step_index: Mapped[int] = mapped_column(Integer)
+    run_number: Mapped[int] = mapped_column(Integer)
+    step_type: Mapped[str] = mapped_column(String)
+    payload: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class RunEvent(Base):
+    """One SSE event of a finished run, kept so clients can replay it after reconnecting."""
+
+    __tablename__ = "run_events"
+
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True
+    )
+    run_number: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # Position of the event within its run, as sent in the SSE id field
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True)
+    event_type: Mapped[str] = mapped_column(String)
+    # JSON-encoded event body, exactly as sent to the client
+    data: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class ActiveRun(Base):
+    """The run in progress for a session and the worker process that owns it.
+
+    Shared by every worker, so a request landing on any of them can find
+    the run. The owner refreshes ``heartbeat_at`` while the run is alive;
+    a row whose heartbeat has gone stale belongs to a dead worker and can
+    be claimed again.
+    """
+
+    __tablename__ = "active_runs"
+
+    # No foreign key: a run is claimed before its session is looked up, and
+    # rows of deleted sessions go stale like any other
+    session_id: Mapped[str] = mapped_column(String, primary_key=True)
+    worker_id: Mapped[str] = mapped_column(String)
+    run_number: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # JSON of the run's RunRecord.to_dict(), as of the last heartbeat
+    snapshot: Mapped[str] = mapped_column(Text, default="{}")
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class SchemaRevision(Base):
+    __tablename__ = "schema_revisions"
+
+    revision: Mapped[int] = mapped_column(Integer, primary_key=True)
+    description: Mapped[str] = mapped_column(String)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
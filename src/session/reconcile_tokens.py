@@ -0,0 +1,41 @@
+"""Rebuild the token rollup tables from raw agent_run_metrics rows.
+
+Usage:
+    cora-reconcile-tokens [--session-id SESSION_ID]
+"""
+
+import argparse
+import asyncio
+from typing import Optional
+
+from src.session.database import SessionDatabase, dispose_engines
+from src.utils.logging import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+
+async def reconcile(session_id: Optional[str] = None) -> None:
+    db = SessionDatabase()
+    try:
+        await db.init_db()
+        await db.rebuild_token_rollups(session_id)
+    finally:
+        await dispose_engines()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild token rollups")
+    parser.add_argument(
+        "--session-id", help="Only rebuild rollups for this session (default: all)"
+    )
+    args = parser.parse_args()
+
+    setup_logging()
+    scope = f"session {args.session_id}" if args.session_id else "all sessions"
+    logger.info(f"Rebuilding token rollups for {scope}")
+    asyncio.run(reconcile(args.session_id))
+    logger.info("Token rollups rebuilt")
+
+
+if __name__ == "__main__":
+    main()
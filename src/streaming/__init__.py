@@ -0,0 +1,33 @@
+from src.streaming.bus import (
+    EventBus,
+    InMemoryEventBus,
+    PostgresEventBus,
+    create_event_bus,
+)
+from src.streaming.channel import OverflowPolicy, StepEventChannel
+from src.streaming.deltas import DeltaRelay, StreamLatencyStats
+from src.streaming.payloads import StepPayloadCapper
+from src.streaming.replay import (
+    LoggedEvent,
+    RunEventLog,
+    RunEventRegistry,
+    format_event_id,
+    parse_event_id,
+)
+
+__all__ = [
+    "EventBus",
+    "InMemoryEventBus",
+    "PostgresEventBus",
+    "create_event_bus",
+    "OverflowPolicy",
+    "StepEventChannel",
+    "DeltaRelay",
+    "StreamLatencyStats",
+    "StepPayloadCapper",
+    "LoggedEvent",
+    "RunEventLog",
+    "RunEventRegistry",
+    "format_event_id",
+    "parse_event_id",
+]
@@ -0,0 +1,342 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from src.streaming.replay import LoggedEvent
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = "cora_run_events"
+COMMANDS_CHANNEL = "cora_run_commands"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+_MAX_PAYLOAD_BYTES = 7900
+_MAX_BATCH = 200
+
+CommandHandler = Callable[[dict], None]
+StillRunning = Callable[[], Awaitable[bool]]
+
+
+class EventBus(ABC):
+    """Carries run events and commands between workers.
+
+    The worker that owns a run publishes the events it logs; other workers
+    follow them for their own clients, and send the owner commands such as
+    interrupts. Commands are handled by the ``on_command`` handler of the
+    worker they are addressed to.
+    """
+
+    def __init__(self, worker_id: str) -> None:
+        self.worker_id = worker_id
+        self._command_handler: Optional[CommandHandler] = None
+
+    def on_command(self, handler: CommandHandler) -> None:
+        self._command_handler = handler
+
+    def _handle_command(self, command: dict) -> None:
+        if self._command_handler is None:
+            return
+        try:
+            self._command_handler(command)
+        except Exception as e:
+            logger.warning(f"Failed to handle run command {command}: {e}")
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def publish(self, session_id: str, run_number: int, event: LoggedEvent) -> None:
+        """Publish an event of a run this worker owns. Thread-safe."""
+
+    def publish_closed(self, session_id: str, run_number: int, last_seq: int) -> None:
+        """Publish that a run logged its last event. Thread-safe."""
+
+    @abstractmethod
+    def follow(
+        self,
+        session_id: str,
+        run_number: int,
+        after_seq: int,
+        still_running: StillRunning,
+    ) -> AsyncIterator[LoggedEvent]:
+        """Yield events of another worker's run after ``after_seq`` until it ends.
+
+        ``still_running()`` tells whether the owner still runs it, for runs
+        that go quiet without being closed.
+        """
+
+    @abstractmethod
+    async def send_command(self, worker_id: str, command: dict) -> None:
+        """Send ``command`` to the worker ``worker_id``."""
+
+    def stats(self) -> dict:
+        return {"worker_id": self.worker_id}
+
+
+class InMemoryEventBus(EventBus):
+    """Bus for a single worker process, which owns every run."""
+
+    async def follow(
+        self,
+        session_id: str,
+        run_number: int,
+        after_seq: int,
+        still_running: StillRunning,
+    ) -> AsyncIterator[LoggedEvent]:
+        return
+        yield
+
+    async def send_command(self, worker_id: str, command: dict) -> None:
+        if worker_id == self.worker_id:
+            self._handle_command(command)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "backend": "memory"}
+
+
+class PostgresEventBus(EventBus):
+    """Bus over Postgres LISTEN/NOTIFY on the session database.
+
+    Published events are batched by a background task, which stores them
+    in ``run_events`` and notifies them in one transaction, so a follower
+    can always read an event it was notified of. Model output deltas are
+    only notified, and dropped if too large for a notification; their text
+    arrives again with the finished step. Other events too large to notify
+    are read back from the database. Notifications sent while the listening
+    connection is down are lost, so followers catch up from the database
+    when it reconnects.
+    """
+
+    def __init__(self, db, worker_id: str, idle_timeout: float = 5.0) -> None:
+        super().__init__(worker_id)
+        self._db = db
+        self._idle_timeout = idle_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._publisher: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._listening = False
+        # (session_id, run_number) -> queues of the run's local followers
+        self._followers: Dict[Tuple[str, int], Set[asyncio.Queue]] = {}
+        self._published = 0
+        self._failed_publishes = 0
+        self._dropped_deltas = 0
+        self._received = 0
+        self._reconnects = 0
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._outbox = asyncio.Queue()
+        self._publisher = asyncio.create_task(self._publish_loop())
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        """Publish what is still queued, then stop listening."""
+        if self._publisher is not None:
+            self._put(None)
+            try:
+                await asyncio.wait_for(self._publisher, timeout=10.0)
+            except Exception as e:
+                logger.warning(f"Event bus did not flush before shutdown: {e}")
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+
+    def publish(self, session_id: str, run_number: int, event: LoggedEvent) -> None:
+        self._put((session_id, run_number, event.seq, event.event_type, event.data))
+
+    def publish_closed(self, session_id: str, run_number: int, last_seq: int) -> None:
+        self._put((session_id, run_number, last_seq, None, None))
+
+    def _put(self, item: Optional[tuple]) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._outbox.put_nowait, item)
+
+    async def _publish_loop(self) -> None:
+        while True:
+            batch = [await self._outbox.get()]
+            while not self._outbox.empty() and len(batch) < _MAX_BATCH:
+                batch.append(self._outbox.get_nowait())
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+            events, payloads = self._encode(batch)
+            if payloads:
+                try:
+                    await self._db.publish_run_events(
+                        events, EVENTS_CHANNEL, payloads
+                    )
+                    self._published += len(payloads)
+                except Exception as e:
+                    self._failed_publishes += len(payloads)
+                    logger.warning(f"Failed to publish run events: {e}")
+            if stopping:
+                return
+
+    def _encode(
+        self, batch: List[tuple]
+    ) -> Tuple[List[Tuple[str, int, int, str, str]], List[str]]:
+        events = []
+        payloads = []
+        for session_id, run_number, seq, event_type, data in batch:
+            if event_type is None:
+                payloads.append(
+                    json.dumps({"s": session_id, "r": run_number, "closed": seq})
+                )
+                continue
+            if event_type != "delta":
+                events.append((session_id, run_number, seq, event_type, data))
+            message = {"s": session_id, "r": run_number, "q": seq, "t": event_type}
+            payload = json.dumps({**message, "d": data})
+            if len(payload.encode()) > _MAX_PAYLOAD_BYTES:
+                if event_type == "delta":
+                    self._dropped_deltas += 1
+                    continue
+                payload = json.dumps(message)
+            payloads.append(payload)
+        return events, payloads
+
+    async def _listen(self) -> None:
+        delay = 0.5
+        while True:
+            conn = None
+            lost = asyncio.Event()
+            try:
+                # A dedicated connection for as long as it stays up
+                conn = await self._db.engine.connect()
+                raw = await conn.get_raw_connection()
+                driver = raw.driver_connection
+                driver.add_termination_listener(lambda _: lost.set())
+                await driver.add_listener(EVENTS_CHANNEL, self._on_event)
+                await driver.add_listener(COMMANDS_CHANNEL, self._on_command)
+                self._listening = True
+                delay = 0.5
+                self._wake_followers()
+                await lost.wait()
+                self._reconnects += 1
+                logger.warning("Event bus connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event bus connection failed: {e}")
+            finally:
+                self._listening = False
+                if conn is not None:
+                    try:
+                        # Never hand a listening connection back to the pool
+                        await conn.invalidate()
+                        await conn.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 10.0)
+
+    def _on_event(self, connection, pid: int, channel: str, payload: str) -> None:
+        self._received += 1
+        message = json.loads(payload)
+        for queue in self._followers.get((message["s"], message["r"]), ()):
+            queue.put_nowait(message)
+
+    def _on_command(self, connection, pid: int, channel: str, payload: str) -> None:
+        command = json.loads(payload)
+        if command.pop("worker_id", None) == self.worker_id:
+            self._handle_command(command)
+
+    def _wake_followers(self) -> None:
+        # Makes every follower re-read the database
+        for queues in self._followers.values():
+            for queue in queues:
+                queue.put_nowait(None)
+
+    async def follow(
+        self,
+        session_id: str,
+        run_number: int,
+        after_seq: int,
+        still_running: StillRunning,
+    ) -> AsyncIterator[LoggedEvent]:
+        key = (session_id, run_number)
+        queue: asyncio.Queue = asyncio.Queue()
+        # Listening before reading the database, so no event falls in between
+        self._followers.setdefault(key, set()).add(queue)
+        try:
+            catch_up = True
+            finished = False
+            while True:
+                if catch_up:
+                    stored = await self._db.get_run_events(
+                        session_id, run_number, after_seq
+                    )
+                    for seq, event_type, data in stored:
+                        after_seq = seq
+                        yield LoggedEvent.build(run_number, seq, event_type, data)
+                    catch_up = False
+                if finished:
+                    return
+                try:
+                    message = await asyncio.wait_for(queue.get(), self._idle_timeout)
+                except asyncio.TimeoutError:
+                    # A quiet run, or one whose owner died before closing it
+                    if not await still_running():
+                        finished = catch_up = True
+                    continue
+                if message is None:
+                    catch_up = True
+                elif "closed" in message:
+                    finished = catch_up = True
+                elif message["q"] <= after_seq:
+                    continue
+                elif "d" not in message:
+                    catch_up = True
+                else:
+                    after_seq = message["q"]
+                    yield LoggedEvent.build(
+                        run_number, after_seq, message["t"], message["d"]
+                    )
+        finally:
+            queues = self._followers.get(key)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._followers[key]
+
+    async def send_command(self, worker_id: str, command: dict) -> None:
+        await self._db.notify(
+            COMMANDS_CHANNEL, json.dumps({**command, "worker_id": worker_id})
+        )
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "backend": "postgres",
+            "listening": self._listening,
+            "pending": self._outbox.qsize() if self._outbox is not None else 0,
+            "published": self._published,
+            "failed_publishes": self._failed_publishes,
+            "dropped_deltas": self._dropped_deltas,
+            "received": self._received,
+            "reconnects": self._reconnects,
+            "followers": sum(len(queues) for queues in self._followers.values()),
+        }
+
+
+def create_event_bus(db) -> EventBus:
+    """Build the bus matching RUN_REGISTRY_BACKEND (``memory`` or ``postgres``)."""
+    from src.config import get_config
+
+    config = get_config()
+    if config.run_registry_backend == "postgres":
+        return PostgresEventBus(db, config.worker_id)
+    return InMemoryEventBus(config.worker_id)
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import AsyncIterator, Deque, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fields that carry bulky tool output and may be shed under backpressure
+HEAVY_FIELDS = ("observations", "model_output")
+COALESCED_PREVIEW_CHARS = 2000
+
+
+class OverflowPolicy(str, Enum):
+    # Shrink the backlog: drop superseded events, truncate old observations to a preview
+    COALESCE = "coalesce"
+    # Strip observations from the oldest events, then drop the oldest events
+    DROP_OLDEST = "drop_oldest"
+    # Make the publishing (agent) thread wait until the client catches up
+    BLOCK = "block"
+
+
+@dataclass
+class _PendingEvent:
+    event: dict
+    # JSON body, reused by the consumer so events are not encoded twice
+    data: str
+    published_at: float
+    shrunk: bool = False
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+class StepEventChannel:
+    """Bounded, thread-safe channel carrying one run's step events to the SSE stream.
+
+    Producers (the agent thread) call ``publish``; completion is signalled by
+    ``close`` and ends iteration once the backlog is drained, so consumers
+    never poll. The backlog is bounded in bytes and ``policy`` decides what
+    happens when a slow client lets it fill up.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        max_pending_bytes: int = 4 * 1024 * 1024,
+        policy: OverflowPolicy = OverflowPolicy.COALESCE,
+        block_timeout: float = 30.0,
+    ) -> None:
+        self._loop = loop
+        self._max_pending_bytes = max_pending_bytes
+        self._policy = policy
+        self._block_timeout = block_timeout
+        self._pending: Deque[_PendingEvent] = deque()
+        self._pending_bytes = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._ready = asyncio.Event()
+
+        self._published = 0
+        self._delivered = 0
+        self._dropped = 0
+        self._shrunk = 0
+        self._coalesced = 0
+        self._blocked_ms = 0.0
+        self._last_lag_ms = 0.0
+        self._max_lag_ms = 0.0
+        self._total_lag_ms = 0.0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def publish(self, event: dict, data: Optional[str] = None) -> bool:
+        """Queue an event, optionally with its already encoded JSON body.
+
+        Returns False if the channel is already closed.
+        """
+        if data is None:
+            data = json.dumps(event)
+        pending = _PendingEvent(event, data, time.monotonic())
+        with self._lock:
+            if self._closed:
+                return False
+            if self._pending_bytes + pending.size > self._max_pending_bytes:
+                self._make_room(pending)
+                if self._closed:
+                    return False
+            self._pending.append(pending)
+            self._pending_bytes += pending.size
+            self._published += 1
+        self._notify()
+        return True
+
+    def close(self) -> None:
+        """Signal completion; iteration stops after the backlog is delivered."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._space.notify_all()
+        self._notify()
+
+    def _notify(self) -> None:
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    def _on_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _make_room(self, incoming: _PendingEvent) -> None:
+        # Called with the lock held
+        budget = self._max_pending_bytes - incoming.size
+        if self._policy == OverflowPolicy.BLOCK and not self._on_loop_thread():
+            started = time.monotonic()
+            deadline = started + self._block_timeout
+            while self._pending_bytes > budget and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning("Blocked step publisher timed out; shedding backlog")
+                    break
+                self._space.wait(remaining)
+            self._blocked_ms += (time.monotonic() - started) * 1000
+            if self._pending_bytes <= budget:
+                return
+
+        if self._policy == OverflowPolicy.COALESCE:
+            self._drop_superseded(incoming.event)
+            self._shrink_oldest(budget, COALESCED_PREVIEW_CHARS)
+        else:
+            self._shrink_oldest(budget, 0)
+        while self._pending and self._pending_bytes > budget:
+            dropped = self._pending.popleft()
+            self._pending_bytes -= dropped.size
+            self._dropped += 1
+
+    def _drop_superseded(self, incoming: dict) -> None:
+        # A later event for the same step replaces earlier pending ones, and a
+        # finished step replaces the model output deltas streamed before it
+        latest = {}
+        finished = set()
+        for index, event in enumerate(
+            [pending.event for pending in self._pending] + [incoming]
+        ):
+            key = self._step_key(event)
+            if key is not None:
+                latest[key] = index
+                finished.add(key[:2])
+        kept: Deque[_PendingEvent] = deque()
+        for index, pending in enumerate(self._pending):
+            key = self._step_key(pending.event)
+            if (key is not None and latest[key] != index) or (
+                pending.event.get("type") == "delta"
+                and self._step_of(pending.event) in finished
+            ):
+                self._pending_bytes -= pending.size
+                self._coalesced += 1
+                continue
+            kept.append(pending)
+        self._pending = kept
+
+    @staticmethod
+    def _step_of(event: dict) -> tuple:
+        return (event.get("run_number"), event.get("step_number"))
+
+    @classmethod
+    def _step_key(cls, event: dict) -> Optional[tuple]:
+        # Deltas are additive, so they never supersede one another
+        if event.get("step_number") is None or event.get("type") == "delta":
+            return None
+        return cls._step_of(event) + (event.get("type"),)
+
+    def _shrink_oldest(self, budget: int, preview_chars: int) -> None:
+        for pending in self._pending:
+            if self._pending_bytes <= budget:
+                return
+            if pending.shrunk:
+                continue
+            event = dict(pending.event)
+            changed = False
+            for field in HEAVY_FIELDS:
+                value = event.get(field)
+                if isinstance(value, str) and len(value) > preview_chars:
+                    event[field] = value[:preview_chars]
+                    event[f"{field}_truncated"] = True
+                    changed = True
+            if not changed:
+                continue
+            data = json.dumps(event)
+            self._pending_bytes += len(data) - pending.size
+            pending.event, pending.data, pending.shrunk = event, data, True
+            self._shrunk += 1
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        async for event, _ in self.encoded():
+            yield event
+
+    async def encoded(self) -> AsyncIterator[Tuple[dict, str]]:
+        """Yield (event, JSON body) pairs until the channel is closed and drained."""
+        while True:
+            with self._lock:
+                pending = self._pending.popleft() if self._pending else None
+                if pending is not None:
+                    self._pending_bytes -= pending.size
+                    self._space.notify_all()
+                closed = self._closed
+            if pending is not None:
+                self._record_delivery(pending)
+                yield pending.event, pending.data
+                continue
+            if closed:
+                return
+            self._ready.clear()
+            # Re-check after clearing so a publish between the two is not missed
+            with self._lock:
+                has_pending = bool(self._pending) or self._closed
+            if not has_pending:
+                await self._ready.wait()
+
+    def _record_delivery(self, pending: _PendingEvent) -> None:
+        lag_ms = (time.monotonic() - pending.published_at) * 1000
+        self._delivered += 1
+        self._last_lag_ms = lag_ms
+        self._max_lag_ms = max(self._max_lag_ms, lag_ms)
+        self._total_lag_ms += lag_ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+            pending_bytes = self._pending_bytes
+        return {
+            "policy": self._policy.value,
+            "published": self._published,
+            "delivered": self._delivered,
+            "pending": pending,
+            "pending_bytes": pending_bytes,
+            "dropped_events": self._dropped,
+            "shrunk_events": self._shrunk,
+            "coalesced_events": self._coalesced,
+            "blocked_ms": round(self._blocked_ms, 3),
+            "last_lag_ms": round(self._last_lag_ms, 3),
+            "max_lag_ms": round(self._max_lag_ms, 3),
+            "avg_lag_ms": round(self._total_lag_ms / self._delivered, 3)
+            if self._delivered
+            else 0.0,
+        }
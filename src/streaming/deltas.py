@@ -0,0 +1,189 @@
+import threading
+import time
+from typing import Any, AsyncIterable, Callable, Iterable, Optional
+
+from smolagents.memory import ActionStep, FinalAnswerStep, PlanningStep
+from smolagents.models import ChatMessageStreamDelta
+
+
+class DeltaRelay:
+    """Relays an agent's streamed model output as coalesced ``delta`` events.
+
+    Consumes the generator returned by ``agent.run(..., stream=True)`` on the
+    agent thread, or the one from ``run_agent_async`` on the event loop. Token deltas are buffered and published as one event per
+    ``max_delay`` seconds or ``max_chars`` characters, whichever comes
+    first. ``on_step`` must be called from the agent's step callback before
+    the step event is published: smolagents runs callbacks before yielding
+    the step, so that is the only point where buffered text can be flushed
+    ahead of it. Each delta carries the ``step_number`` of the step event
+    that will follow it and its phase (``planning`` or ``action``), so
+    clients can render text as it is generated and replace it with the
+    finished step.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[dict], None],
+        run_number: int,
+        planning_interval: Optional[int] = None,
+        max_delay: float = 0.1,
+        max_chars: int = 1024,
+    ) -> None:
+        self._publish = publish
+        self._run_number = run_number
+        self.planning_interval = planning_interval
+        self._max_delay = max_delay
+        self._max_chars = max_chars
+
+        self._parts: list = []
+        self._buffered_chars = 0
+        self._buffer_started = 0.0
+        # Step events published so far; the next one finalizes buffered text
+        self._completed_steps = 0
+        self._action_steps = 0
+        self._planned = False
+
+        self.started_at = time.monotonic()
+        self.first_delta_at: Optional[float] = None
+        self.first_step_at: Optional[float] = None
+        self.deltas = 0
+        self.frames = 0
+
+    @property
+    def phase(self) -> str:
+        # Mirrors smolagents: plan before step 1 and every planning_interval steps
+        if (
+            self.planning_interval
+            and not self._planned
+            and self._action_steps % self.planning_interval == 0
+        ):
+            return "planning"
+        return "action"
+
+    def consume(self, stream: Iterable[Any]) -> Any:
+        """Relay a run's stream and return its final answer."""
+        output = None
+        try:
+            for event in stream:
+                if isinstance(event, ChatMessageStreamDelta):
+                    if event.content:
+                        self.add(event.content)
+                elif isinstance(event, FinalAnswerStep):
+                    output = event.output
+        finally:
+            self.flush()
+        return output
+
+    async def aconsume(self, stream: AsyncIterable[Any]) -> Any:
+        """``consume`` for a run streamed on the event loop."""
+        output = None
+        try:
+            async for event in stream:
+                if isinstance(event, ChatMessageStreamDelta):
+                    if event.content:
+                        self.add(event.content)
+                elif isinstance(event, FinalAnswerStep):
+                    output = event.output
+        finally:
+            self.flush()
+        return output
+
+    def on_step(self, step: Any) -> None:
+        """Flush text generated for ``step`` before its step event is published."""
+        if not isinstance(step, (PlanningStep, ActionStep, FinalAnswerStep)):
+            return
+        self.flush()
+        self._completed_steps += 1
+        if self.first_step_at is None:
+            self.first_step_at = time.monotonic()
+        if isinstance(step, PlanningStep):
+            self._planned = True
+        elif isinstance(step, ActionStep):
+            self._action_steps += 1
+            self._planned = False
+
+    def add(self, text: str) -> None:
+        now = time.monotonic()
+        if self.first_delta_at is None:
+            self.first_delta_at = now
+        if not self._parts:
+            self._buffer_started = now
+        self._parts.append(text)
+        self._buffered_chars += len(text)
+        self.deltas += 1
+        if (
+            self._buffered_chars >= self._max_chars
+            or now - self._buffer_started >= self._max_delay
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._parts:
+            return
+        content = "".join(self._parts)
+        self._parts = []
+        self._buffered_chars = 0
+        self.frames += 1
+        self._publish(
+            {
+                "type": "delta",
+                "run_number": self._run_number,
+                "step_number": self._completed_steps + 1,
+                "phase": self.phase,
+                "content": content,
+            }
+        )
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_delta_at is None:
+            return None
+        return self.first_delta_at - self.started_at
+
+    @property
+    def time_to_first_step(self) -> Optional[float]:
+        if self.first_step_at is None:
+            return None
+        return self.first_step_at - self.started_at
+
+
+class StreamLatencyStats:
+    """Thread-safe aggregate of per-run time-to-first-token and time-to-first-step."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._samples = {"ttft": [0, 0.0, 0.0, 0.0], "ttfs": [0, 0.0, 0.0, 0.0]}
+        self._frames = 0
+        self._deltas = 0
+
+    def record(self, relay: DeltaRelay) -> None:
+        with self._lock:
+            self._runs += 1
+            self._frames += relay.frames
+            self._deltas += relay.deltas
+            for name, value in (
+                ("ttft", relay.time_to_first_token),
+                ("ttfs", relay.time_to_first_step),
+            ):
+                if value is None:
+                    continue
+                sample = self._samples[name]
+                value_ms = value * 1000
+                sample[0] += 1
+                sample[1] = value_ms
+                sample[2] = max(sample[2], value_ms)
+                sample[3] += value_ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "runs": self._runs,
+                "delta_frames": self._frames,
+                "deltas": self._deltas,
+            }
+            for name, (count, last, peak, total) in self._samples.items():
+                stats[f"last_{name}_ms"] = round(last, 3)
+                stats[f"max_{name}_ms"] = round(peak, 3)
+                stats[f"avg_{name}_ms"] = round(total / count, 3) if count else 0.0
+            return stats
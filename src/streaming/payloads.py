@@ -0,0 +1,71 @@
+import logging
+import threading
+from typing import Dict, Optional
+
+from src.artifacts.store import ArtifactStore, artifact_key
+from src.utils.serializers import artifact_url
+
+logger = logging.getLogger(__name__)
+
+TEXT_CONTENT_TYPE = "text/plain; charset=utf-8"
+
+
+class StepPayloadCapper:
+    """Caps large text fields of step events at a preview.
+
+    A field longer than its limit is cut to a preview. The full text goes
+    to the artifact store and the event lists it under
+    ``truncated_fields[field]`` with its UTF-8 byte length, sha256 and
+    URL, so the client fetches it only when the user expands the step.
+    Called on the agent thread; the store write blocks that thread rather
+    than the event loop.
+    """
+
+    def __init__(
+        self, limits: Dict[str, int], store: Optional[ArtifactStore] = None
+    ) -> None:
+        self._limits = limits
+        self._store = store
+        self._lock = threading.Lock()
+        self._capped_fields = 0
+        self._full_bytes = 0
+        self._preview_bytes = 0
+        self._failed_stores = 0
+
+    def cap(self, event: dict, base_url: str = "/") -> dict:
+        truncated = {}
+        for field, limit in self._limits.items():
+            value = event.get(field)
+            if not isinstance(value, str) or len(value) <= limit:
+                continue
+            data = value.encode("utf-8")
+            key = artifact_key(data)
+            meta = {"bytes": len(data), "sha256": key, "url": None}
+            if self._store is not None:
+                try:
+                    self._store.put(data, TEXT_CONTENT_TYPE)
+                    meta["url"] = artifact_url(base_url, key)
+                except Exception:
+                    logger.exception(f"Failed to store full {field} payload")
+                    with self._lock:
+                        self._failed_stores += 1
+            preview = value[:limit]
+            event[field] = preview
+            truncated[field] = meta
+            with self._lock:
+                self._capped_fields += 1
+                self._full_bytes += len(data)
+                self._preview_bytes += len(preview.encode("utf-8"))
+        if truncated:
+            event["truncated_fields"] = truncated
+        return event
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limits": dict(self._limits),
+                "capped_fields": self._capped_fields,
+                "full_bytes": self._full_bytes,
+                "preview_bytes": self._preview_bytes,
+                "failed_stores": self._failed_stores,
+            }
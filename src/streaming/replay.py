@@ -0,0 +1,353 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from src.streaming.bus import EventBus
+
+logger = logging.getLogger(__name__)
+
+
+def format_event_id(run_number: int, seq: int) -> str:
+    return f"{run_number}:{seq}"
+
+
+def parse_event_id(value: str) -> Optional[Tuple[int, int]]:
+    """Parse a ``run_number:seq`` SSE event id; returns None if malformed."""
+    run_number, _, seq = value.strip().partition(":")
+    try:
+        return int(run_number), int(seq)
+    except ValueError:
+        return None
+
+
+_FRAME_DATA = b"\r\ndata: "
+_FRAME_END = b"\r\n\r\n"
+
+
+@dataclass
+class LoggedEvent:
+    seq: int
+    event_type: str
+    # Complete SSE frame, encoded once and shared by every subscriber
+    frame: bytes
+
+    @classmethod
+    def build(cls, run_number: int, seq: int, event_type: str, data: str) -> "LoggedEvent":
+        # json.dumps escapes newlines, so the body always fits one data line
+        event_id = format_event_id(run_number, seq)
+        frame = f"id: {event_id}\r\ndata: {data}\r\n\r\n".encode()
+        return cls(seq, event_type, frame)
+
+    @property
+    def data(self) -> str:
+        """JSON body of the event, including its event_id."""
+        start = self.frame.index(_FRAME_DATA) + len(_FRAME_DATA)
+        return self.frame[start : -len(_FRAME_END)].decode()
+
+
+def _logged_after(entries: Deque[LoggedEvent], after_seq: int) -> List[LoggedEvent]:
+    # Followers are usually a few events behind, so scan from the newest
+    newer = []
+    for entry in reversed(entries):
+        if entry.seq <= after_seq:
+            break
+        newer.append(entry)
+    newer.reverse()
+    return newer
+
+
+class RunEventLog:
+    """Bounded ring buffer of one run's events, broadcast to any number of followers.
+
+    ``append`` is thread-safe so the agent thread can log step events
+    directly. Each event is encoded once; followers keep their own cursor
+    into the shared buffer and are woken without polling, so an extra
+    watcher costs a cursor rather than a copy of the stream. Once more than
+    ``capacity`` events are logged the oldest are evicted, and followers
+    asking for them get a ``replay_truncated`` marker. Model output
+    ``delta`` events are kept apart, in a ring of ``delta_capacity``, so a
+    long answer never evicts step events. Deltas are discarded once the
+    step event repeating their text is logged. Every event is also
+    published on ``bus``, for followers on other workers.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        run_number: int,
+        loop: asyncio.AbstractEventLoop,
+        capacity: int = 1000,
+        bus: Optional["EventBus"] = None,
+        delta_capacity: int = 256,
+    ) -> None:
+        self.session_id = session_id
+        self.run_number = run_number
+        self._loop = loop
+        self._bus = bus
+        self._entries: Deque[LoggedEvent] = deque(maxlen=capacity)
+        self._deltas: Deque[LoggedEvent] = deque(maxlen=delta_capacity)
+        # Step number of each delta in _deltas
+        self._delta_steps: Deque[int] = deque(maxlen=delta_capacity)
+        self._next_seq = 1
+        self._evicted = 0
+        # Seq of the newest event evicted from _entries
+        self._evicted_seq = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._changed = asyncio.Event()
+        # Follower id -> seq of the last event it was given
+        self._cursors: Dict[int, int] = {}
+        self._follower_ids = itertools.count()
+        self._peak_followers = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def last_seq(self) -> int:
+        return self._next_seq - 1
+
+    def append(self, event: dict) -> Optional[Tuple[dict, str]]:
+        """Log an event; returns it stamped with its ``event_id``, plus its JSON body.
+
+        Returns None if the run is already complete.
+        """
+        with self._lock:
+            if self._closed:
+                return None
+            seq = self._next_seq
+            self._next_seq += 1
+            stamped = {**event, "event_id": format_event_id(self.run_number, seq)}
+            data = json.dumps(stamped)
+            event_type = event.get("type", "step")
+            entry = LoggedEvent.build(self.run_number, seq, event_type, data)
+            step_number = event.get("step_number")
+            if event_type == "delta":
+                self._deltas.append(entry)
+                self._delta_steps.append(step_number or 0)
+            else:
+                if len(self._entries) == self._entries.maxlen:
+                    self._evicted += 1
+                    self._evicted_seq = self._entries[0].seq
+                self._entries.append(entry)
+                if step_number is not None:
+                    # The step event repeats the text of its deltas
+                    while self._delta_steps and self._delta_steps[0] <= step_number:
+                        self._deltas.popleft()
+                        self._delta_steps.popleft()
+            if self._bus is not None:
+                # Under the lock, so the bus sees events in seq order
+                self._bus.publish(self.session_id, self.run_number, entry)
+        self._loop.call_soon_threadsafe(self._notify)
+        return stamped, data
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._bus is not None:
+                self._bus.publish_closed(
+                    self.session_id, self.run_number, self._next_seq - 1
+                )
+        self._loop.call_soon_threadsafe(self._notify)
+
+    def _notify(self) -> None:
+        # Wake every current follower; later waiters get a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def entries(self) -> List[LoggedEvent]:
+        """Logged events other than deltas, oldest first."""
+        with self._lock:
+            return list(self._entries)
+
+    def _entries_after(self, after_seq: int) -> Tuple[List[LoggedEvent], int, bool]:
+        with self._lock:
+            entries = list(
+                heapq.merge(
+                    _logged_after(self._entries, after_seq),
+                    _logged_after(self._deltas, after_seq),
+                    key=lambda entry: entry.seq,
+                )
+            )
+            return entries, self._evicted_seq, self._closed
+
+    async def follow(self, after_seq: int = 0) -> AsyncIterator[LoggedEvent]:
+        """Yield events after ``after_seq``, then live ones until the run completes."""
+        follower = next(self._follower_ids)
+        self._cursors[follower] = after_seq
+        self._peak_followers = max(self._peak_followers, len(self._cursors))
+        try:
+            while True:
+                changed = self._changed
+                entries, evicted_seq, closed = self._entries_after(after_seq)
+                if after_seq < evicted_seq:
+                    missed = evicted_seq - after_seq
+                    after_seq = evicted_seq
+                    entries = [entry for entry in entries if entry.seq > after_seq]
+                    yield LoggedEvent.build(
+                        self.run_number,
+                        after_seq,
+                        "replay_truncated",
+                        json.dumps(
+                            {
+                                "type": "replay_truncated",
+                                "missed_events": missed,
+                                "event_id": format_event_id(self.run_number, after_seq),
+                            }
+                        ),
+                    )
+                for entry in entries:
+                    after_seq = entry.seq
+                    self._cursors[follower] = after_seq
+                    yield entry
+                if not entries:
+                    if closed:
+                        return
+                    await changed.wait()
+        finally:
+            del self._cursors[follower]
+
+    def stats(self) -> dict:
+        with self._lock:
+            last_seq = self._next_seq - 1
+            stats = {
+                "last_seq": last_seq,
+                "buffered": len(self._entries),
+                "buffered_deltas": len(self._deltas),
+                "evicted": self._evicted,
+                "closed": self._closed,
+            }
+        cursors = list(self._cursors.values())
+        stats["followers"] = len(cursors)
+        stats["peak_followers"] = self._peak_followers
+        stats["max_follower_lag"] = last_seq - min(cursors) if cursors else 0
+        return stats
+
+
+async def _iterate_stored(
+    run_number: int, events: List[Tuple[int, str, str]]
+) -> AsyncIterator[LoggedEvent]:
+    for seq, event_type, data in events:
+        yield LoggedEvent.build(run_number, seq, event_type, data)
+
+
+class RunEventRegistry:
+    """Event logs of in-progress runs; completed runs are spilled to the database.
+
+    A completed log stays in memory until its events are stored, so a
+    client reattaching in between never sees an empty run. Only the events
+    still in the ring buffer are stored, which leaves out model output
+    deltas, whose text is repeated by the finished step events. Runs owned
+    by other workers are followed over ``bus``.
+    """
+
+    def __init__(
+        self, db, capacity: int = 1000, bus: Optional["EventBus"] = None
+    ) -> None:
+        self._db = db
+        self._capacity = capacity
+        self._bus = bus
+        self._logs: Dict[Tuple[str, int], RunEventLog] = {}
+        self._spills: Set[asyncio.Task] = set()
+        self._spilled_events = 0
+        self._failed_spills = 0
+
+    def open(self, session_id: str, run_number: int) -> RunEventLog:
+        log = RunEventLog(
+            session_id,
+            run_number,
+            asyncio.get_running_loop(),
+            self._capacity,
+            bus=self._bus,
+        )
+        self._logs[(session_id, run_number)] = log
+        return log
+
+    def get(self, session_id: str, run_number: int) -> Optional[RunEventLog]:
+        return self._logs.get((session_id, run_number))
+
+    def complete(self, log: RunEventLog) -> None:
+        """Close a run's log and store its events in the background."""
+        log.close()
+        task = asyncio.create_task(self._spill(log))
+        self._spills.add(task)
+        task.add_done_callback(self._spills.discard)
+
+    async def _spill(self, log: RunEventLog) -> None:
+        key = (log.session_id, log.run_number)
+        try:
+            entries = log.entries()
+            await self._db.save_run_events(
+                log.session_id,
+                log.run_number,
+                [(entry.seq, entry.event_type, entry.data) for entry in entries],
+            )
+            self._spilled_events += len(entries)
+        except Exception:
+            self._failed_spills += 1
+            logger.exception(f"Failed to store events of run {key}")
+        finally:
+            if self._logs.get(key) is log:
+                del self._logs[key]
+
+    async def replay(
+        self,
+        session_id: str,
+        run_number: int,
+        after_seq: int = 0,
+        live_elsewhere: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> Optional[AsyncIterator[LoggedEvent]]:
+        """Events of a run after ``after_seq``: live if in progress, else stored.
+
+        ``live_elsewhere()`` tells whether another worker is running it.
+        Returns None if the run has no events at all.
+        """
+        log = self.get(session_id, run_number)
+        if log is not None:
+            return log.follow(after_seq)
+        if (
+            self._bus is not None
+            and live_elsewhere is not None
+            and await live_elsewhere()
+        ):
+            return self._bus.follow(session_id, run_number, after_seq, live_elsewhere)
+        events = await self._db.get_run_events(session_id, run_number, after_seq)
+        if not events and after_seq == 0:
+            return None
+        return _iterate_stored(run_number, events)
+
+    async def close(self) -> None:
+        """Wait for in-flight spills to finish."""
+        if self._spills:
+            await asyncio.gather(*self._spills, return_exceptions=True)
+
+    def stats(self) -> dict:
+        logs = list(self._logs.values())
+        return {
+            "active_runs": sum(1 for log in logs if not log.closed),
+            "followers": sum(log.stats()["followers"] for log in logs),
+            "pending_spills": len(self._spills),
+            "spilled_events": self._spilled_events,
+            "failed_spills": self._failed_spills,
+        }
@@ -19,11 +19,20 @@ class CreateBotoClientTool:
         """
         import boto3
 
+        from src.runs.cancellation import current_cancel_token
+
         if self.profile:
             session = boto3.Session(profile_name=self.profile)
         else:
             session = boto3.Session()
-        return session.client(service_name)
+        client = session.client(service_name)
+        token = current_cancel_token()
+        if token is not None:
+            # Every request, retries included, stops once the run is cancelled
+            client.meta.events.register(
+                "before-send", lambda **kwargs: token.raise_if_cancelled()
+            )
+        return client
 
     def as_tool(self) -> tool:
         return tool(self.create_boto_client)
@@ -8,6 +8,8 @@ from typing import Any, Optional
 
 from smolagents.agent_types import AgentImage, AgentText
 
+from src.artifacts.store import ArtifactStore
+
 
 @dataclass
 class MultimodalOutput:
@@ -21,10 +23,15 @@ def serialize_agent_output(
     response: Any,
     session_id: str,
     base_url: str,
+    artifact_store: Optional[ArtifactStore] = None,
 ) -> MultimodalOutput:
-    """Serialize agent output to structured format with image support."""
+    """Serialize agent output to structured format with image support.
+
+    Images are PNG-encoded and, given an artifact store, stored there and
+    referenced by URL. Encoding blocks, so call this off the event loop.
+    """
     if isinstance(response, AgentImage):
-        return _serialize_image(response, session_id, base_url)
+        return _serialize_image(response, session_id, base_url, artifact_store)
     elif isinstance(response, AgentText):
         return MultimodalOutput(
             output=str(response),
@@ -45,23 +52,36 @@ def _serialize_image(
     agent_image: AgentImage,
     session_id: str,
     base_url: str,
+    artifact_store: Optional[ArtifactStore] = None,
 ) -> MultimodalOutput:
-    """Convert AgentImage to base64 data URL."""
+    """Store AgentImage as a PNG artifact, or inline it as a data URL without a store."""
     image = getattr(agent_image, "value", agent_image)
 
     buffer = BytesIO()
     image.save(buffer, format="PNG")
     image_bytes = buffer.getvalue()
-    base64_str = base64.b64encode(image_bytes).decode("utf-8")
-    data_url = f"data:image/png;base64,{base64_str}"
+
+    if artifact_store is None:
+        base64_str = base64.b64encode(image_bytes).decode("utf-8")
+        url = f"data:image/png;base64,{base64_str}"
+        output = str(agent_image)
+    else:
+        info = artifact_store.put(image_bytes, "image/png")
+        url = artifact_url(base_url, info.key)
+        # The saved message references the artifact, so reloads stay small
+        output = url
 
     return MultimodalOutput(
-        output=str(agent_image),
+        output=output,
         output_type="image",
-        url=data_url,
+        url=url,
         mime_type="image/png",
     )
 
 
+def artifact_url(base_url: str, key: str) -> str:
+    return f"{base_url.rstrip('/')}/artifacts/{key}"
+
+
 def get_uploads_dir() -> Path:
     return Path("uploads")
@@ -0,0 +1,140 @@
+import asyncio
+from unittest.mock import patch
+
+
+class _Memory:
+    def __init__(self, steps=None):
+        self.steps = list(steps or [])
+
+
+class _Agent:
+    def __init__(self, steps=None, executor=None, aws_regions=None):
+        from smolagents.memory import CallbackRegistry
+
+        self.memory = _Memory(steps)
+        self.step_callbacks = CallbackRegistry()
+        self.cleaned_up = False
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+class _SessionManager:
+    def __init__(self):
+        self.stored = {}
+        self.loads = 0
+
+    async def get_agent_step_count(self, session_id):
+        return len(self.stored.get(session_id, []))
+
+    async def load_agent_state(self, session_id):
+        self.loads += 1
+        return list(self.stored.get(session_id, []))
+
+    def save_agent_state(self, agent, session_id, run_number):
+        self.stored[session_id] = list(agent.memory.steps)
+
+
+class TestAgentPool:
+    def test_lru_eviction(self):
+        from src.agents import AgentPool
+
+        pool = AgentPool(max_agents=2)
+        agents = [_Agent(), _Agent(), _Agent()]
+        assert pool.checkin("s1", agents[0]) == []
+        assert pool.checkin("s2", agents[1]) == []
+        assert pool.checkin("s3", agents[2]) == [agents[0]]
+
+        assert pool.checkout("s1") is None
+        assert pool.checkout("s2").agent is agents[1]
+        # Checked out agents leave the pool until checked in again
+        assert pool.checkout("s2") is None
+        stats = pool.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 2
+        assert stats["evictions"]["lru"] == 1
+
+    def test_memory_bound(self):
+        from src.agents import AgentPool
+
+        pool = AgentPool(max_agents=10, max_memory_bytes=1500)
+        small = _Agent(["x" * 500])
+        large = _Agent(["y" * 1200])
+        pool.checkin("s1", small)
+        assert pool.checkin("s2", large) == [small]
+        assert pool.stats()["memory_bytes"] == 1200
+        assert pool.stats()["evictions"]["memory"] == 1
+
+    def test_idle_ttl(self):
+        from src.agents import AgentPool
+
+        pool = AgentPool(idle_ttl=60)
+        agent = _Agent()
+        with patch("src.agents.pool.time.monotonic", return_value=1000.0):
+            pool.checkin("s1", agent)
+        with patch("src.agents.pool.time.monotonic", return_value=1030.0):
+            assert pool.evict_expired() == []
+        with patch("src.agents.pool.time.monotonic", return_value=1060.0):
+            assert pool.evict_expired() == [agent]
+        assert pool.stats()["evictions"]["idle"] == 1
+
+
+class TestSessionAgentFactoryPooling:
+    def _factory(self, manager):
+        from src.agents import AgentPool, SessionAgentFactory
+
+        return SessionAgentFactory(manager, AgentPool(max_agents=4))
+
+    def test_reuses_agent_between_turns(self):
+        manager = _SessionManager()
+        manager.stored["s1"] = ["a"]
+
+        async def scenario():
+            factory = self._factory(manager)
+            with patch("src.agents.factory.cora_agent", side_effect=_Agent):
+                first_calls, second_calls = [], []
+                agent = await factory.get_agent("s1", first_calls.append)
+                agent.memory.steps.append("b")
+                factory.save_agent(agent, "s1", 1)
+
+                again = await factory.get_agent("s1", second_calls.append)
+                again.step_callbacks.callback(_action())
+                return agent, again, first_calls, second_calls, factory.stats()
+
+        agent, again, first_calls, second_calls, stats = asyncio.run(scenario())
+        assert again is agent
+        assert again.memory.steps == ["a", "b"]
+        assert manager.loads == 1
+        # Only the current run's callback sees the step
+        assert first_calls == []
+        assert len(second_calls) == 1
+        assert stats["builds"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_rebuilds_when_storage_moved_ahead(self):
+        manager = _SessionManager()
+
+        async def scenario():
+            factory = self._factory(manager)
+            with patch("src.agents.factory.cora_agent", side_effect=_Agent):
+                agent = await factory.get_agent("s1")
+                factory.save_agent(agent, "s1", 1)
+                # Another process ran the session in the meantime
+                manager.stored["s1"] = ["a", "b"]
+                rebuilt = await factory.get_agent("s1")
+                await factory.close()
+                return agent, rebuilt, factory.stats()
+
+        agent, rebuilt, stats = asyncio.run(scenario())
+        assert rebuilt is not agent
+        assert rebuilt.memory.steps == ["a", "b"]
+        assert agent.cleaned_up
+        assert stats["stale"] == 1
+        assert stats["builds"] == 2
+
+
+def _action():
+    from smolagents.memory import ActionStep
+    from smolagents.monitoring import Timing
+
+    return ActionStep(step_number=1, timing=Timing(start_time=0.0))
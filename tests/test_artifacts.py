@@ -0,0 +1,123 @@
+import pytest
+
+
+class FakeS3Error(Exception):
+    def __init__(self, code):
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeBody:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise FakeS3Error("404")
+        data, content_type = self.objects[Key]
+        return {"ContentLength": len(data), "ContentType": content_type}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.puts += 1
+        self.objects[Key] = (Body, ContentType)
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Key not in self.objects:
+            raise FakeS3Error("NoSuchKey")
+        data = self.objects[Key][0]
+        if Range:
+            start, end = Range.removeprefix("bytes=").split("-")
+            data = data[int(start) : int(end) + 1]
+        return {"Body": FakeBody(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class TestLocalArtifactStore:
+    def test_put_deduplicates_by_content(self, tmp_path):
+        from src.artifacts import LocalArtifactStore
+
+        store = LocalArtifactStore(tmp_path)
+        first = store.put(b"chart bytes", "image/png")
+        second = store.put(b"chart bytes", "image/png")
+
+        assert first == second
+        assert len(first.key) == 64
+        assert first.etag == f'"{first.key}"'
+        assert store.head_object(first.key).content_type == "image/png"
+        assert len(list(tmp_path.rglob(first.key))) == 1
+
+    def test_get_range_and_missing(self, tmp_path):
+        from src.artifacts import ArtifactNotFoundError, LocalArtifactStore
+
+        store = LocalArtifactStore(tmp_path)
+        info = store.put(b"0123456789", "text/plain")
+
+        assert store.get_object(info.key, (2, 4)) == b"234"
+        assert store.head_object("0" * 64) is None
+        assert store.head_object("../etc/passwd") is None
+        with pytest.raises(ArtifactNotFoundError):
+            store.get_object("0" * 64)
+
+
+class TestS3ArtifactStore:
+    def test_round_trip_through_client(self):
+        from src.artifacts import S3ArtifactStore
+
+        client = FakeS3Client()
+        store = S3ArtifactStore("bucket", prefix="cora/", client=client)
+        info = store.put(b"abcdef", "image/png")
+        store.put(b"abcdef", "image/png")
+
+        assert client.puts == 1
+        assert f"cora/{info.key}" in client.objects
+        assert store.head_object(info.key).size == 6
+        assert store.get_object(info.key, (1, 2)) == b"bc"
+        assert store.head_object("f" * 64) is None
+
+
+class TestParseByteRange:
+    def test_ranges(self):
+        from src.artifacts import parse_byte_range
+
+        assert parse_byte_range("bytes=0-99", 1000) == (0, 99)
+        assert parse_byte_range("bytes=900-", 1000) == (900, 999)
+        assert parse_byte_range("bytes=-100", 1000) == (900, 999)
+        assert parse_byte_range("bytes=990-2000", 1000) == (990, 999)
+
+    def test_ignored_and_unsatisfiable(self):
+        from src.artifacts import parse_byte_range
+
+        assert parse_byte_range("items=0-1", 1000) is None
+        assert parse_byte_range("bytes=0-1,5-6", 1000) is None
+        assert parse_byte_range("bytes=abc", 1000) is None
+        with pytest.raises(ValueError):
+            parse_byte_range("bytes=1000-", 1000)
+
+
+class TestSerializeImage:
+    def test_image_is_stored_as_artifact(self, tmp_path):
+        from PIL import Image
+        from smolagents.agent_types import AgentImage
+
+        from src.artifacts import LocalArtifactStore
+        from src.utils.serializers import serialize_agent_output
+
+        store = LocalArtifactStore(tmp_path)
+        image = AgentImage(Image.new("RGB", (4, 4), "red"))
+        result = serialize_agent_output(image, "s1", "http://host/", store)
+
+        key = result.url.rsplit("/", 1)[1]
+        assert result.url == f"http://host/artifacts/{key}"
+        assert result.output == result.url
+        assert result.output_type == "image"
+        assert store.get_object(key).startswith(b"\x89PNG")
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from smolagents import CodeAgent
+from smolagents.memory import ActionStep, FinalAnswerStep, PlanningStep
+from smolagents.models import ChatMessage, ChatMessageStreamDelta, MessageRole, Model
+from smolagents.monitoring import TokenUsage
+
+
+class _ScriptedModel(Model):
+    """Streams canned replies; only the async methods are usable."""
+
+    def __init__(self, replies):
+        super().__init__(model_id="scripted")
+        self.replies = list(replies)
+
+    async def agenerate_stream(self, messages, **kwargs):
+        text = self.replies.pop(0)
+        for i in range(0, len(text), 4):
+            await asyncio.sleep(0)
+            yield ChatMessageStreamDelta(content=text[i : i + 4])
+        yield ChatMessageStreamDelta(content="", token_usage=TokenUsage(10, 5))
+
+    async def agenerate(self, messages, **kwargs):
+        return ChatMessage(
+            role=MessageRole.ASSISTANT,
+            content=self.replies.pop(0),
+            token_usage=TokenUsage(10, 5),
+        )
+
+    def generate(self, messages, **kwargs):
+        raise AssertionError("sync model call in an async run")
+
+
+def _agent(replies, **kwargs) -> CodeAgent:
+    return CodeAgent(
+        tools=[],
+        model=_ScriptedModel(replies),
+        verbosity_level=0,
+        **kwargs,
+    )
+
+
+async def _collect(stream):
+    return [event async for event in stream]
+
+
+class TestRunAgentAsync:
+    def test_runs_steps_and_offloads_only_code(self):
+        from src.agents import run_agent_async
+
+        agent = _agent(
+            [
+                "Plan: multiply",
+                "Thought: compute\n<code>\nx = 6 * 7\nprint(x)\n</code>",
+                "Thought: done\n<code>\nfinal_answer(x)\n</code>",
+            ],
+            planning_interval=5,
+        )
+        steps = []
+        agent.step_callbacks.register(ActionStep, steps.append)
+        agent.step_callbacks.register(PlanningStep, steps.append)
+        offloaded = []
+
+        async def run_sync(func, *args):
+            offloaded.append(getattr(func, "__name__", type(func).__name__))
+            return func(*args)
+
+        events = asyncio.run(
+            _collect(run_agent_async(agent, "What is 6 * 7?", run_sync=run_sync))
+        )
+
+        assert isinstance(events[-1], FinalAnswerStep)
+        assert events[-1].output == 42
+        assert [type(step).__name__ for step in steps] == [
+            "PlanningStep",
+            "ActionStep",
+            "ActionStep",
+        ]
+        assert "42" in steps[1].observations
+        assert steps[2].is_final_answer
+        assert offloaded.count("LocalPythonExecutor") == 2
+        deltas = [e for e in events if isinstance(e, ChatMessageStreamDelta)]
+        text = "".join(e.content for e in deltas if e.content)
+        assert "x = 6 * 7" in text
+
+    def test_code_errors_are_shown_to_the_model(self):
+        from src.agents import run_agent_async
+
+        agent = _agent(
+            [
+                "Thought: oops\n<code>\n1 / 0\n</code>",
+                "Thought: fixed\n<code>\nfinal_answer('ok')\n</code>",
+            ]
+        )
+
+        events = asyncio.run(_collect(run_agent_async(agent, "divide")))
+        actions = [e for e in events if isinstance(e, ActionStep)]
+        assert "ZeroDivisionError" in str(actions[0].error)
+        assert events[-1].output == "ok"
+        # The run continued from the same memory
+        assert len(agent.memory.steps) == 3
+
+    def test_max_steps_asks_for_a_final_answer(self):
+        from src.agents import run_agent_async
+
+        agent = _agent(
+            ["Thought: look\n<code>\nprint('still looking')\n</code>", "gave up"],
+            max_steps=1,
+        )
+        events = asyncio.run(_collect(run_agent_async(agent, "find it")))
+        assert events[-1].output == "gave up"
+        assert "Reached max steps" in str(agent.memory.steps[-1].error)
+
+    def test_requires_an_async_model(self):
+        from src.agents import run_agent_async
+
+        agent = CodeAgent(tools=[], model=Model(model_id="sync"), verbosity_level=0)
+        with pytest.raises(TypeError, match="agenerate_stream"):
+            asyncio.run(_collect(run_agent_async(agent, "hi")))
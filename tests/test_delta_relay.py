@@ -0,0 +1,78 @@
+from smolagents.memory import ActionStep, FinalAnswerStep, PlanningStep
+from smolagents.models import ChatMessageStreamDelta
+from smolagents.monitoring import Timing
+
+
+def _action(step_number: int) -> ActionStep:
+    return ActionStep(step_number=step_number, timing=Timing(start_time=0.0))
+
+
+def _planning() -> PlanningStep:
+    return PlanningStep(
+        model_input_messages=[],
+        model_output_message=None,
+        plan="plan",
+        timing=Timing(start_time=0.0),
+    )
+
+
+class TestDeltaRelay:
+    def test_coalesces_deltas_by_size(self):
+        from src.streaming import DeltaRelay
+
+        events = []
+        relay = DeltaRelay(events.append, 1, max_delay=60, max_chars=6)
+        stream = [ChatMessageStreamDelta(content=c) for c in "abcdefgh"]
+        stream.append(FinalAnswerStep(output="done"))
+
+        assert relay.consume(stream) == "done"
+        assert [e["content"] for e in events] == ["abcdef", "gh"]
+        assert relay.deltas == 8
+        assert relay.frames == 2
+
+    def test_step_callback_flushes_before_step_event(self):
+        from src.streaming import DeltaRelay
+
+        events = []
+        relay = DeltaRelay(events.append, 3, planning_interval=2, max_delay=60)
+
+        def stream():
+            yield ChatMessageStreamDelta(content="plan")
+            relay.on_step(_planning())
+            events.append({"type": "planning"})
+            yield ChatMessageStreamDelta(content="code 1")
+            relay.on_step(_action(1))
+            events.append({"type": "action"})
+            yield ChatMessageStreamDelta(content="code 2")
+            relay.on_step(_action(2))
+            events.append({"type": "action"})
+            yield ChatMessageStreamDelta(content="plan again")
+
+        relay.consume(stream())
+
+        assert [(e["type"], e.get("step_number"), e.get("phase")) for e in events] == [
+            ("delta", 1, "planning"),
+            ("planning", None, None),
+            ("delta", 2, "action"),
+            ("action", None, None),
+            ("delta", 3, "action"),
+            ("action", None, None),
+            ("delta", 4, "planning"),
+        ]
+        assert events[0]["run_number"] == 3
+        assert relay.time_to_first_token <= relay.time_to_first_step
+
+    def test_latency_stats(self):
+        from src.streaming import DeltaRelay, StreamLatencyStats
+
+        relay = DeltaRelay(lambda event: None, 1)
+        relay.consume([ChatMessageStreamDelta(content="a")])
+        relay.on_step(_action(1))
+        stats = StreamLatencyStats()
+        stats.record(relay)
+        stats.record(DeltaRelay(lambda event: None, 2))
+
+        result = stats.stats()
+        assert result["runs"] == 2
+        assert result["delta_frames"] == 1
+        assert result["avg_ttft_ms"] == result["last_ttft_ms"]
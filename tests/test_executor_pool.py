@@ -0,0 +1,378 @@
+import time
+
+import pytest
+from smolagents import tool
+from smolagents.monitoring import AgentLogger, LogLevel
+
+
+def _wait_for(condition, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@tool
+def double(x: int) -> int:
+    """Doubles a number.
+
+    Args:
+        x: The number to double.
+    """
+    return 2 * x
+
+
+@tool
+def list_buckets_twice(endpoint_url: str) -> str:
+    """Lists S3 buckets, then again if the first request is interrupted.
+
+    Args:
+        endpoint_url: The S3 endpoint.
+    """
+    import boto3
+    from botocore.config import Config
+
+    client = boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        region_name="us-east-1",
+        aws_access_key_id="x",
+        aws_secret_access_key="x",
+        config=Config(retries={"max_attempts": 0}),
+    )
+    try:
+        return str(client.list_buckets())
+    except BaseException:
+        return str(client.list_buckets())
+
+
+class TestSubprocessExecutor:
+    def test_runs_code_in_persistent_namespace(self):
+        from smolagents.utils import AgentError
+
+        from src.executors import SubprocessExecutor
+
+        executor = SubprocessExecutor([], AgentLogger(level=LogLevel.OFF), ["json"])
+        try:
+            executor.authorize_imports(["json"])
+            result = executor("x = 40\nprint('hi')\nx + 2")
+            assert result.output == "42"
+            assert result.logs == "hi\n"
+            assert executor("json.dumps(x)").output == "'40'"
+
+            with pytest.raises(AgentError, match="ZeroDivisionError"):
+                executor("1 / 0")
+
+            # What the patched final_answer tool raises
+            final = executor(
+                "class FinalAnswerException(BaseException): pass\n"
+                "raise FinalAnswerException('safe:' + json.dumps({'total': x}))"
+            )
+            assert final.is_final_answer
+            assert final.output == {"total": 40}
+
+            executor.reset()
+            with pytest.raises(AgentError, match="is not defined"):
+                executor("x")
+            # Preimports survive the reset, the allow-list does not
+            with pytest.raises(AgentError, match="Forbidden access to module: json"):
+                executor("json.dumps(1)")
+            executor.authorize_imports(["json"])
+            assert executor("json.dumps(1)").output == "'1'"
+        finally:
+            executor.cleanup()
+
+    def test_timed_out_cell_replaces_the_kernel(self):
+        from smolagents.utils import AgentError
+
+        from src.executors import SubprocessExecutor
+
+        executor = SubprocessExecutor(
+            [], AgentLogger(level=LogLevel.OFF), ["json"], cell_timeout=1
+        )
+        try:
+            executor.authorize_imports(["json", "time"])
+            executor.send_tools({"double": double})
+            executor("x = 1")
+            with pytest.raises(AgentError, match="timed out after 1s"):
+                executor("import time\ntime.sleep(30)")
+            assert executor.restarts == 1
+            with pytest.raises(AgentError, match="is not defined"):
+                executor("x")
+            # Preimports, tools and the allow-list are back in the new kernel
+            assert executor("json.dumps(double(2))").output == "'4'"
+        finally:
+            executor.cleanup()
+
+    def test_cleanup_mid_cell_does_not_restart_the_kernel(self):
+        import os
+        import threading
+        from pathlib import Path
+
+        from smolagents.utils import AgentError
+
+        from src.executors import SubprocessExecutor
+
+        def children():
+            tasks = Path(f"/proc/{os.getpid()}/task")
+            if not tasks.exists():
+                pytest.skip("needs /proc")
+            pids = set()
+            for task in tasks.iterdir():
+                try:
+                    pids.update((task / "children").read_text().split())
+                except FileNotFoundError:
+                    # The thread ended meanwhile
+                    continue
+            return pids
+
+        before = children()
+        executor = SubprocessExecutor([], AgentLogger(level=LogLevel.OFF))
+        errors = []
+
+        def run():
+            try:
+                executor("import time\ntime.sleep(30)")
+            except AgentError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(0.5)
+        executor.cleanup()
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+        assert len(errors) == 1
+        assert executor.restarts == 0
+        assert children() == before
+
+    def test_agent_code_reaches_only_authorized_modules(self):
+        from smolagents.utils import AgentError
+
+        from src.executors import SubprocessExecutor
+
+        executor = SubprocessExecutor([], AgentLogger(level=LogLevel.OFF), ["json"])
+        try:
+            executor.authorize_imports(["json", "math", "email.mime"])
+            # Tool definitions import what they need
+            executor.send_tools({"double": double})
+            assert executor("import math\nmath.floor(double(1.5))").output == "3"
+            executor("from email import mime")
+            assert executor("json.dumps([1])").output == "'[1]'"
+            for code in (
+                "import os",
+                "import subprocess as s",
+                "__import__('os')",
+                "eval(\"__import__('os')\")",
+                "def f():\n    import os\nf()",
+                "json.decoder.re.enum.sys.modules['os'].getcwd()",
+                "open('/etc/hostname').read()",
+                "double.forward.__globals__",
+            ):
+                with pytest.raises(AgentError, match="not allowed|Forbidden"):
+                    executor(code)
+            with pytest.raises(AgentError, match="erase the existing tool"):
+                executor("double = 1")
+        finally:
+            executor.cleanup()
+
+    def test_reset_starts_a_fresh_kernel(self):
+        from smolagents.utils import AgentError
+
+        from src.executors import SubprocessExecutor
+
+        executor = SubprocessExecutor([], AgentLogger(level=LogLevel.OFF), ["os"])
+        try:
+            executor.authorize_imports(["os"])
+            executor("os.environ['LEAKED'] = '1'\nos.chdir('/')")
+            executor.reset()
+            # The next lease sets its own allow-list
+            executor.authorize_imports(["os"])
+            assert executor("'LEAKED' in os.environ").output == "False"
+            assert executor("os.getcwd() == '/'").output == "False"
+            with pytest.raises(AgentError, match="is not defined"):
+                executor("x")
+            assert executor.restarts == 0
+        finally:
+            executor.cleanup()
+
+    def test_kernel_sees_only_path_and_aws_settings(self, monkeypatch):
+        from src.executors import SubprocessExecutor
+
+        monkeypatch.setenv("DATABASE_URL", "postgresql://secret")
+        monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+        executor = SubprocessExecutor([], AgentLogger(level=LogLevel.OFF), ["os"])
+        try:
+            executor.authorize_imports(["os"])
+            assert executor("'DATABASE_URL' in os.environ").output == "False"
+            assert executor("os.environ['AWS_DEFAULT_REGION']").output == "'eu-west-1'"
+            assert executor("'PATH' in os.environ").output == "True"
+        finally:
+            executor.cleanup()
+
+    def test_cpu_memory_and_output_limits(self):
+        from smolagents.utils import AgentError
+
+        from src.executors import SubprocessExecutor
+
+        executor = SubprocessExecutor(
+            [],
+            AgentLogger(level=LogLevel.OFF),
+            cell_cpu_seconds=1,
+            memory_limit_mb=1024,
+            max_output_chars=100,
+        )
+        try:
+            executor("x = 1")
+            with pytest.raises(AgentError, match="CPULimitExceeded"):
+                executor("for i in range(10 ** 9):\n    pass")
+            with pytest.raises(AgentError, match="MemoryError"):
+                executor("b = 'x' * (2 * 1024 ** 3)")
+            # Both were stopped inside the kernel, which kept its state
+            assert executor.restarts == 0
+            assert executor("x").output == "1"
+            result = executor("print('a' * 10000)\n'b' * 10000")
+            assert len(result.logs) < 200
+            assert "truncated" in result.output
+        finally:
+            executor.cleanup()
+
+    def test_interrupt_stops_the_running_cell(self):
+        import threading
+
+        from smolagents.utils import AgentError
+
+        from src.executors import SubprocessExecutor
+
+        executor = SubprocessExecutor([], AgentLogger(level=LogLevel.OFF))
+        try:
+            executor("x = 1")
+            # Ignored between cells
+            executor.interrupt()
+            timer = threading.Timer(0.5, executor.interrupt)
+            timer.start()
+            start = time.monotonic()
+            with pytest.raises(AgentError, match="KeyboardInterrupt"):
+                executor("import time\ntime.sleep(30)")
+            assert time.monotonic() - start < 5
+            assert executor.restarts == 0
+            assert executor("x").output == "1"
+        finally:
+            executor.cleanup()
+
+    def test_interrupted_cell_makes_no_further_aws_requests(self):
+        import socket
+        import threading
+
+        from smolagents.utils import AgentError
+
+        from src.executors import SubprocessExecutor
+
+        pytest.importorskip("boto3")
+        # Accepts connections and never answers
+        server = socket.create_server(("127.0.0.1", 0))
+        port = server.getsockname()[1]
+        executor = SubprocessExecutor([], AgentLogger(level=LogLevel.OFF), ["boto3"])
+        try:
+            executor.send_tools({"list_buckets_twice": list_buckets_twice})
+            timer = threading.Timer(0.5, executor.interrupt)
+            timer.start()
+            start = time.monotonic()
+            with pytest.raises(AgentError, match="AWS request refused"):
+                executor(f"list_buckets_twice('http://127.0.0.1:{port}')")
+            assert time.monotonic() - start < 5
+            assert executor.restarts == 0
+        finally:
+            executor.cleanup()
+            server.close()
+
+
+class _CountingBackend:
+    def __init__(self):
+        from src.executors import LocalSubprocessBackend
+
+        self._backend = LocalSubprocessBackend(["json"])
+        self.created = 0
+        self.destroyed = 0
+
+    def create(self):
+        self.created += 1
+        return self._backend.create()
+
+    def reset(self, executor):
+        self._backend.reset(executor)
+
+    def destroy(self, executor):
+        self.destroyed += 1
+        self._backend.destroy(executor)
+
+
+class TestExecutorPool:
+    def test_prewarmed_lease_is_reset_on_release(self):
+        from smolagents.utils import AgentError
+
+        from src.executors import ExecutorPool
+
+        backend = _CountingBackend()
+        pool = ExecutorPool(backend, min_idle=1, max_idle=2)
+        pool.start()
+        try:
+            _wait_for(lambda: pool.stats()["idle"] == 1)
+            executor = pool.lease()
+            assert pool.owns(executor)
+            executor("secret = 1")
+            # Refilled meanwhile; the released one is leased next
+            _wait_for(lambda: pool.stats()["idle"] == 1)
+            pool.release(executor)
+
+            again = pool.lease()
+            assert again is executor
+            with pytest.raises(AgentError, match="is not defined"):
+                again("secret")
+            pool.release(again)
+            stats = pool.stats()
+            assert stats["warm_leases"] == 2
+            assert stats["cold_leases"] == 0
+            assert stats["resets"] == 2
+        finally:
+            pool.close()
+        assert backend.destroyed == backend.created
+
+    def test_cold_lease_and_retirement(self):
+        from src.executors import ExecutorPool
+
+        backend = _CountingBackend()
+        pool = ExecutorPool(backend, min_idle=0, max_idle=1, max_age=3600)
+        first = pool.lease()
+        second = pool.lease()
+        assert pool.stats()["cold_leases"] == 2
+
+        pool.release(first)
+        # Only max_idle sandboxes are kept
+        pool.release(second)
+        assert pool.stats()["idle"] == 1
+        assert backend.destroyed == 1
+
+        third = pool.lease()
+        pool.discard(third)
+        assert not pool.owns(third)
+        assert backend.destroyed == 2
+        pool.close()
+
+    def test_reaps_idle_beyond_min_idle(self):
+        from src.executors import ExecutorPool
+
+        backend = _CountingBackend()
+        pool = ExecutorPool(
+            backend, min_idle=1, max_idle=3, idle_ttl=0.05, maintenance_interval=0.02
+        )
+        leased = [pool.lease() for _ in range(3)]
+        for executor in leased:
+            pool.release(executor)
+        pool.start()
+        try:
+            _wait_for(lambda: pool.stats()["reaped"] == 2)
+            assert pool.stats()["idle"] == 1
+        finally:
+            pool.close()
+        assert backend.destroyed == backend.created
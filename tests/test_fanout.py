@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+from smolagents.memory import ActionStep, TaskStep, Timing
+from smolagents.monitoring import TokenUsage
+
+
+class _Memory:
+    def __init__(self):
+        self.steps = []
+
+
+class _Agent:
+    def __init__(self, name):
+        self.name = name
+        self.memory = _Memory()
+        self.interrupted = False
+
+    def interrupt(self):
+        self.interrupted = True
+
+
+class _Harness:
+    def __init__(self, delay=0.01, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.running = 0
+        self.peak = 0
+        self.released = []
+
+    async def build(self, name):
+        return _Agent(name)
+
+    async def run(self, agent, task):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            agent.memory.steps.append(
+                ActionStep(
+                    step_number=1,
+                    timing=Timing(start_time=0.0),
+                    token_usage=TokenUsage(input_tokens=100, output_tokens=20),
+                )
+            )
+            if agent.name in self.fail:
+                raise RuntimeError("AccessDenied")
+            return f"{agent.name}: 2 instances"
+        finally:
+            self.running -= 1
+
+    def release(self, agent, recycle):
+        self.released.append((agent.name, recycle))
+
+
+class TestSubAgentFanOut:
+    def test_runs_sub_agents_with_bounded_parallelism(self):
+        from src.agents.fanout import SubAgentFanOut, region_subtasks
+
+        harness = _Harness()
+        events = []
+        fan_out = SubAgentFanOut(
+            harness.build,
+            harness.run,
+            harness.release,
+            max_parallel=2,
+            on_result=lambda name, result: events.append((name, result is None)),
+        )
+        regions = ["us-east-1", "us-east-2", "eu-west-1", "ap-south-1"]
+        results = asyncio.run(fan_out.run(region_subtasks("List EC2", regions)))
+
+        assert harness.peak == 2
+        assert [r.name for r in results] == regions
+        assert results[0].output == "us-east-1: 2 instances"
+        assert "Only investigate AWS region eu-west-1" in results[2].task
+        assert results[1].to_dict()["token_usage"] == {
+            "input_tokens": 100,
+            "output_tokens": 20,
+            "total_tokens": 120,
+        }
+        assert sorted(harness.released) == sorted((r, True) for r in regions)
+        assert events.count(("us-east-1", True)) == 1
+        assert events.count(("us-east-1", False)) == 1
+
+    def test_failed_sub_agent_is_reported_in_the_merge(self):
+        from src.agents.fanout import SubAgentFanOut, merge_task, region_subtasks
+
+        harness = _Harness(fail={"eu-west-1"})
+        fan_out = SubAgentFanOut(harness.build, harness.run, harness.release)
+        results = asyncio.run(
+            fan_out.run(region_subtasks("List EC2", ["us-east-1", "eu-west-1"]))
+        )
+
+        assert results[0].error is None
+        assert results[1].error == "AccessDenied"
+        # Tokens spent before the failure still count
+        assert results[1].input_tokens == 100
+        task = merge_task("List EC2", results)
+        assert task.startswith("List EC2")
+        assert "### us-east-1\nus-east-1: 2 instances" in task
+        assert "### eu-west-1\nFailed: AccessDenied" in task
+
+    def test_session_memory_keeps_the_query_as_the_task(self):
+        from src.agents.fanout import SubAgentResult, merge_task, restore_task
+
+        agent = _Agent("session")
+        task = merge_task("List EC2", [SubAgentResult("us-east-1", "", "2")])
+        agent.memory.steps = [TaskStep(task="Hi"), TaskStep(task=task)]
+
+        restore_task(agent, task, "List EC2")
+
+        assert [step.task for step in agent.memory.steps] == ["Hi", "List EC2"]
+
+    def test_cancel_interrupts_running_sub_agents(self):
+        from src.agents.fanout import SubAgentFanOut, region_subtasks
+
+        harness = _Harness(delay=60)
+        built = []
+
+        async def build(name):
+            agent = await harness.build(name)
+            built.append(agent)
+            return agent
+
+        async def scenario():
+            fan_out = SubAgentFanOut(build, harness.run, harness.release)
+            task = asyncio.create_task(
+                fan_out.run(region_subtasks("q", ["us-east-1", "us-west-2"]))
+            )
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+        assert all(agent.interrupted for agent in built)
+        assert sorted(harness.released) == [("us-east-1", False), ("us-west-2", False)]
@@ -0,0 +1,98 @@
+import pickle
+
+import pytest
+from smolagents.memory import ActionStep, FinalAnswerStep, PlanningStep, TaskStep, ToolCall
+from smolagents.models import ChatMessage, MessageRole
+from smolagents.monitoring import Timing, TokenUsage
+
+
+def make_action_step() -> ActionStep:
+    return ActionStep(
+        step_number=3,
+        timing=Timing(start_time=1.0, end_time=2.5),
+        model_input_messages=[ChatMessage(role=MessageRole.USER, content="huge prompt")],
+        tool_calls=[ToolCall(name="python_interpreter", arguments="print(1)", id="call_1")],
+        model_output_message=ChatMessage(role=MessageRole.ASSISTANT, content="Thought: list"),
+        model_output="Thought: list buckets",
+        code_action="print(1)",
+        observations="Execution logs:\n" + "bucket-name\n" * 200,
+        action_output={"count": 2},
+        token_usage=TokenUsage(input_tokens=120, output_tokens=30),
+        is_final_answer=False,
+    )
+
+
+class TestMemoryCodec:
+    def test_action_step_round_trip(self):
+        from src.session.memory_codec import decode_step, encode_step
+
+        step = make_action_step()
+        restored = decode_step(encode_step(step))
+
+        assert isinstance(restored, ActionStep)
+        assert restored.step_number == 3
+        assert restored.observations == step.observations
+        assert restored.code_action == "print(1)"
+        assert restored.tool_calls[0].id == "call_1"
+        assert restored.token_usage.total_tokens == 150
+        assert restored.timing.duration == 1.5
+        assert restored.model_output_message.content == "Thought: list"
+        # Prompt history is rebuilt by the agent, not stored
+        assert restored.model_input_messages is None
+        assert restored.to_messages() == step.to_messages()
+
+    def test_planning_task_and_final_steps_round_trip(self):
+        from src.session.memory_codec import decode_step, encode_step
+
+        planning = PlanningStep(
+            model_input_messages=[],
+            model_output_message=ChatMessage(role=MessageRole.ASSISTANT, content="plan"),
+            plan="1. list buckets",
+            timing=Timing(start_time=0.0, end_time=1.0),
+        )
+        assert decode_step(encode_step(planning)).plan == "1. list buckets"
+        assert decode_step(encode_step(TaskStep(task="list buckets"))).task == "list buckets"
+        assert decode_step(encode_step(FinalAnswerStep(output="done"))).output == "done"
+
+    def test_error_is_restored_with_type(self):
+        from smolagents.utils import AgentExecutionError
+
+        from src.session.memory_codec import decode_step, encode_step
+
+        step = make_action_step()
+        error = AgentExecutionError.__new__(AgentExecutionError)
+        Exception.__init__(error, "boom")
+        error.message = "boom"
+        step.error = error
+
+        restored = decode_step(encode_step(step))
+        assert isinstance(restored.error, AgentExecutionError)
+        assert str(restored.error) == "boom"
+
+    def test_large_payloads_are_compressed(self):
+        from src.session.memory_codec import COMPRESSION_NONE, MAGIC, encode_step
+
+        payload = encode_step(make_action_step())
+        assert payload.startswith(MAGIC)
+        assert payload[3] != COMPRESSION_NONE
+        assert len(payload) < len(pickle.dumps(make_action_step()))
+
+    def test_legacy_pickled_step_is_decoded(self):
+        from src.session.memory_codec import decode_step
+
+        restored = decode_step(pickle.dumps(TaskStep(task="legacy")))
+        assert restored.task == "legacy"
+
+    def test_newer_schema_version_is_rejected(self):
+        from src.session.memory_codec import MemoryCodecError, decode_step, encode_step
+
+        payload = bytearray(encode_step(TaskStep(task="x")))
+        payload[2] = 255
+        with pytest.raises(MemoryCodecError):
+            decode_step(bytes(payload))
+
+    def test_corrupted_payload_raises_codec_error(self):
+        from src.session.memory_codec import MAGIC, MemoryCodecError, decode_step
+
+        with pytest.raises(MemoryCodecError):
+            decode_step(MAGIC + bytes([1, 1]) + b"not zlib")
@@ -0,0 +1,179 @@
+import asyncio
+
+
+class FakeDatabase:
+    def __init__(self, fail: bool = False, deleted=()):
+        self.batches = []
+        self.fail = fail
+        self.deleted = set(deleted)
+
+    async def save_step_tokens(self, rows):
+        from sqlalchemy.exc import IntegrityError
+
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        if any(row["session_id"] in self.deleted for row in rows):
+            raise IntegrityError("INSERT", {}, Exception("foreign key violation"))
+        self.batches.append(rows)
+
+
+class SlowDatabase(FakeDatabase):
+    def __init__(self):
+        super().__init__()
+        self.saving = None
+
+    async def save_step_tokens(self, rows):
+        self.saving.set()
+        await asyncio.sleep(0.2)
+        await super().save_step_tokens(rows)
+
+
+class TestStepMetricsWriter:
+    def test_coalesces_duplicate_steps(self):
+        from src.session.metrics_writer import StepMetricsWriter
+
+        db = FakeDatabase()
+        writer = StepMetricsWriter(db, batch_size=100, flush_interval=60)
+        writer.submit("s1", 1, 1, "ActionStep", 10, 5)
+        writer.submit("s1", 1, 1, "ActionStep", 20, 8)
+        writer.submit("s1", 1, 2, "PlanningStep", 3, 2)
+
+        asyncio.run(writer.flush())
+
+        assert len(db.batches) == 1
+        rows = {row["step_number"]: row for row in db.batches[0]}
+        assert rows[1]["input_tokens"] == 20
+        assert rows[2]["step_type"] == "PlanningStep"
+        assert writer.stats()["flushed_rows"] == 2
+
+    def test_drops_when_buffer_full(self):
+        from src.session.metrics_writer import StepMetricsWriter
+
+        writer = StepMetricsWriter(FakeDatabase(), max_pending=1)
+        assert writer.submit("s1", 1, 1, "ActionStep", 1, 1) is True
+        assert writer.submit("s1", 1, 2, "ActionStep", 1, 1) is False
+        # Updating an already buffered step is never dropped
+        assert writer.submit("s1", 1, 1, "ActionStep", 2, 2) is True
+        assert writer.stats()["dropped_rows"] == 1
+
+    def test_failed_flush_requeues_rows(self):
+        from src.session.metrics_writer import StepMetricsWriter
+
+        db = FakeDatabase(fail=True)
+        writer = StepMetricsWriter(db)
+        writer.submit("s1", 1, 1, "ActionStep", 1, 1)
+
+        asyncio.run(writer.flush())
+
+        stats = writer.stats()
+        assert stats["failed_flushes"] == 1
+        assert stats["pending"] == 1
+
+    def test_transient_failures_are_retried_a_bounded_number_of_times(self):
+        from src.session.metrics_writer import StepMetricsWriter
+
+        db = FakeDatabase(fail=True)
+        writer = StepMetricsWriter(db, max_attempts=3)
+        writer.submit("s1", 1, 1, "ActionStep", 1, 1)
+
+        for _ in range(5):
+            asyncio.run(writer.flush())
+
+        stats = writer.stats()
+        assert stats["failed_flushes"] == 3
+        assert stats["retried_rows"] == 2
+        assert stats["dropped_rows"] == 1
+        assert stats["pending"] == 0
+
+    def test_rows_of_a_deleted_session_do_not_block_the_batch(self):
+        from src.session.metrics_writer import StepMetricsWriter
+
+        db = FakeDatabase(deleted={"gone"})
+        writer = StepMetricsWriter(db)
+        writer.submit("s1", 1, 1, "ActionStep", 1, 1)
+        writer.submit("gone", 1, 1, "ActionStep", 1, 1)
+        writer.submit("gone", 1, 2, "ActionStep", 1, 1)
+        writer.submit("s2", 1, 1, "ActionStep", 1, 1)
+
+        asyncio.run(writer.flush())
+
+        written = {row["session_id"] for batch in db.batches for row in batch}
+        assert written == {"s1", "s2"}
+        stats = writer.stats()
+        assert stats["flushed_rows"] == 2
+        assert stats["rejected_rows"] == 2
+        assert stats["dropped_rows"] == 2
+        # Rejected rows are not retried
+        assert stats["pending"] == 0
+
+    def test_close_drains_pending_rows(self):
+        from src.session.metrics_writer import StepMetricsWriter
+
+        db = FakeDatabase()
+
+        async def run():
+            writer = StepMetricsWriter(db, batch_size=100, flush_interval=60)
+            writer.start()
+            writer.submit("s1", 2, 1, "ActionStep", 4, 4)
+            await writer.close()
+            return writer
+
+        writer = asyncio.run(run())
+        assert db.batches and db.batches[0][0]["run_number"] == 2
+        assert writer.stats()["pending"] == 0
+
+    def test_close_waits_for_the_flush_in_flight(self):
+        from src.session.metrics_writer import StepMetricsWriter
+
+        db = SlowDatabase()
+
+        async def run():
+            db.saving = asyncio.Event()
+            writer = StepMetricsWriter(db, batch_size=1, flush_interval=60)
+            writer.start()
+            writer.submit("s1", 1, 1, "ActionStep", 1, 1)
+            await db.saving.wait()
+            writer.submit("s1", 1, 2, "ActionStep", 1, 1)
+            await writer.close()
+            return writer
+
+        writer = asyncio.run(run())
+        written = [row["step_number"] for batch in db.batches for row in batch]
+        assert sorted(written) == [1, 2]
+        assert writer.stats()["pending"] == 0
+
+    def test_close_drops_rows_it_cannot_write(self):
+        from src.session.metrics_writer import StepMetricsWriter
+
+        db = FakeDatabase(fail=True)
+
+        async def run():
+            writer = StepMetricsWriter(db, flush_interval=60, max_attempts=2)
+            writer.start()
+            writer.submit("s1", 1, 1, "ActionStep", 1, 1)
+            await writer.close()
+            return writer.stats()
+
+        stats = asyncio.run(run())
+        assert stats["failed_flushes"] == 2
+        assert stats["dropped_rows"] == 1
+        assert stats["pending"] == 0
+
+    def test_batch_size_triggers_flush(self):
+        from src.session.metrics_writer import StepMetricsWriter
+
+        db = FakeDatabase()
+
+        async def run():
+            writer = StepMetricsWriter(db, batch_size=2, flush_interval=60)
+            writer.start()
+            writer.submit("s1", 1, 1, "ActionStep", 1, 1)
+            writer.submit("s1", 1, 2, "ActionStep", 1, 1)
+            for _ in range(50):
+                if db.batches:
+                    break
+                await asyncio.sleep(0.01)
+            await writer.close()
+
+        asyncio.run(run())
+        assert len(db.batches[0]) == 2
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+
+class FakeEventDatabase:
+    def __init__(self):
+        self.events = []
+
+    async def get_run_events(self, session_id, run_number, after_seq=0):
+        return [event for event in self.events if event[0] > after_seq]
+
+
+def _notify(bus, message: dict) -> None:
+    # As the listening connection delivers a notification
+    bus._on_event(None, 0, "cora_run_events", json.dumps(message))
+
+
+async def _seqs(events) -> list:
+    return [(entry.seq, entry.event_type) async for entry in events]
+
+
+class TestInMemoryRunRegistry:
+    def test_one_claim_per_session(self):
+        from src.runs import InMemoryRunRegistry
+
+        async def scenario():
+            registry = InMemoryRunRegistry("w1")
+            assert await registry.claim("s1")
+            assert not await registry.claim("s1")
+            await registry.update("s1", 3, {"state": "running"})
+            claim = await registry.active("s1")
+            await registry.release("s1")
+            return claim, await registry.active("s1"), await registry.claim("s1")
+
+        claim, released, reclaimed = asyncio.run(scenario())
+        assert (claim.worker_id, claim.run_number) == ("w1", 3)
+        assert claim.snapshot == {"state": "running"}
+        assert released is None
+        assert reclaimed
+
+    def test_commands_reach_only_their_worker(self):
+        from src.streaming import InMemoryEventBus
+
+        received = []
+        bus = InMemoryEventBus("w1")
+        bus.on_command(received.append)
+        asyncio.run(bus.send_command("w2", {"op": "cancel", "session_id": "s1"}))
+        asyncio.run(bus.send_command("w1", {"op": "cancel", "session_id": "s1"}))
+        assert received == [{"op": "cancel", "session_id": "s1"}]
+
+
+class TestPostgresEventBusFollow:
+    def test_stored_then_notified_events(self):
+        from src.streaming import PostgresEventBus
+
+        db = FakeEventDatabase()
+        db.events = [(1, "message", '{"type": "message"}')]
+
+        async def still_running():
+            return True
+
+        async def scenario():
+            bus = PostgresEventBus(db, "w2", idle_timeout=0.05)
+            follower = asyncio.create_task(
+                _seqs(bus.follow("s1", 4, 0, still_running))
+            )
+            await asyncio.sleep(0.01)
+            run = {"s": "s1", "r": 4}
+            # Already read from the database
+            _notify(bus, {**run, "q": 1, "t": "message", "d": "{}"})
+            _notify(bus, {**run, "q": 2, "t": "delta", "d": '{"type": "delta"}'})
+            # Too large to notify; the follower reads it back
+            db.events.append((3, "action", '{"type": "action"}'))
+            _notify(bus, {**run, "q": 3, "t": "action"})
+            _notify(bus, {"s": "s1", "r": 5, "q": 1, "t": "message", "d": "{}"})
+            db.events.append((4, "done", '{"type": "done"}'))
+            _notify(bus, {**run, "closed": 4})
+            return await asyncio.wait_for(follower, timeout=5)
+
+        events = asyncio.run(scenario())
+        assert events == [(1, "message"), (2, "delta"), (3, "action"), (4, "done")]
+
+    def test_run_of_a_dead_worker_ends_from_the_database(self):
+        from src.streaming import PostgresEventBus
+
+        db = FakeEventDatabase()
+        db.events = [(1, "message", "{}")]
+        checks = []
+
+        async def still_running():
+            checks.append(True)
+            db.events.append((2, "error", "{}"))
+            return False
+
+        async def scenario():
+            bus = PostgresEventBus(db, "w2", idle_timeout=0.01)
+            events = await asyncio.wait_for(
+                _seqs(bus.follow("s1", 1, 0, still_running)), timeout=5
+            )
+            return events, bus.stats()["followers"]
+
+        events, followers = asyncio.run(scenario())
+        assert events == [(1, "message"), (2, "error")]
+        assert len(checks) == 1
+        assert followers == 0
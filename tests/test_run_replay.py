@@ -0,0 +1,166 @@
+import asyncio
+import json
+
+
+class FakeEventDatabase:
+    def __init__(self):
+        self.runs = {}
+
+    async def save_run_events(self, session_id, run_number, events):
+        self.runs[(session_id, run_number)] = list(events)
+
+    async def get_run_events(self, session_id, run_number, after_seq=0):
+        events = self.runs.get((session_id, run_number), [])
+        return [event for event in events if event[0] > after_seq]
+
+
+async def _collect(events) -> list:
+    return [json.loads(entry.data) async for entry in events]
+
+
+class TestParseEventId:
+    def test_round_trip(self):
+        from src.streaming import format_event_id, parse_event_id
+
+        assert parse_event_id(format_event_id(3, 17)) == (3, 17)
+
+    def test_malformed(self):
+        from src.streaming import parse_event_id
+
+        assert parse_event_id("garbage") is None
+        assert parse_event_id("3:") is None
+
+
+class TestRunEventLog:
+    def test_replays_only_missed_events_then_live(self):
+        from src.streaming import RunEventLog
+
+        async def scenario():
+            log = RunEventLog("s1", 2, asyncio.get_running_loop())
+            for step in range(1, 4):
+                log.append({"type": "action", "step_number": step})
+
+            follower = asyncio.create_task(_collect(log.follow(after_seq=2)))
+            await asyncio.sleep(0)
+            log.append({"type": "action", "step_number": 4})
+            log.append({"type": "done"})
+            log.close()
+            return await asyncio.wait_for(follower, timeout=5)
+
+        events = asyncio.run(scenario())
+        assert [e.get("step_number") for e in events] == [3, 4, None]
+        assert [e["event_id"] for e in events] == ["2:3", "2:4", "2:5"]
+
+    def test_evicted_events_are_reported(self):
+        from src.streaming import RunEventLog
+
+        async def scenario():
+            log = RunEventLog("s1", 1, asyncio.get_running_loop(), capacity=3)
+            for step in range(1, 6):
+                log.append({"type": "action", "step_number": step})
+            log.close()
+            return await _collect(log.follow()), log.stats()
+
+        events, stats = asyncio.run(scenario())
+        assert events[0] == {
+            "type": "replay_truncated",
+            "missed_events": 2,
+            "event_id": "1:2",
+        }
+        assert [e["step_number"] for e in events[1:]] == [3, 4, 5]
+        assert stats["evicted"] == 2
+
+    def test_deltas_do_not_evict_step_events(self):
+        from src.streaming import RunEventLog
+
+        async def scenario():
+            log = RunEventLog(
+                "s1", 1, asyncio.get_running_loop(), capacity=3, delta_capacity=4
+            )
+            log.append({"type": "action", "step_number": 1})
+            for n in range(10):
+                log.append({"type": "delta", "step_number": 2, "content": str(n)})
+            # Reattaching mid-step gets the latest deltas
+            mid_step = asyncio.create_task(_collect(log.follow()))
+            await asyncio.sleep(0)
+            log.append({"type": "action", "step_number": 2})
+            log.close()
+            return await mid_step, await _collect(log.follow()), log.stats()
+
+        mid_step, events, stats = asyncio.run(scenario())
+        assert [e.get("content") for e in mid_step] == [
+            None, "6", "7", "8", "9", None
+        ]
+        assert [(e["type"], e["event_id"]) for e in events] == [
+            ("action", "1:1"),
+            ("action", "1:12"),
+        ]
+        assert stats["evicted"] == 0
+        assert stats["buffered_deltas"] == 0
+
+    def test_followers_share_frames_with_independent_cursors(self):
+        from src.streaming import RunEventLog
+
+        async def scenario():
+            log = RunEventLog("s1", 1, asyncio.get_running_loop())
+            log.append({"type": "message"})
+
+            async def follow(after_seq):
+                return [entry async for entry in log.follow(after_seq)]
+
+            followers = [asyncio.create_task(follow(n % 2)) for n in range(10)]
+            await asyncio.sleep(0)
+            assert log.stats()["followers"] == 10
+            log.append({"type": "action", "step_number": 1})
+            log.close()
+            return await asyncio.gather(*followers), log.stats()
+
+        results, stats = asyncio.run(scenario())
+        assert [len(r) for r in results] == [2, 1] * 5
+        # Every follower received the same encoded frame object
+        assert len({id(r[-1].frame) for r in results}) == 1
+        assert results[0][0].frame.startswith(b"id: 1:1\r\ndata: ")
+        assert stats["followers"] == 0
+        assert stats["peak_followers"] == 10
+
+    def test_append_after_close_is_ignored(self):
+        from src.streaming import RunEventLog
+
+        async def scenario():
+            log = RunEventLog("s1", 1, asyncio.get_running_loop())
+            log.close()
+            return log.append({"type": "action"})
+
+        assert asyncio.run(scenario()) is None
+
+
+class TestRunEventRegistry:
+    def test_completed_run_is_replayed_from_database(self):
+        from src.streaming import RunEventRegistry
+
+        db = FakeEventDatabase()
+
+        async def scenario():
+            registry = RunEventRegistry(db)
+            log = registry.open("s1", 1)
+            log.append({"type": "message", "content": "hi"})
+            log.append({"type": "done"})
+            registry.complete(log)
+            await registry.close()
+
+            assert registry.get("s1", 1) is None
+            replay = await registry.replay("s1", 1, after_seq=1)
+            return await _collect(replay), registry.stats()
+
+        events, stats = asyncio.run(scenario())
+        assert events == [{"type": "done", "event_id": "1:2"}]
+        assert stats["spilled_events"] == 2
+        assert db.runs[("s1", 1)][0][1] == "message"
+
+    def test_unknown_run(self):
+        from src.streaming import RunEventRegistry
+
+        async def scenario():
+            return await RunEventRegistry(FakeEventDatabase()).replay("s1", 9)
+
+        assert asyncio.run(scenario()) is None
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+
+import pytest
+
+
+class TestRunScheduler:
+    def test_limits_concurrent_runs(self):
+        from src.runs import RunScheduler
+
+        async def scenario():
+            scheduler = RunScheduler(max_concurrent=2)
+            release = asyncio.Event()
+            running = []
+            peak = 0
+
+            async def run(key):
+                nonlocal peak
+                async with scheduler.slot(key):
+                    running.append(key)
+                    peak = max(peak, len(running))
+                    await release.wait()
+                    running.remove(key)
+
+            tasks = [asyncio.create_task(run(f"s{i}")) for i in range(5)]
+            await asyncio.sleep(0.01)
+            stats = scheduler.stats()
+            assert stats["running"] == 2
+            assert stats["queued"] == 3
+            release.set()
+            await asyncio.gather(*tasks)
+            scheduler.shutdown()
+            return peak, scheduler.stats()
+
+        peak, stats = asyncio.run(scenario())
+        assert peak == 2
+        assert stats["running"] == 0
+        assert stats["admitted"] == 5
+        assert stats["queued_runs"] == 3
+
+    def test_keys_take_turns(self):
+        from src.runs import RunScheduler
+
+        async def scenario():
+            scheduler = RunScheduler(max_concurrent=1)
+            order = []
+            positions = {}
+            blocker = await scheduler.acquire("busy")
+
+            async def run(key, name):
+                def on_position(position):
+                    positions.setdefault(name, []).append(position)
+
+                async with scheduler.slot(key, on_position):
+                    order.append(name)
+
+            # One user's burst is queued ahead of a second user's single run
+            tasks = [
+                asyncio.create_task(run("alice", "a1")),
+                asyncio.create_task(run("alice", "a2")),
+                asyncio.create_task(run("alice", "a3")),
+            ]
+            await asyncio.sleep(0)
+            tasks.append(asyncio.create_task(run("bob", "b1")))
+            await asyncio.sleep(0)
+            scheduler.release(blocker)
+            await asyncio.gather(*tasks)
+            scheduler.shutdown()
+            return order, positions
+
+        order, positions = asyncio.run(scenario())
+        assert order == ["a1", "b1", "a2", "a3"]
+        # Bob's run jumps ahead of Alice's backlog as soon as it is queued
+        assert positions["b1"] == [2, 1]
+        assert positions["a2"] == [2, 3, 2, 1]
+        assert positions["a3"] == [3, 4, 3, 2, 1]
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        from src.runs import RunScheduler
+
+        async def scenario():
+            scheduler = RunScheduler(max_concurrent=1)
+            blocker = await scheduler.acquire("s1")
+            waiting = asyncio.create_task(scheduler.acquire("s2"))
+            await asyncio.sleep(0)
+            assert scheduler.queued == 1
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            scheduler.release(blocker)
+            scheduler.shutdown()
+            return scheduler.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["queued"] == 0
+        assert stats["running"] == 0
+        assert stats["abandoned"] == 1
+
+    def test_waiter_cancelled_as_a_slot_frees_up(self):
+        from src.runs import RunScheduler
+
+        async def scenario():
+            scheduler = RunScheduler(max_concurrent=1)
+            blocker = await scheduler.acquire("a")
+            cancelled = asyncio.create_task(scheduler.acquire("b"))
+            admitted = asyncio.create_task(scheduler.acquire("c"))
+            await asyncio.sleep(0)
+            # Same tick: the waiting task has not seen its cancellation yet
+            cancelled.cancel()
+            scheduler.release(blocker)
+            with pytest.raises(asyncio.CancelledError):
+                await cancelled
+            ticket = await asyncio.wait_for(admitted, timeout=5)
+            stats = scheduler.stats()
+            scheduler.release(ticket)
+            scheduler.shutdown()
+            return ticket.key, stats
+
+        key, stats = asyncio.run(scenario())
+        assert key == "c"
+        assert stats["running"] == 1
+        assert stats["queued"] == 0
+        assert stats["abandoned"] == 1
+
+    def test_runs_work_on_dedicated_threads(self):
+        from src.runs import RunScheduler
+
+        async def scenario():
+            scheduler = RunScheduler(max_concurrent=1)
+            async with scheduler.slot("s1"):
+                name = await scheduler.run_in_worker(
+                    lambda: threading.current_thread().name
+                )
+            scheduler.shutdown()
+            return name, scheduler.stats()
+
+        name, stats = asyncio.run(scenario())
+        assert name.startswith("agent-run")
+        assert stats["avg_run_ms"] > 0
@@ -0,0 +1,185 @@
+import asyncio
+import contextvars
+
+
+class _Agent:
+    def __init__(self) -> None:
+        self.interrupted = False
+
+    def interrupt(self) -> None:
+        self.interrupted = True
+
+
+class TestRunSupervisor:
+    def test_one_active_run_per_session(self):
+        from src.runs import RunSupervisor
+
+        supervisor = RunSupervisor()
+        record = supervisor.claim("s1")
+        assert record is not None
+        assert supervisor.claim("s1") is None
+        assert supervisor.claim("s2") is not None
+
+        supervisor.release(record)
+        assert supervisor.active("s1") is None
+        assert supervisor.claim("s1") is not None
+
+    def test_run_outlives_its_caller(self):
+        from src.runs import RunState, RunSupervisor
+
+        async def scenario():
+            supervisor = RunSupervisor()
+            record = supervisor.claim("s1")
+            record.run_number = 1
+            started = asyncio.Event()
+
+            async def runner(record):
+                record.mark_running()
+                started.set()
+                await asyncio.sleep(0.01)
+
+            supervisor.start(record, runner)
+            await started.wait()
+            assert supervisor.active("s1").state == RunState.RUNNING
+            await record.task
+            return supervisor, record
+
+        supervisor, record = asyncio.run(scenario())
+        assert record.state == RunState.COMPLETED
+        assert supervisor.active("s1") is None
+        assert supervisor.get("s1", 1) is record
+        assert supervisor.stats()["completed"] == 1
+
+    def test_failure_is_recorded(self):
+        from src.runs import RunState, RunSupervisor
+
+        async def scenario():
+            supervisor = RunSupervisor()
+            record = supervisor.claim("s1")
+            record.run_number = 1
+
+            async def runner(record):
+                raise RuntimeError("model unavailable")
+
+            supervisor.start(record, runner)
+            await record.task
+            return record
+
+        record = asyncio.run(scenario())
+        assert record.state == RunState.FAILED
+        assert record.error == "model unavailable"
+
+    def test_cancel_interrupts_agent(self):
+        from src.runs import RunState, RunSupervisor
+
+        async def scenario():
+            supervisor = RunSupervisor()
+            record = supervisor.claim("s1")
+            record.run_number = 1
+            cleaned_up = asyncio.Event()
+
+            async def runner(record):
+                record.agent = agent
+                try:
+                    await asyncio.sleep(60)
+                finally:
+                    cleaned_up.set()
+
+            agent = _Agent()
+            supervisor.start(record, runner)
+            await asyncio.sleep(0)
+            assert supervisor.cancel("s1") is True
+            await record.task
+            assert cleaned_up.is_set()
+            assert supervisor.cancel("s1") is False
+            return record, agent
+
+        record, agent = asyncio.run(scenario())
+        assert agent.interrupted
+        assert record.state == RunState.CANCELLED
+
+    def test_history_is_bounded(self):
+        from src.runs import RunSupervisor
+
+        async def scenario():
+            supervisor = RunSupervisor(history_size=2)
+
+            async def runner(record):
+                pass
+
+            for run_number in range(1, 4):
+                record = supervisor.claim("s1")
+                record.run_number = run_number
+                supervisor.start(record, runner)
+                await record.task
+            return supervisor
+
+        supervisor = asyncio.run(scenario())
+        assert supervisor.get("s1", 1) is None
+        assert supervisor.get("s1", 3) is not None
+
+    def test_deadlines_time_out_the_run(self):
+        from src.runs import CancelReason, RunState, RunSupervisor
+
+        async def scenario():
+            supervisor = RunSupervisor(
+                run_timeout=0.5, step_timeout=0.15, watch_interval=0.01
+            )
+            record = supervisor.claim("s1")
+            record.run_number = 1
+            interrupted_code = []
+            record.cancel_token.on_cancel(lambda: interrupted_code.append(True))
+
+            async def runner(record):
+                # Time spent queued does not count against the deadlines
+                await asyncio.sleep(0.2)
+                record.mark_running()
+                record.agent = agent
+                for _ in range(3):
+                    await asyncio.sleep(0.1)
+                    record.cancel_token.next_step()
+                # A step that stalls
+                await asyncio.sleep(60)
+
+            agent = _Agent()
+            supervisor.start(record, runner)
+            await record.task
+            return supervisor, record, agent, interrupted_code
+
+        supervisor, record, agent, interrupted_code = asyncio.run(scenario())
+        assert record.state == RunState.TIMED_OUT
+        assert record.error == "Step exceeded its 0.15s time limit"
+        assert record.cancel_token.reason is CancelReason.TIMED_OUT
+        assert 0.4 < record.finished_at - record.created_at < 1
+        assert agent.interrupted
+        assert interrupted_code == [True]
+        assert supervisor.stats()["timed_out"] == 1
+
+    def test_cancel_token_is_observed_in_threads(self):
+        import pytest
+
+        from src.runs import (
+            CancelToken,
+            RunCancelled,
+            current_cancel_token,
+            set_cancel_token,
+        )
+
+        token = CancelToken()
+
+        async def scenario():
+            set_cancel_token(token)
+            loop = asyncio.get_running_loop()
+            # Worker threads of the run see its token through the context
+            return await loop.run_in_executor(
+                None, contextvars.copy_context().run, current_cancel_token
+            )
+
+        assert asyncio.run(scenario()) is token
+        token.raise_if_cancelled()
+        unregister = token.on_cancel(lambda: pytest.fail("unregistered"))
+        unregister()
+        assert token.cancel() is True
+        assert token.cancel() is False
+        with pytest.raises(RunCancelled, match="interrupted"):
+            token.raise_if_cancelled()
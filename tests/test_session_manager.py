@@ -0,0 +1,145 @@
+import asyncio
+import pickle
+
+
+class FakeStepDatabase:
+    def __init__(self, legacy_blob=None):
+        self.rows = {}
+        self.legacy_blob = legacy_blob
+        self.appended = []
+
+    async def get_agent_step_count(self, session_id):
+        return len(self.rows.get(session_id, []))
+
+    async def truncate_agent_steps(self, session_id, from_index):
+        self.rows[session_id] = self.rows.get(session_id, [])[:from_index]
+
+    async def append_agent_steps(
+        self, session_id, run_number, start_index, steps, clear_legacy_blob=False
+    ):
+        self.appended.append((start_index, len(steps)))
+        rows = self.rows.setdefault(session_id, [])
+        assert len(rows) == start_index
+        rows.extend(payload for _, payload in steps)
+        if clear_legacy_blob:
+            self.legacy_blob = None
+
+    async def stream_agent_steps(self, session_id):
+        for payload in self.rows.get(session_id, []):
+            yield payload
+
+    async def get_legacy_agent_steps(self, session_id):
+        return self.legacy_blob
+
+
+class TestAgentStepPersistence:
+    def test_only_new_steps_are_appended(self):
+        from src.session.manager import SessionManager
+
+        db = FakeStepDatabase()
+        manager = SessionManager(db=db)
+
+        async def run():
+            await manager.persist_agent_steps("s1", 1, ["a", "b"])
+            await manager.persist_agent_steps("s1", 2, ["a", "b", "c"])
+            return await manager.load_agent_state("s1")
+
+        assert asyncio.run(run()) == ["a", "b", "c"]
+        assert db.appended == [(0, 2), (2, 1)]
+
+    def test_legacy_blob_is_migrated_on_next_save(self):
+        from src.session.manager import SessionManager
+
+        db = FakeStepDatabase(legacy_blob=pickle.dumps(["old"]))
+        manager = SessionManager(db=db)
+
+        async def run():
+            steps = await manager.load_agent_state("s1")
+            await manager.persist_agent_steps("s1", 2, steps + ["new"])
+
+        asyncio.run(run())
+        assert len(db.rows["s1"]) == 2
+        assert db.legacy_blob is None
+
+    def test_reset_memory_replaces_stored_steps(self):
+        from src.session.manager import SessionManager
+
+        db = FakeStepDatabase()
+        manager = SessionManager(db=db)
+
+        async def run():
+            await manager.persist_agent_steps("s1", 1, ["a", "b"])
+            await manager.persist_agent_steps("s1", 2, ["z"])
+
+        asyncio.run(run())
+        assert len(db.rows["s1"]) == 1
+        assert asyncio.run(manager.load_agent_state("s1")) == ["z"]
+
+
+    def test_steps_are_decoded_off_the_event_loop(self, monkeypatch):
+        import threading
+
+        from src.session import manager as manager_module
+        from src.session.manager import SessionManager
+
+        decoded_in = []
+
+        def decode(payload):
+            decoded_in.append(threading.get_ident())
+            return pickle.loads(payload)
+
+        monkeypatch.setattr(manager_module, "decode_step", decode)
+        db = FakeStepDatabase()
+        db.rows["s1"] = [pickle.dumps("a"), pickle.dumps("b")]
+
+        steps = asyncio.run(SessionManager(db=db).load_agent_state("s1"))
+        assert steps == ["a", "b"]
+        assert len(decoded_in) == 2
+        assert threading.get_ident() not in decoded_in
+
+
+class TestSessionCache:
+    def test_lru_eviction_and_stats(self):
+        from src.session.cache import SessionCache
+
+        cache = SessionCache(max_entries=2)
+        cache.put_memory("a", ["x"], 1)
+        cache.put_memory("b", ["y"], 1)
+        assert cache.get_memory("a") is not None
+        cache.put_memory("c", ["z"], 1)
+
+        assert cache.get_memory("b") is None
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["memory_hits"] == 1
+        assert stats["memory_misses"] == 1
+
+    def test_session_metadata_expires_after_ttl(self):
+        from unittest.mock import MagicMock
+
+        from src.session.cache import SessionCache
+
+        session = MagicMock(id="s1")
+        cache = SessionCache(ttl=0)
+        cache.put_session(session)
+        assert cache.get_session("s1") is None
+
+        cache = SessionCache(ttl=60)
+        cache.put_session(session)
+        assert cache.get_session("s1") is session
+        cache.invalidate_session("s1")
+        assert cache.get_session("s1") is None
+
+    def test_cached_memory_is_revalidated_against_stored_count(self):
+        from src.session.manager import SessionManager
+
+        db = FakeStepDatabase()
+        manager = SessionManager(db=db)
+
+        async def run():
+            await manager.persist_agent_steps("s1", 1, ["a"])
+            # Another process appends a step behind this manager's back
+            db.rows["s1"].append(pickle.dumps("b"))
+            return await manager.load_agent_state("s1")
+
+        assert asyncio.run(run()) == ["a", "b"]
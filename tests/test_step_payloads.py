@@ -0,0 +1,53 @@
+import hashlib
+
+
+class FailingStore:
+    def put(self, data, content_type):
+        raise OSError("disk full")
+
+
+class TestStepPayloadCapper:
+    def test_caps_long_fields_and_stores_full_text(self, tmp_path):
+        from src.artifacts import LocalArtifactStore
+        from src.streaming import StepPayloadCapper
+
+        store = LocalArtifactStore(tmp_path)
+        capper = StepPayloadCapper({"observations": 10, "plan": 100}, store)
+        observations = "é" * 50
+        event = capper.cap(
+            {"type": "action", "observations": observations, "plan": "short"},
+            "http://host/",
+        )
+
+        full = observations.encode("utf-8")
+        key = hashlib.sha256(full).hexdigest()
+        assert event["observations"] == "é" * 10
+        assert event["plan"] == "short"
+        assert event["truncated_fields"] == {
+            "observations": {
+                "bytes": len(full),
+                "sha256": key,
+                "url": f"http://host/artifacts/{key}",
+            }
+        }
+        assert store.get_object(key) == full
+        assert capper.stats()["capped_fields"] == 1
+
+    def test_short_events_are_untouched(self):
+        from src.streaming import StepPayloadCapper
+
+        event = {"type": "action", "observations": "ok"}
+        assert StepPayloadCapper({"observations": 10}).cap(event) == {
+            "type": "action",
+            "observations": "ok",
+        }
+
+    def test_store_failure_still_caps(self):
+        from src.streaming import StepPayloadCapper
+
+        capper = StepPayloadCapper({"observations": 3}, FailingStore())
+        event = capper.cap({"observations": "abcdef"})
+
+        assert event["observations"] == "abc"
+        assert event["truncated_fields"]["observations"]["url"] is None
+        assert capper.stats()["failed_stores"] == 1
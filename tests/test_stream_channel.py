@@ -0,0 +1,166 @@
+import asyncio
+import threading
+
+
+def _action(step_number: int, observations: str = "") -> dict:
+    return {
+        "type": "action",
+        "run_number": 1,
+        "step_number": step_number,
+        "observations": observations,
+    }
+
+
+async def _drain(channel) -> list:
+    return [event async for event in channel]
+
+
+class TestStepEventChannel:
+    def test_close_ends_iteration_after_backlog(self):
+        from src.streaming import StepEventChannel
+
+        async def scenario():
+            channel = StepEventChannel(asyncio.get_running_loop())
+            channel.publish(_action(1))
+            channel.publish(_action(2))
+            channel.close()
+            assert channel.publish(_action(3)) is False
+            return await _drain(channel), channel.stats()
+
+        events, stats = asyncio.run(scenario())
+        assert [e["step_number"] for e in events] == [1, 2]
+        assert stats["delivered"] == 2
+        assert stats["pending"] == 0
+
+    def test_wakes_consumer_from_agent_thread(self):
+        from src.streaming import StepEventChannel
+
+        async def scenario():
+            channel = StepEventChannel(asyncio.get_running_loop())
+
+            def produce():
+                for step in range(1, 4):
+                    channel.publish(_action(step))
+                channel.close()
+
+            consumer = asyncio.create_task(_drain(channel))
+            await asyncio.sleep(0)
+            thread = threading.Thread(target=produce)
+            thread.start()
+            events = await asyncio.wait_for(consumer, timeout=5)
+            thread.join()
+            return events
+
+        events = asyncio.run(scenario())
+        assert [e["step_number"] for e in events] == [1, 2, 3]
+
+    def test_drop_oldest_strips_observations_first(self):
+        from src.streaming import OverflowPolicy, StepEventChannel
+
+        async def scenario():
+            channel = StepEventChannel(
+                asyncio.get_running_loop(),
+                max_pending_bytes=3000,
+                policy=OverflowPolicy.DROP_OLDEST,
+            )
+            channel.publish(_action(1, "x" * 2000))
+            channel.publish(_action(2, "y" * 2000))
+            channel.close()
+            return await _drain(channel), channel.stats()
+
+        events, stats = asyncio.run(scenario())
+        assert [e["step_number"] for e in events] == [1, 2]
+        assert events[0]["observations"] == ""
+        assert events[0]["observations_truncated"] is True
+        assert events[1]["observations"] == "y" * 2000
+        assert stats["shrunk_events"] == 1
+        assert stats["dropped_events"] == 0
+
+    def test_drop_oldest_drops_events_when_stripping_is_not_enough(self):
+        from src.streaming import OverflowPolicy, StepEventChannel
+
+        async def scenario():
+            channel = StepEventChannel(
+                asyncio.get_running_loop(),
+                max_pending_bytes=200,
+                policy=OverflowPolicy.DROP_OLDEST,
+            )
+            for step in range(1, 6):
+                channel.publish(_action(step))
+            channel.close()
+            return await _drain(channel), channel.stats()
+
+        events, stats = asyncio.run(scenario())
+        assert events[-1]["step_number"] == 5
+        assert stats["dropped_events"] == 5 - len(events)
+        assert stats["dropped_events"] > 0
+
+    def test_coalesce_keeps_latest_event_per_step(self):
+        from src.streaming import OverflowPolicy, StepEventChannel
+
+        async def scenario():
+            channel = StepEventChannel(
+                asyncio.get_running_loop(),
+                max_pending_bytes=5000,
+                policy=OverflowPolicy.COALESCE,
+            )
+            channel.publish(_action(1, "a" * 3000))
+            channel.publish(_action(1, "b" * 3000))
+            channel.close()
+            return await _drain(channel), channel.stats()
+
+        events, stats = asyncio.run(scenario())
+        assert len(events) == 1
+        assert events[0]["observations"] == "b" * 3000
+        assert stats["coalesced_events"] == 1
+
+    def test_block_waits_for_consumer(self):
+        from src.streaming import OverflowPolicy, StepEventChannel
+
+        async def scenario():
+            channel = StepEventChannel(
+                asyncio.get_running_loop(),
+                max_pending_bytes=300,
+                policy=OverflowPolicy.BLOCK,
+            )
+
+            def produce():
+                for step in range(1, 11):
+                    channel.publish(_action(step, "z" * 100))
+                channel.close()
+
+            thread = threading.Thread(target=produce)
+            thread.start()
+            events = []
+            async for event in channel:
+                events.append(event)
+                await asyncio.sleep(0.001)
+            thread.join()
+            return events, channel.stats()
+
+        events, stats = asyncio.run(scenario())
+        assert [e["step_number"] for e in events] == list(range(1, 11))
+        assert all(e["observations"] == "z" * 100 for e in events)
+        assert stats["dropped_events"] == 0
+        assert stats["blocked_ms"] > 0
+
+    def test_coalesce_drops_deltas_of_finished_steps(self):
+        from src.streaming import OverflowPolicy, StepEventChannel
+
+        async def scenario():
+            channel = StepEventChannel(
+                asyncio.get_running_loop(),
+                max_pending_bytes=600,
+                policy=OverflowPolicy.COALESCE,
+            )
+            for _ in range(3):
+                channel.publish(
+                    {"type": "delta", "run_number": 1, "step_number": 1, "content": "d" * 100}
+                )
+            channel.publish(_action(1, "o" * 200))
+            channel.close()
+            return await _drain(channel), channel.stats()
+
+        events, stats = asyncio.run(scenario())
+        assert [e["type"] for e in events] == ["action"]
+        assert stats["coalesced_events"] == 3